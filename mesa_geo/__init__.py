@@ -8,7 +8,14 @@ import datetime
 
 from mesa_geo.geoagent import AgentCreator, GeoAgent
 from mesa_geo.geospace import GeoSpace
-from mesa_geo.raster_layers import Cell, ImageLayer, RasterLayer
+from mesa_geo.raster_layers import (
+    Cell,
+    ImageLayer,
+    LightweightCell,
+    RasterLayer,
+    RasterRecorder,
+    RasterValues,
+)
 from mesa_geo.tile_layers import RasterWebTile, WMSWebTile
 
 __all__ = [
@@ -17,7 +24,10 @@ __all__ = [
     "GeoAgent",
     "GeoSpace",
     "ImageLayer",
+    "LightweightCell",
     "RasterLayer",
+    "RasterRecorder",
+    "RasterValues",
     "RasterWebTile",
     "WMSWebTile",
     "visualization",
@@ -5,13 +5,25 @@ Raster Layers
 
 from __future__ import annotations
 
+import collections
+import concurrent.futures
+import contextlib
 import copy
+import functools
 import itertools
+import json
 import math
-from collections.abc import Callable, Iterable, Iterator, Sequence
+import operator
+import os
+import random
+import sys
+import types
+import weakref
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
 from typing import Any, cast, overload
 
 import numpy as np
+import pyproj
 import rasterio as rio
 from affine import Affine
 from mesa import Model
@@ -23,9 +35,17 @@ from rasterio.warp import (
     reproject,
     transform_bounds,
 )
+from rasterio.windows import Window, from_bounds
+from scipy import ndimage, sparse
+from scipy.sparse.csgraph import dijkstra
 
 from mesa_geo.geo_base import GeoBase
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
 
 class RasterBase(GeoBase):
     """
@@ -36,6 +56,13 @@ class RasterBase(GeoBase):
     _height: int
     _transform: Affine
     _total_bounds: np.ndarray  # [min_x, min_y, max_x, max_y]
+    _version: int
+    _reprojection_cache: dict[tuple, tuple[int, RasterBase, int]]
+    _overview_levels: dict[str | None, tuple[tuple[int, ...], str]]
+    _overview_cache: dict[str | None, tuple[int, dict[int, np.ndarray]]]
+    _alignment_cache: weakref.WeakKeyDictionary[
+        RasterBase, tuple[pyproj.CRS | None, pyproj.CRS | None, bool]
+    ]
 
     def __init__(self, width, height, crs, total_bounds):
         """
@@ -48,6 +75,11 @@ class RasterBase(GeoBase):
         """
 
         super().__init__(crs)
+        self._version = 0
+        self._reprojection_cache = {}
+        self._overview_levels = {}
+        self._overview_cache = {}
+        self._alignment_cache = weakref.WeakKeyDictionary()
         self._width = width
         self._height = height
         self._total_bounds = total_bounds
@@ -139,10 +171,128 @@ class RasterBase(GeoBase):
         self._transform = rio.transform.from_bounds(
             *self.total_bounds, width=self.width, height=self.height
         )
+        self._version += 1
 
     def to_crs(self, crs, inplace=False) -> RasterBase | None:
         raise NotImplementedError
 
+    def _reprojection_key(self, crs, resampling: Resampling) -> tuple:
+        return self.crs, rio.crs.CRS.from_user_input(crs), resampling
+
+    def _get_cached_reprojection(self, key: tuple) -> RasterBase | None:
+        """
+        Return the layer cached by `_cache_reprojection` under `key`, or None if there
+        is none, or if this layer or the cached one has been modified since.
+        """
+
+        entry = self._reprojection_cache.get(key)
+        if entry is None:
+            return None
+        version, layer, layer_version = entry
+        if version != self._version or layer._version != layer_version:
+            del self._reprojection_cache[key]
+            return None
+        return layer
+
+    def _cache_reprojection(self, key: tuple, layer: RasterBase) -> None:
+        self._reprojection_cache[key] = (self._version, layer, layer._version)
+
+    def _detach_caches(self) -> None:
+        """
+        Give a shallow copy of a layer caches of its own.
+        """
+
+        self._reprojection_cache = {}
+        self._overview_levels = dict(self._overview_levels)
+        self._overview_cache = {}
+        self._alignment_cache = weakref.WeakKeyDictionary()
+
+    def is_aligned(self, other: RasterBase) -> bool:
+        """
+        Determines whether another raster layer has the same crs, transform, width and
+        height, so that their cells line up one to one.
+
+        The result of comparing the crs of both layers is cached until either changes.
+
+        :param RasterBase other: The raster layer to compare with.
+        :return: True if the layers are aligned, False otherwise.
+        :rtype: bool
+        """
+
+        if other is self:
+            return True
+        if (self.width, self.height) != (other.width, other.height) or (
+            self.transform != other.transform
+        ):
+            return False
+        cached = self._alignment_cache.get(other)
+        if cached is not None and cached[0] is self.crs and cached[1] is other.crs:
+            return cached[2]
+        same_crs = self.crs == other.crs
+        self._alignment_cache[other] = (self.crs, other.crs, same_crs)
+        return same_crs
+
+    def get_overview_transform(self, factor: int) -> Affine:
+        """
+        Return the affine transformation of the overview level decimated by `factor`.
+
+        If the width or height of the layer is not a multiple of `factor`, the last
+        column or row of the overview extends beyond the bounds of the layer.
+
+        :param int factor: The decimation factor of the overview level.
+        :return: Affine transformation of the overview level.
+        :rtype: Affine
+        """
+
+        return self.transform @ Affine.scale(factor)
+
+    def _set_overview_levels(
+        self, key: str | None, factors: Sequence[int], aggregation: str
+    ) -> None:
+        if aggregation not in _OVERVIEW_AGGREGATIONS:
+            raise ValueError(
+                f"Unknown aggregation {aggregation}. "
+                f"Choose from {', '.join(_OVERVIEW_AGGREGATIONS)}."
+            )
+        factors = tuple(sorted(set(factors)))
+        if not factors or factors[0] < 2:
+            raise ValueError("Overview factors must be integers of at least 2.")
+        self._overview_levels[key] = (factors, aggregation)
+        self._overview_cache.pop(key, None)
+
+    def _get_overview_values(
+        self,
+        key: str | None,
+        factor: int,
+        get_values: Callable[[], np.ndarray],
+        nodata: Any = None,
+        tracked: bool = True,
+    ) -> np.ndarray:
+        """
+        Return the overview level of `factor` for `key`, building all levels from the
+        values returned by `get_values` if the layer has been modified since they were
+        last built, or if changes to the layer are not `tracked`.
+        """
+
+        if key not in self._overview_levels:
+            raise ValueError(
+                "No overviews have been built, call `build_overviews` first."
+            )
+        factors, aggregation = self._overview_levels[key]
+        if factor not in factors:
+            raise ValueError(
+                f"No overview of factor {factor}. Choose from {', '.join(map(str, factors))}."
+            )
+        cached = self._overview_cache.get(key)
+        if tracked and cached is not None and cached[0] == self._version:
+            return cached[1][factor]
+        levels = _build_overviews(get_values(), factors, aggregation, nodata)
+        for level in levels.values():
+            level.flags.writeable = False
+        if tracked:
+            self._overview_cache[key] = (self._version, levels)
+        return levels[factor]
+
     def out_of_bounds(self, pos: Coordinate) -> bool:
         """
         Determines whether position is off the grid.
@@ -156,377 +306,3435 @@ class RasterBase(GeoBase):
         return x < 0 or x >= self.width or y < 0 or y >= self.height
 
 
-class Cell(Agent):
+_MISSING = object()
+
+
+class _ArrayAttribute:
     """
-    Cells are containers of raster attributes, and are building blocks of `RasterLayer`.
+    Proxies a raster attribute of cells bound to an array-backed `RasterLayer` to
+    the corresponding attribute array of the layer.
+
+    It is installed on the cell class of an array-backed layer for each of its
+    attributes by `_proxy_attribute`, so that the cells keep their class, and other
+    attributes, as well as cells of layers in object mode, are accessed as usual.
+    Cells that are not bound to a layer, or whose layer does not have the attribute,
+    store it on the instance.
+    """
+
+    __slots__ = ("_default", "_name")
+
+    def __init__(self, name: str, default: Any = _MISSING):
+        self._name = name
+        # a class attribute of the same name, which it replaces
+        self._default = default
+
+    def _missing(self, cell: Any) -> AttributeError:
+        return AttributeError(
+            f"'{type(cell).__name__}' object has no attribute '{self._name}'"
+        )
+
+    def __get__(self, cell: Any, owner: type | None = None) -> Any:
+        if cell is None:
+            return self if self._default is _MISSING else self._default
+        layer = getattr(cell, "_layer", None)
+        if layer is not None:
+            array = layer._attribute_arrays.get(self._name)
+            if array is not None:
+                return array[cell.indices]
+        try:
+            return cell.__dict__[self._name]
+        except (AttributeError, KeyError):
+            if self._default is not _MISSING:
+                return self._default
+            raise self._missing(cell) from None
+
+    def __set__(self, cell: Any, value: Any) -> None:
+        layer = getattr(cell, "_layer", None)
+        if layer is not None:
+            array = layer._attribute_arrays.get(self._name)
+            if array is not None:
+                array[cell.indices] = value
+                layer._version += 1
+                if layer._change_tiles:
+                    row, col = cell.indices
+                    layer._mark_changed(self._name, (row, row, col, col))
+                return
+        try:
+            cell.__dict__[self._name] = value
+        except AttributeError:
+            raise self._missing(cell) from None
+
+    def __delete__(self, cell: Any) -> None:
+        try:
+            del cell.__dict__[self._name]
+        except (AttributeError, KeyError):
+            raise self._missing(cell) from None
+
+
+def _proxy_attribute(cell_cls: type, name: str) -> None:
+    """
+    Install an `_ArrayAttribute` for a raster attribute on a cell class, unless the
+    class already has one.
+    """
+
+    for klass in cell_cls.__mro__:
+        if name in vars(klass):
+            existing = vars(klass)[name]
+            if isinstance(existing, _ArrayAttribute):
+                return
+            break
+    else:
+        existing = _MISSING
+    setattr(cell_cls, name, _ArrayAttribute(name, existing))
+
+
+def _default_attr_name(cell_cls: type) -> str:
+    """
+    Return the name of an attribute added without a name.
+    """
+
+    # proxies installed by array-backed layers are not counted, so that the name does
+    # not change as attributes are added
+    count = sum(
+        not isinstance(value, _ArrayAttribute) for value in vars(cell_cls).values()
+    )
+    return f"attribute_{count}"
+
+
+def _discard_instance_attribute(cell: Cell, name: str) -> None:
+    """
+    Remove an attribute stored on the cell instance itself, if there is one.
     """
 
+    with contextlib.suppress(AttributeError):
+        object.__delattr__(cell, name)
+
+
+class LightweightCell:
+    """
+    A cell that is not a Mesa agent.
+
+    Unlike `Cell`, it is not registered with the model, has no `unique_id`, and uses
+    `__slots__` instead of an instance dictionary, which saves memory for large rasters.
+    It can be used as the `cell_cls` of a `RasterLayer`, and works with its neighborhood
+    and iteration methods.
+
+    Since it has no instance dictionary, raster attributes can only be stored on it
+    in an array-backed `RasterLayer`. Subclasses that do not define `__slots__` can
+    store attributes of their own as usual.
+    """
+
+    __slots__ = ("_layer", "indices", "model", "pos")
+
+    model: Model
     pos: Coordinate | None
     indices: Coordinate | None
 
     def __init__(self, model, pos=None, indices=None):
         """
-        Initialize a cell.
+        Initialize a lightweight cell.
 
+        :param model: The model that the cell belongs to.
         :param pos: Position of the cell in (x, y) format.
             Origin is at lower left corner of the grid
         :param indices: Indices of the cell in (row, col) format.
             Origin is at upper left corner of the grid
         """
 
-        super().__init__(model)
+        self.model = model
         self.pos = pos
         self.indices = indices
+        self._layer = None
+
+    @property
+    def random(self) -> random.Random:
+        """
+        Return the random number generator of the model.
+        """
+
+        return self.model.random
 
     def step(self):
         pass
 
 
-class RasterLayer(RasterBase):
+@functools.cache
+def _neighborhood_offsets(
+    moore: bool, include_center: bool, radius: int
+) -> tuple[Coordinate, ...]:
     """
-    Some methods in `RasterLayer` are copied from `mesa.space.Grid`, including:
+    Return the (dx, dy) offsets of a neighborhood, as used by `RasterLayer.get_neighborhood`.
 
-    __getitem__
-    __iter__
-    coord_iter
-    iter_neighborhood
-    get_neighborhood
-    iter_neighbors
-    get_neighbors  # copied and renamed to `get_neighboring_cells`
-    out_of_bounds  # copied into `RasterBase`
-    iter_cell_list_contents
-    get_cell_list_contents
+    The offsets are sorted, so that the neighboring positions of any cell are sorted too.
+    """
 
-    Methods from `mesa.space.Grid` that are not copied over:
+    offsets = []
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            if dx == 0 and dy == 0 and not include_center:
+                continue
+            # Skip coordinates that are outside manhattan distance
+            if not moore and abs(dx) + abs(dy) > radius:
+                continue
+            offsets.append((dx, dy))
+    return tuple(sorted(offsets))
 
-    torus_adj
-    neighbor_iter
-    move_agent
-    place_agent
-    _place_agent
-    remove_agent
-    is_cell_empty
-    move_to_empty
-    find_empty
-    exists_empty_cells
 
-    Another difference is that `mesa.space.Grid` has `self.grid: List[List[Agent | None]]`,
-    whereas it is `self.cells: List[List[Cell]]` here in `RasterLayer`.
+def _spare_nodata(values: np.ndarray) -> Any:
+    """
+    Return a value to mark cells without data in an attribute that has no nodata value:
+    nan for floating-point values, and the smallest or largest value of integer values
+    that does not occur in them. Return None if there is no such value, e.g., for
+    booleans.
     """
 
-    cells: list[list[Cell]]
-    _neighborhood_cache: dict[Any, list[Coordinate]]
-    _attributes: set[str]
+    if values.dtype.kind in "fc":
+        return math.nan
+    if values.dtype.kind in "iu":
+        info = np.iinfo(values.dtype)
+        candidates = (info.min, info.max) if values.dtype.kind == "i" else (info.max,)
+        for candidate in candidates:
+            if not (values == candidate).any():
+                return int(candidate)
+    return None
 
-    def __init__(
-        self, width, height, crs, total_bounds, model, cell_cls: type[Cell] = Cell
-    ):
-        super().__init__(width, height, crs, total_bounds)
-        self.model = model
-        self.cell_cls = cell_cls
-        self._initialize_cells(model, cell_cls)
-        self._attributes = set()
-        self._neighborhood_cache = {}
 
-    def _initialize_cells(self, model: Model, cell_cls: type[Cell]):
-        self.cells = []
-        for x in range(self.width):
-            col: list[cell_cls] = []
-            for y in range(self.height):
-                row_idx, col_idx = self.height - y - 1, x
-                col.append(self.cell_cls(model, pos=(x, y), indices=(row_idx, col_idx)))
-            self.cells.append(col)
+def _focal_identity(op: str, dtype: np.dtype) -> Any:
+    """
+    Return the value that does not change the result of a focal min or max.
+    """
 
-    @property
-    def attributes(self) -> set[str]:
-        """
-        Return the attributes of the cells in the raster layer.
+    if dtype == np.bool_:
+        return op == "min"
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return info.max if op == "min" else info.min
+    return np.inf if op == "min" else -np.inf
 
-        :return: Attributes of the cells in the raster layer.
-        :rtype: Set[str]
-        """
-        return self._attributes
 
-    @overload
-    def __getitem__(self, index: int) -> list[Cell]: ...
+_OVERVIEW_AGGREGATIONS = ("mean", "sum", "min", "max", "nearest")
 
-    @overload
-    def __getitem__(
-        self, index: tuple[int | slice, int | slice]
-    ) -> Cell | list[Cell]: ...
 
-    @overload
-    def __getitem__(self, index: Sequence[Coordinate]) -> list[Cell]: ...
+def _reduce_blocks(
+    values: np.ndarray, factor: int, ufunc: np.ufunc, dtype: Any = None
+) -> np.ndarray:
+    """
+    Reduce blocks of `factor` x `factor` cells along the last two axes of `values`
+    with `ufunc`. Blocks at the bottom and right edges may be partial.
+    """
 
-    def __getitem__(
-        self, index: int | Sequence[Coordinate] | tuple[int | slice, int | slice]
-    ) -> Cell | list[Cell]:
-        """
-        Access contents from the grid.
-        """
+    rows = np.arange(0, values.shape[-2], factor)
+    cols = np.arange(0, values.shape[-1], factor)
+    values = ufunc.reduceat(values, rows, axis=-2, dtype=dtype)
+    return ufunc.reduceat(values, cols, axis=-1, dtype=dtype)
 
-        if isinstance(index, int):
-            # cells[x]
-            return self.cells[index]
 
-        if isinstance(index[0], tuple):
-            # cells[(x1, y1), (x2, y2)]
-            index = cast(Sequence[Coordinate], index)
+def _is_nodata(values: np.ndarray, nodata: Any) -> np.ndarray | None:
+    """
+    Return a boolean array that is True where `values` hold `nodata`, which may be
+    nan, or None if `nodata` is None.
+    """
 
-            cells = []
-            for pos in index:
-                x1, y1 = pos
-                cells.append(self.cells[x1][y1])
-            return cells
+    if nodata is None:
+        return None
+    if isinstance(nodata, float) and math.isnan(nodata):
+        return np.isnan(values)
+    return values == nodata
 
-        x, y = index
 
-        if isinstance(x, int) and isinstance(y, int):
-            # cells[x, y]
-            x, y = cast(Coordinate, index)
-            return self.cells[x][y]
+def _build_overviews(
+    values: np.ndarray,
+    factors: Sequence[int],
+    aggregation: str,
+    nodata: Any = None,
+) -> dict[int, np.ndarray]:
+    """
+    Build the overview levels of `values`, an array whose last two axes are rows and
+    columns, for ascending decimation `factors`.
 
-        if isinstance(x, int):
-            # cells[x, :]
-            x = slice(x, x + 1)
+    Each level is reduced from the finest level built before whose factor divides its
+    own, rather than from `values`. Cells holding `nodata` are left out of the
+    aggregation, and blocks without any other value are set to `nodata`.
+    """
 
-        if isinstance(y, int):
-            # grid[:, y]
-            y = slice(y, y + 1)
+    if aggregation == "nearest":
+        # the top-left cell of each block
+        return {factor: values[..., ::factor, ::factor].copy() for factor in factors}
 
-        # cells[:, :]
-        x, y = (cast(slice, x), cast(slice, y))
-        cells = []
-        for rows in self.cells[x]:
-            for cell in rows[y]:
-                cells.append(cell)
-        return cells
+    if aggregation in ("sum", "mean"):
+        ufunc = np.add
+        is_exact = np.issubdtype(values.dtype, np.integer) or values.dtype == np.bool_
+        dtype = np.result_type(values.dtype, np.int64) if is_exact else values.dtype
+        fill_value = 0
+    else:
+        ufunc = np.minimum if aggregation == "min" else np.maximum
+        dtype = values.dtype
+        fill_value = _focal_identity(aggregation, dtype)
+    is_nodata = _is_nodata(values, nodata)
+    valid = None if is_nodata is None else ~is_nodata
+    if valid is not None:
+        values = np.where(valid, values, fill_value)
+    if aggregation == "mean" or valid is not None:
+        counts = np.ones(values.shape, dtype=np.int64) if valid is None else valid
+    else:
+        counts = None
 
-    def __iter__(self) -> Iterator[Cell]:
-        """
-        Create an iterator that chains the rows of the cells together
-        as if it is one list
-        """
+    # the aggregated values and counts of valid cells of each level
+    states = {1: (values, counts)}
+    levels = {}
+    for factor in factors:
+        base = max(f for f in states if factor % f == 0)
+        base_values, base_counts = states[base]
+        step = factor // base
+        level_values = _reduce_blocks(base_values, step, ufunc, dtype=dtype)
+        level_counts = (
+            None
+            if base_counts is None
+            else _reduce_blocks(base_counts, step, np.add, dtype=np.int64)
+        )
+        states[factor] = (level_values, level_counts)
 
-        return itertools.chain(*self.cells)
+        if aggregation == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                level_values = level_values / level_counts
+        if level_counts is not None and nodata is not None:
+            level_values = np.where(level_counts > 0, level_values, nodata)
+        levels[factor] = level_values
+    return levels
 
-    def coord_iter(self) -> Iterator[tuple[Cell, int, int]]:
-        """
-        An iterator that returns coordinates as well as cell contents.
-        """
 
-        for row in range(self.width):
-            for col in range(self.height):
-                yield self.cells[row][col], row, col  # cell, x, y
+def _block_mode(values: np.ndarray, factor: int, nodata: Any = None) -> np.ndarray:
+    """
+    Return the most frequent value of each block of `factor` x `factor` cells of a
+    2D array, the smallest one in case of a tie. Blocks at the bottom and right edges
+    may be partial. Cells holding `nodata` are left out, and blocks without any other
+    value are set to `nodata`.
+    """
 
-    def apply_raster(self, data: np.ndarray, attr_name: str | None = None) -> None:
-        """
-        Apply raster data to the cells.
+    height, width = values.shape
+    out_height, out_width = -(-height // factor), -(-width // factor)
+    is_nodata = _is_nodata(values, nodata)
+    valid = np.ones(values.shape, dtype=np.bool_) if is_nodata is None else ~is_nodata
+    padded = np.zeros((out_height * factor, out_width * factor), dtype=values.dtype)
+    padded[:height, :width] = values
+    padded_valid = np.zeros(padded.shape, dtype=np.bool_)
+    padded_valid[:height, :width] = valid
 
-        :param np.ndarray data: 2D numpy array with shape (1, height, width).
-        :param str | None attr_name: Name of the attribute to be added to the cells.
-            If None, a random name will be generated. Default is None.
-        :raises ValueError: If the shape of the data is not (1, height, width).
-        """
+    def blocks(array):
+        return (
+            array.reshape(out_height, factor, out_width, factor)
+            .swapaxes(1, 2)
+            .reshape(out_height, out_width, factor * factor)
+        )
 
-        if data.shape != (1, self.height, self.width):
-            raise ValueError(
-                f"Data shape does not match raster shape. "
-                f"Expected {(1, self.height, self.width)}, received {data.shape}."
-            )
-        if attr_name is None:
-            attr_name = f"attribute_{len(self.cell_cls.__dict__)}"
-        self._attributes.add(attr_name)
-        for x in range(self.width):
-            for y in range(self.height):
-                setattr(self.cells[x][y], attr_name, data[0, self.height - y - 1, x])
+    order = np.argsort(blocks(padded), axis=-1, kind="stable")
+    block_values = np.take_along_axis(blocks(padded), order, axis=-1)
+    block_valid = np.take_along_axis(blocks(padded_valid), order, axis=-1)
+    # count the valid cells of each run of equal values, up to and including each cell
+    is_start = np.ones(block_values.shape, dtype=np.bool_)
+    is_start[..., 1:] = block_values[..., 1:] != block_values[..., :-1]
+    starts = np.maximum.accumulate(
+        np.where(is_start, np.arange(factor * factor), 0), axis=-1
+    )
+    valid_counts = np.cumsum(block_valid, axis=-1)
+    counts = valid_counts - np.take_along_axis(
+        valid_counts - block_valid, starts, axis=-1
+    )
+    best = counts.argmax(axis=-1)[..., np.newaxis]
+    modes = np.take_along_axis(block_values, best, axis=-1)[..., 0]
+    if nodata is not None:
+        modes = np.where(counts.max(axis=-1) > 0, modes, nodata).astype(
+            values.dtype, copy=False
+        )
+    return modes
 
-    def get_raster(self, attr_name: str | None = None) -> np.ndarray:
-        """
-        Return the values of given attribute.
 
-        :param str | None attr_name: Name of the attribute to be returned. If None,
-            returns all attributes. Default is None.
-        :return: The values of given attribute as a 2D numpy array with shape (1, height, width).
-        :rtype: np.ndarray
-        """
+def _steepest_descent(
+    surface: np.ndarray,
+    resolution: tuple[float, float],
+    rows: np.ndarray | None = None,
+    cols: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Return the flat index of the D8 neighbor with the steepest descent from each of
+    the cells at `rows` and `cols` of `surface`, or from all cells if they are None,
+    or -1 if no neighbor is lower.
 
-        if attr_name is not None and attr_name not in self.attributes:
-            raise ValueError(
-                f"Attribute {attr_name} does not exist. "
-                f"Choose from {self.attributes}, or set `attr_name` to `None` to retrieve all."
-            )
-        if attr_name is None:
-            num_bands = len(self.attributes)
-            attr_names = self.attributes
+    Cells holding nan neither flow nor receive flow. Ties go to the neighbor that
+    comes first in the order of `get_neighborhood`.
+    """
+
+    height, width = surface.shape
+    if rows is None:
+        padded = np.pad(surface, 1, constant_values=np.nan)
+        center = surface
+        flat = np.arange(surface.size).reshape(surface.shape)
+    else:
+        center = surface[rows, cols]
+        flat = rows * width + cols
+    directions = np.full(center.shape, -1, dtype=np.int64)
+    steepest = np.zeros(center.shape)
+    for dx, dy in _neighborhood_offsets(True, False, 1):
+        if rows is None:
+            neighbor = padded[1 - dy : 1 - dy + height, 1 + dx : 1 + dx + width]
         else:
-            num_bands = 1
-            attr_names = {attr_name}
-        data = np.empty((num_bands, self.height, self.width))
-        for ind, name in enumerate(attr_names):
-            for x in range(self.width):
-                for y in range(self.height):
-                    data[ind, self.height - y - 1, x] = getattr(self.cells[x][y], name)
-        return data
+            neighbor_rows, neighbor_cols = rows - dy, cols + dx
+            inside = (
+                (neighbor_rows >= 0)
+                & (neighbor_rows < height)
+                & (neighbor_cols >= 0)
+                & (neighbor_cols < width)
+            )
+            neighbor = np.full(center.shape, np.nan)
+            neighbor[inside] = surface[neighbor_rows[inside], neighbor_cols[inside]]
+        with np.errstate(invalid="ignore"):
+            slope = (center - neighbor) / math.hypot(
+                dx * resolution[0], dy * resolution[1]
+            )
+            steeper = slope > steepest
+        steepest[steeper] = slope[steeper]
+        directions[steeper] = flat[steeper] + (dx - dy * width)
+    return directions
 
-    def iter_neighborhood(
-        self,
-        pos: Coordinate,
-        moore: bool,
-        include_center: bool = False,
-        radius: int = 1,
-    ) -> Iterator[Coordinate]:
-        """
-        Return an iterator over cell coordinates that are in the
-        neighborhood of a certain point.
 
-        :param Coordinate pos: Coordinate tuple for the neighborhood to get.
-        :param bool moore: Whether to use Moore neighborhood or not. If True,
-            return Moore neighborhood (including diagonals). If False, return
-            Von Neumann neighborhood (exclude diagonals).
-        :param bool include_center: If True, return the (x, y) cell as well.
-            Otherwise, return surrounding cells only. Default is False.
-        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
-        :return: An iterator over cell coordinates that are in the neighborhood.
-            For example with radius 1, it will return list with number of elements
-            equals at most 9 (8) if Moore, 5 (4) if Von Neumann (if not including
-            the center).
-        :rtype: Iterator[Coordinate]
-        """
+def _flow_accumulation(directions: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Accumulate `weights` along the flat flow `directions`, which must not contain
+    cycles, visiting the cells in topological order one front at a time.
+    """
+
+    accumulation = weights.astype(np.float64)
+    has_outlet = directions >= 0
+    inflows = np.bincount(directions[has_outlet], minlength=directions.size)
+    front = np.flatnonzero(inflows == 0)
+    while front.size:
+        front = front[has_outlet[front]]
+        downstream = directions[front]
+        np.add.at(accumulation, downstream, accumulation[front])
+        np.subtract.at(inflows, downstream, 1)
+        downstream = np.unique(downstream)
+        front = downstream[inflows[downstream] == 0]
+    return accumulation
+
+
+_CELL_LOOP_CACHE_SIZE = 32
+_compiled_cell_loops: collections.OrderedDict[Any, Callable] = collections.OrderedDict()
+
+
+def _cell_loop_key(fn: Callable) -> Any:
+    """
+    Return the key under which the compiled loop of `fn` is cached, or None if it
+    cannot be cached.
+
+    Functions defined anew on each call of, e.g., a `step` method share their code,
+    so they are keyed on it, together with the values they close over, which Numba
+    compiles as constants, rather than on the function object itself.
+    """
+
+    if not isinstance(fn, types.FunctionType):
+        # e.g., a function compiled with Numba already
+        key = (fn,)
+    else:
+        closure = tuple(
+            (type(cell.cell_contents), cell.cell_contents)
+            for cell in fn.__closure__ or ()
+        )
+        key = (fn.__code__, id(fn.__globals__), fn.__defaults__, closure)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _compile_cell_loop(fn: Callable, jit: bool) -> Callable:
+    """
+    Return a function that calls `fn(row, col, neighbors, inputs, outputs)` for every
+    cell of the `outputs`, compiled with Numba and run in parallel across rows if
+    `jit` is True and Numba is installed, or in pure Python otherwise.
+
+    The compiled loops of the last `_CELL_LOOP_CACHE_SIZE` functions are cached.
+    """
+
+    if not jit or numba is None:
+
+        def loop(neighbors, inputs, outputs):
+            height, width = outputs[0].shape
+            for row in range(height):
+                for col in range(width):
+                    fn(row, col, neighbors, inputs, outputs)
+
+        return loop
+
+    key = _cell_loop_key(fn)
+    compiled_loop = _compiled_cell_loops.get(key) if key is not None else None
+    if compiled_loop is not None:
+        _compiled_cell_loops.move_to_end(key)
+        return compiled_loop
+
+    cell_fn = fn if isinstance(fn, numba.core.dispatcher.Dispatcher) else numba.njit(fn)
+
+    @numba.njit(parallel=True)
+    def compiled_loop(neighbors, inputs, outputs):
+        height, width = outputs[0].shape
+        for row in numba.prange(height):
+            for col in range(width):
+                cell_fn(row, col, neighbors, inputs, outputs)
+
+    if key is not None:
+        _compiled_cell_loops[key] = compiled_loop
+        if len(_compiled_cell_loops) > _CELL_LOOP_CACHE_SIZE:
+            _compiled_cell_loops.popitem(last=False)
+    return compiled_loop
+
+
+def _to_rgba(colors: Any) -> np.ndarray:
+    """
+    Convert colors along the last axis of an array, either RGB or RGBA, to uint8 RGBA.
+    Floating-point colors are taken to be in [0, 1], as in matplotlib, and integer
+    colors in [0, 255].
+    """
+
+    colors = np.asarray(colors)
+    if colors.ndim == 0 or colors.shape[-1] not in (3, 4):
+        raise ValueError(
+            f"Colors must be RGB or RGBA along the last axis, received {colors.shape}."
+        )
+    if np.issubdtype(colors.dtype, np.floating):
+        colors = np.rint(np.nan_to_num(np.clip(colors, 0, 1)) * 255)
+    elif colors.dtype != np.uint8:
+        colors = np.clip(colors, 0, 255)
+    colors = colors.astype(np.uint8, copy=False)
+    if colors.shape[-1] == 3:
+        alpha = np.full((*colors.shape[:-1], 1), 255, dtype=np.uint8)
+        colors = np.concatenate([colors, alpha], axis=-1)
+    return colors
+
+
+def _is_matplotlib_colormap(colormap: Any) -> bool:
+    # a colormap instance can only exist if matplotlib has been imported already
+    colors = sys.modules.get("matplotlib.colors")
+    return colors is not None and isinstance(colormap, colors.Colormap)
+
+
+def _apply_colormap(
+    values: np.ndarray,
+    colormap: Callable | Mapping[Any, Any] | np.ndarray,
+    nodata: Any = None,
+    norm: Callable | None = None,
+) -> np.ndarray:
+    """
+    Color a 2D array of values with a vectorized colormap, see `RasterLayer.to_image`,
+    returning uint8 RGBA colors with shape (height, width, 4). Cells holding `nodata`
+    are transparent.
+    """
+
+    is_nodata = _is_nodata(values, nodata)
+    valid = None if is_nodata is None else ~is_nodata
+
+    if isinstance(colormap, Mapping):
+        keys = np.array(list(colormap.keys()))
+        order = np.argsort(keys)
+        keys = keys[order]
+        table = np.stack([_to_rgba(colormap[key]) for key in keys.tolist()])
+        indices = np.searchsorted(keys, values).clip(0, len(keys) - 1)
+        found = keys[indices] == values
+        valid = found if valid is None else valid & found
+        rgba = table[indices]
+    elif isinstance(colormap, np.ndarray):
+        table = _to_rgba(colormap)
+        if not np.issubdtype(values.dtype, np.integer):
+            raise ValueError("A lookup table can only color integer values.")
+        found = (values >= 0) & (values < len(table))
+        valid = found if valid is None else valid & found
+        rgba = table[np.where(found, values, 0)]
+    elif _is_matplotlib_colormap(colormap):
+        if norm is None:
+            valid_values = values if valid is None else values[valid]
+            vmin = valid_values.min() if valid_values.size else 0
+            vmax = valid_values.max() if valid_values.size else 0
+            scale = 1 / (vmax - vmin) if vmax > vmin else 0
+            normalized = (values - vmin) * scale
+        else:
+            normalized = norm(values)
+        rgba = colormap(np.ma.getdata(normalized), bytes=True)
+    else:
+        rgba = _to_rgba(colormap(values))
+    if rgba.shape != (*values.shape, 4):
+        raise ValueError(
+            f"Colormap shape does not match raster shape. "
+            f"Expected {(*values.shape, 4)}, received {rgba.shape}."
+        )
+    if valid is not None:
+        rgba = np.where(valid[..., np.newaxis], rgba, np.uint8(0))
+    return rgba
+
+
+def _write_bands(
+    raster_file: str,
+    profile: dict[str, Any],
+    descriptions: Sequence[str],
+    bands: Sequence[np.ndarray],
+) -> None:
+    """
+    Write bands with shape (height, width) to a new raster file, one at a time.
+    """
+
+    with rio.open(raster_file, "w", **profile) as dataset:
+        for index, (description, band) in enumerate(zip(descriptions, bands), 1):
+            dataset.write(band.astype(profile["dtype"], copy=False), index)
+            dataset.set_band_description(index, description)
+
+
+def _write_windows(
+    raster_file: str, blocks: Sequence[tuple[Window, np.ndarray]]
+) -> None:
+    """
+    Write windows of all bands, each with shape (count, height, width), into an
+    existing raster file.
+    """
+
+    with rio.open(raster_file, "r+") as dataset:
+        for window, values in blocks:
+            dataset.write(values.astype(dataset.dtypes[0], copy=False), window=window)
+
+
+@functools.cache
+def _background_writer() -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Return the single thread that writes raster files in the background, created
+    on first use. Using one thread keeps the writes in the order they were requested.
+    """
+
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="mesa_geo_raster_writer"
+    )
+
+
+_CELL_ATTRIBUTES = frozenset({"model", "unique_id", "pos", "indices", "_layer"})
+
+
+def _has_own_state(cell: Cell) -> bool:
+    """
+    Return whether a cell of an array-backed layer stores attributes of its own,
+    besides those set by `Cell.__init__`.
+    """
+
+    return not _CELL_ATTRIBUTES.issuperset(getattr(cell, "__dict__", ()))
+
+
+class Cell(Agent):
+    """
+    Cells are containers of raster attributes, and are building blocks of `RasterLayer`.
+
+    If the cell belongs to an array-backed `RasterLayer`, its raster attributes are
+    not stored on the cell itself. Reading or writing such an attribute is proxied
+    to the corresponding attribute array of the layer.
+    """
+
+    pos: Coordinate | None
+    indices: Coordinate | None
+
+    def __init__(self, model, pos=None, indices=None):
+        """
+        Initialize a cell.
+
+        :param pos: Position of the cell in (x, y) format.
+            Origin is at lower left corner of the grid
+        :param indices: Indices of the cell in (row, col) format.
+            Origin is at upper left corner of the grid
+        """
+
+        super().__init__(model)
+        self.pos = pos
+        self.indices = indices
+
+    def step(self):
+        pass
+
+
+def _dataset_window(
+    dataset: rio.io.DatasetReader,
+    bounds: Sequence[float] | None = None,
+    decimation: int = 1,
+) -> tuple[Window, int, int, Affine]:
+    """
+    Return the window of a dataset to read, together with the height, width and
+    affine transformation of the (possibly decimated) raster read from it.
+
+    :param dataset: The opened dataset.
+    :param bounds: Bounds of the area to read in [min_x, min_y, max_x, max_y] format,
+        in the CRS of the dataset. If None, the whole dataset is read.
+    :param int decimation: Only every `decimation`-th row and column is read.
+    :raises ValueError: If the window is empty, e.g., if the bounds do not overlap the
+        dataset, or the decimation is not positive.
+    """
+
+    if decimation < 1:
+        raise ValueError(
+            f"Decimation must be a positive integer, received {decimation}."
+        )
+    window = Window(0, 0, dataset.width, dataset.height)
+    if bounds is not None:
+        bounds_window = from_bounds(*bounds, transform=dataset.transform)
+        # cover all pixels the bounds overlap, allowing for floating-point error
+        col_off = math.floor(bounds_window.col_off + 1e-6)
+        row_off = math.floor(bounds_window.row_off + 1e-6)
+        col_end = math.ceil(bounds_window.col_off + bounds_window.width - 1e-6)
+        row_end = math.ceil(bounds_window.row_off + bounds_window.height - 1e-6)
+        try:
+            window = Window(
+                col_off, row_off, col_end - col_off, row_end - row_off
+            ).intersection(window)
+        except rio.errors.WindowError as error:
+            raise ValueError(
+                "The area to read does not overlap the raster file."
+            ) from error
+    height, width = int(window.height) // decimation, int(window.width) // decimation
+    if height == 0 or width == 0:
+        raise ValueError("The area to read does not contain any cells.")
+    # drop the remainder, so that each cell covers exactly decimation x decimation pixels
+    window = Window(
+        window.col_off, window.row_off, width * decimation, height * decimation
+    )
+    transform = rio.windows.transform(window, dataset.transform) @ Affine.scale(
+        decimation
+    )
+    return window, height, width, transform
+
+
+class _OutOfCoreArray:
+    """
+    A 2D array holding one band of a raster file, whose blocks are only read from
+    the file when they are first accessed.
+
+    It supports the indexing used by array-backed layers, i.e., single elements, slices,
+    integer arrays and boolean masks, and is converted to a numpy array, which reads all
+    remaining blocks, when used in other numpy operations. Values written to it are kept
+    in memory and are not written back to the file.
+    """
+
+    ndim = 2
+
+    def __init__(
+        self,
+        raster_file: str,
+        band: int,
+        window: Window,
+        shape: tuple[int, int],
+        decimation: int = 1,
+        rio_opener: Callable | None = None,
+    ):
+        self._raster_file = raster_file
+        self._rio_opener = rio_opener
+        self._band = band
+        self._window = window
+        self._decimation = decimation
+        self.shape = shape
+        self._dataset = None
+        dataset = self._open()
+        self.dtype = np.dtype(dataset.dtypes[band - 1])
+        block_height, block_width = dataset.block_shapes[band - 1]
+        self._block_shape = (
+            max(1, block_height // decimation),
+            max(1, block_width // decimation),
+        )
+        self._blocks: dict[tuple[int, int], np.ndarray] = {}
+
+    @property
+    def size(self) -> int:
+        return self.shape[0] * self.shape[1]
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_dataset"] = None
+        return state
+
+    def _open(self) -> rio.io.DatasetReader:
+        if self._dataset is None or self._dataset.closed:
+            self._dataset = rio.open(self._raster_file, "r", opener=self._rio_opener)
+        return self._dataset
+
+    def _block(self, block_row: int, block_col: int) -> np.ndarray:
+        block = self._blocks.get((block_row, block_col))
+        if block is None:
+            block_height, block_width = self._block_shape
+            row_start, col_start = block_row * block_height, block_col * block_width
+            row_stop = min(row_start + block_height, self.shape[0])
+            col_stop = min(col_start + block_width, self.shape[1])
+            decimation = self._decimation
+            window = Window(
+                self._window.col_off + col_start * decimation,
+                self._window.row_off + row_start * decimation,
+                (col_stop - col_start) * decimation,
+                (row_stop - row_start) * decimation,
+            )
+            block = self._open().read(
+                self._band,
+                window=window,
+                out_shape=(row_stop - row_start, col_stop - col_start),
+            )
+            self._blocks[(block_row, block_col)] = block
+        return block
+
+    def _iter_region(
+        self, rows: range, cols: range
+    ) -> Iterator[tuple[np.ndarray, slice, slice, slice, slice]]:
+        """
+        Yield the blocks overlapping a region of consecutive rows and columns, with the
+        slices of the overlap in block and in region coordinates.
+        """
+
+        block_height, block_width = self._block_shape
+        if len(rows) == 0 or len(cols) == 0:
+            return
+        for block_row in range(rows[0] // block_height, rows[-1] // block_height + 1):
+            row_start = max(rows[0], block_row * block_height)
+            row_stop = min(rows[-1] + 1, (block_row + 1) * block_height)
+            for block_col in range(cols[0] // block_width, cols[-1] // block_width + 1):
+                col_start = max(cols[0], block_col * block_width)
+                col_stop = min(cols[-1] + 1, (block_col + 1) * block_width)
+                yield (
+                    self._block(block_row, block_col),
+                    slice(
+                        row_start - block_row * block_height,
+                        row_stop - block_row * block_height,
+                    ),
+                    slice(
+                        col_start - block_col * block_width,
+                        col_stop - block_col * block_width,
+                    ),
+                    slice(row_start - rows[0], row_stop - rows[0]),
+                    slice(col_start - cols[0], col_stop - cols[0]),
+                )
+
+    def _basic_index(self, key: Any) -> tuple[range | int, range | int] | None:
+        """
+        Return the rows and columns selected by a key made of integers and slices
+        with unit steps, or None for any other key.
+        """
+
+        if key is Ellipsis:
+            key = (slice(None), slice(None))
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            return None
+        index = []
+        for k, size in zip(key, self.shape):
+            if isinstance(k, int | np.integer) or (
+                isinstance(k, slice) and k.step in (None, 1)
+            ):
+                index.append(range(size)[k])
+            else:
+                return None
+        return index[0], index[1]
+
+    def _fancy_index(self, key: Any) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Return the rows and columns selected by a pair of integer arrays or by a boolean
+        mask, or None for any other key.
+        """
+
+        if isinstance(key, np.ndarray) and key.dtype == np.bool_:
+            return np.nonzero(key)
+        if isinstance(key, tuple) and len(key) == 2:
+            rows, cols = np.asarray(key[0]), np.asarray(key[1])
+            if np.issubdtype(rows.dtype, np.integer) and np.issubdtype(
+                cols.dtype, np.integer
+            ):
+                rows, cols = np.broadcast_arrays(rows, cols)
+                return self._wrap_indices(rows, 0), self._wrap_indices(cols, 1)
+        return None
+
+    def _wrap_indices(self, indices: np.ndarray, axis: int) -> np.ndarray:
+        """
+        Wrap negative indices along an axis around, as numpy does.
+
+        :raises IndexError: If an index is out of bounds.
+        """
+
+        size = self.shape[axis]
+        out_of_bounds = (indices < -size) | (indices >= size)
+        if out_of_bounds.any():
+            raise IndexError(
+                f"index {indices[out_of_bounds].flat[0]} is out of bounds "
+                f"for axis {axis} with size {size}"
+            )
+        return np.where(indices < 0, indices + size, indices)
+
+    def _iter_fancy(
+        self, rows: np.ndarray, cols: np.ndarray
+    ) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Yield the blocks containing the given elements, with a mask of the elements in
+        each block and their rows and columns within the block.
+        """
+
+        block_height, block_width = self._block_shape
+        block_rows, block_cols = rows // block_height, cols // block_width
+        block_ids = block_rows * (self.shape[1] // block_width + 1) + block_cols
+        for block_id in np.unique(block_ids):
+            mask = block_ids == block_id
+            block_row, block_col = divmod(
+                int(block_id), self.shape[1] // block_width + 1
+            )
+            yield (
+                self._block(block_row, block_col),
+                mask,
+                rows[mask] - block_row * block_height,
+                cols[mask] - block_col * block_width,
+            )
+
+    def __getitem__(self, key: Any) -> Any:
+        index = self._basic_index(key)
+        if index is not None:
+            rows, cols = index
+            if isinstance(rows, int) and isinstance(cols, int):
+                block_height, block_width = self._block_shape
+                block = self._block(rows // block_height, cols // block_width)
+                return block[rows % block_height, cols % block_width]
+            row_range = range(rows, rows + 1) if isinstance(rows, int) else rows
+            col_range = range(cols, cols + 1) if isinstance(cols, int) else cols
+            region = np.empty((len(row_range), len(col_range)), dtype=self.dtype)
+            for block, block_r, block_c, region_r, region_c in self._iter_region(
+                row_range, col_range
+            ):
+                region[region_r, region_c] = block[block_r, block_c]
+            if isinstance(rows, int):
+                return region[0]
+            if isinstance(cols, int):
+                return region[:, 0]
+            return region
+        fancy = self._fancy_index(key)
+        if fancy is not None:
+            rows, cols = fancy
+            values = np.empty(rows.shape, dtype=self.dtype)
+            for block, mask, block_rows, block_cols in self._iter_fancy(rows, cols):
+                values[mask] = block[block_rows, block_cols]
+            return values
+        return np.asarray(self)[key]
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        index = self._basic_index(key)
+        if index is not None:
+            rows, cols = index
+            row_range = range(rows, rows + 1) if isinstance(rows, int) else rows
+            col_range = range(cols, cols + 1) if isinstance(cols, int) else cols
+            value = np.broadcast_to(value, (len(row_range), len(col_range)))
+            for block, block_r, block_c, region_r, region_c in self._iter_region(
+                row_range, col_range
+            ):
+                block[block_r, block_c] = value[region_r, region_c]
+            return
+        fancy = self._fancy_index(key)
+        if fancy is None:
+            raise IndexError(f"Unsupported index for an out-of-core array: {key!r}")
+        rows, cols = fancy
+        value = np.broadcast_to(value, rows.shape)
+        for block, mask, block_rows, block_cols in self._iter_fancy(rows, cols):
+            block[block_rows, block_cols] = value[mask]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        values = self[:, :]
+        return values if dtype is None else values.astype(dtype)
+
+
+class _LazyCells(Sequence):
+    """
+    Stands in for the nested list of cells of a lazy `RasterLayer`, so that
+    `layer.cells[x][y]` creates the cell on first access.
+    """
+
+    def __init__(self, layer: RasterLayer):
+        self._layer = layer
+
+    def __len__(self) -> int:
+        return self._layer.width
+
+    def __getitem__(self, x):
+        columns = range(self._layer.width)[x]
+        if isinstance(columns, range):
+            return [_LazyCellColumn(self._layer, col) for col in columns]
+        return _LazyCellColumn(self._layer, columns)
+
+
+class _LazyCellColumn(Sequence):
+    """
+    A column of cells of a lazy `RasterLayer`, i.e., the cells sharing the same x.
+    """
+
+    def __init__(self, layer: RasterLayer, x: int):
+        self._layer = layer
+        self._x = x
+
+    def __len__(self) -> int:
+        return self._layer.height
+
+    def __getitem__(self, y):
+        rows = range(self._layer.height)[y]
+        if isinstance(rows, range):
+            return [self._layer._get_lazy_cell(self._x, row) for row in rows]
+        return self._layer._get_lazy_cell(self._x, rows)
+
+
+class RasterValues:
+    """
+    The values of an attribute of a `RasterLayer`, indexed by (x, y) positions like
+    the cells, as returned by `RasterLayer.values`.
+
+    Indexing with integers and slices, e.g., `values[x0:x1, y0:y1]`, returns a
+    read-only numpy array with shape (len(x), len(y)), which is a view of the
+    attribute array if the layer stores the attribute in memory. Assigning to
+    an index, e.g., `values[x0:x1, y0:y1] = 0`, writes to the attribute. Attributes
+    stored on the cells or out-of-core are read and rewritten as a whole instead.
+    """
+
+    def __init__(self, layer: RasterLayer, attr_name: str) -> None:
+        self._layer = layer
+        self._attr_name = attr_name
+
+    def _xy_array(self) -> np.ndarray:
+        """
+        Return the attribute as an array indexed by [x, y], i.e., with its rows
+        reversed and transposed, which is a view if it is stored in memory.
+        """
+
+        array = self._layer._attribute_arrays.get(self._attr_name)
+        if not isinstance(array, np.ndarray):
+            # stored on the cells, or out-of-core
+            array = np.asarray(self._layer._get_attribute_array(self._attr_name))
+        return array[::-1].T
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._layer.width, self._layer.height
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._xy_array().dtype
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return np.asarray(self[...], dtype=dtype)
+
+    def __getitem__(self, key: Any) -> Any:
+        values = self._xy_array()[key]
+        if isinstance(values, np.ndarray):
+            values = values.view()
+            values.flags.writeable = False
+        return values
+
+    def _key_region(self, key: Any) -> tuple[int, int, int, int] | None:
+        """
+        Return the first and last row and column of the attribute array covered by an
+        index of cell positions, or None if they cannot be determined.
+        """
+
+        width, height = self.shape
+        if isinstance(key, np.ndarray) and key.dtype == np.bool_:
+            if key.shape != (width, height):
+                return None
+            xs, ys = key.nonzero()
+        elif isinstance(key, tuple) and len(key) == 2:
+            try:
+                xs = np.arange(width)[key[0]]
+                ys = np.arange(height)[key[1]]
+            except (IndexError, TypeError):
+                return None
+        else:
+            return None
+        if np.size(xs) == 0 or np.size(ys) == 0:
+            return None
+        return height - 1 - np.max(ys), height - 1 - np.min(ys), np.min(xs), np.max(xs)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        layer = self._layer
+        array = layer._attribute_arrays.get(self._attr_name)
+        if isinstance(array, np.ndarray):
+            array[::-1].T[key] = value
+            layer._version += 1
+            if layer._change_tiles:
+                layer._mark_changed(self._attr_name, self._key_region(key))
+            return
+        xy_array = self._xy_array().copy()
+        xy_array[key] = value
+        values = xy_array.T[::-1]
+        if layer._array_backed:
+            layer._set_attribute_array(self._attr_name, values)
+        else:
+            layer.apply_raster(
+                values[np.newaxis],
+                attr_name=self._attr_name,
+                nodata=layer._nodata.get(self._attr_name),
+            )
+
+
+class RasterLayer(RasterBase):
+    """
+    Some methods in `RasterLayer` are copied from `mesa.space.Grid`, including:
+
+    __getitem__
+    __iter__
+    coord_iter
+    iter_neighborhood
+    get_neighborhood
+    iter_neighbors
+    get_neighbors  # copied and renamed to `get_neighboring_cells`
+    out_of_bounds  # copied into `RasterBase`
+    iter_cell_list_contents
+    get_cell_list_contents
+
+    Methods from `mesa.space.Grid` that are not copied over:
+
+    torus_adj
+    neighbor_iter
+    move_agent
+    place_agent
+    _place_agent
+    remove_agent
+    is_cell_empty
+    move_to_empty
+    find_empty
+    exists_empty_cells
+
+    Another difference is that `mesa.space.Grid` has `self.grid: List[List[Agent | None]]`,
+    whereas it is `self.cells: List[List[Cell]]` here in `RasterLayer`.
+
+    By default, the values of raster attributes are stored on each cell. If the layer
+    is created with `array_backed=True`, each attribute is instead stored as a 2D numpy
+    array of shape (height, width) on the layer, and the cells proxy attribute access
+    to these arrays. In this mode `get_raster` returns a view of the stored array for
+    a single attribute, instead of a copy.
+
+    With `lazy=True`, cells are only created when they are first accessed, e.g., through
+    `cells[x][y]`, `__getitem__` or the neighborhood methods. Memory use and startup time
+    then depend on the number of visited cells rather than on the size of the raster.
+    Iterating over all cells of a lazy layer creates all of them.
+
+    `get_neighborhood` computes neighborhoods from their offsets, which is about as fast
+    as looking them up, so it does not cache them by default. For irregular queries that
+    are repeated often, set `neighborhood_cache_size` to keep the results of the most
+    recent ones in a cache of that many entries, or to None for an unbounded cache. To
+    look up neighborhoods of many cells at once, use the table returned by
+    `get_neighbor_table` instead.
+    """
+
+    cells: list[list[Cell]]
+    neighborhood_cache_size: int | None = 0
+    _neighborhood_cache: collections.OrderedDict[Any, list[Coordinate]]
+    _neighbor_tables: dict[tuple[bool, bool, int], tuple[np.ndarray, np.ndarray]]
+    _flow_directions: dict[tuple[str, ...], tuple[int, np.ndarray, np.ndarray]]
+    _distance_surfaces: dict[
+        tuple, tuple[Any, np.ndarray, np.ndarray, np.ndarray | None]
+    ]
+    _change_tiles: dict[str, tuple[int, np.ndarray]]
+    _change_counter: int
+    _attributes: set[str]
+    _attribute_arrays: dict[str, np.ndarray]
+    _nodata: dict[str, Any]
+    _raster_order_cells_cache: list[Cell] | None
+    _materialized_cells: collections.OrderedDict[Coordinate, Cell]
+
+    def __init__(
+        self,
+        width,
+        height,
+        crs,
+        total_bounds,
+        model,
+        cell_cls: type[Cell] = Cell,
+        array_backed: bool = False,
+        lazy: bool = False,
+        max_cells: int | None = None,
+        memmap_dir: str | None = None,
+    ):
+        """
+        Initialize a raster layer.
+
+        :param width: Width of the raster layer.
+        :param height: Height of the raster layer.
+        :param crs: Coordinate reference system of the raster layer.
+        :param total_bounds: Bounds of the raster layer in [min_x, min_y, max_x, max_y] format.
+        :param model: The model that the cells belong to.
+        :param Type[Cell] cell_cls: The class of the cells in the layer. Default is `Cell`.
+            Use a subclass of `LightweightCell` for cells that are not registered
+            with the model as agents.
+        :param bool array_backed: Whether to store raster attributes as numpy arrays
+            on the layer instead of on each cell. Default is False.
+        :param bool lazy: Whether to create cells only when they are first accessed,
+            instead of all at once. A lazy layer is always array-backed. Default is False.
+        :param int | None max_cells: Maximum number of cells kept in memory by a lazy
+            layer. When it is exceeded, the least recently used cells without state
+            of their own are discarded, and created again when next accessed.
+            If None, cells are never discarded. Default is None.
+        :param str | None memmap_dir: A directory in which the attribute arrays are stored
+            as memory-mapped `.npy` files named after the attributes, so that rasters
+            larger than memory can be used. Existing files are neither overwritten nor
+            removed, a number is appended to the name of a new file instead. A layer
+            with a `memmap_dir` is always array-backed. If None, the arrays are kept in
+            memory. Default is None.
+        :raises ValueError: If `max_cells` is given for a layer that is not lazy, or if
+            the cells cannot store attributes of their own in a layer that is not
+            array-backed.
+        """
+
+        if max_cells is not None and not lazy:
+            raise ValueError("`max_cells` can only be used with `lazy=True`.")
+        array_backed = array_backed or lazy or memmap_dir is not None
+        if not array_backed and cell_cls.__dictoffset__ == 0:
+            raise ValueError(
+                f"{cell_cls.__name__} cannot store attributes of its own, "
+                "use `array_backed=True` instead."
+            )
+        super().__init__(width, height, crs, total_bounds)
+        self.model = model
+        self.cell_cls = cell_cls
+        self._array_backed = array_backed
+        self._lazy = lazy
+        self._max_cells = max_cells
+        self._memmap_dir = memmap_dir
+        self._attribute_arrays = {}
+        self._raster_order_cells_cache = None
+        self._initialize_cells(model, cell_cls)
+        self._attributes = set()
+        self._nodata = {}
+        self._neighborhood_cache = collections.OrderedDict()
+        self._neighbor_tables = {}
+        self._flow_directions = {}
+        self._distance_surfaces = {}
+        self._change_tiles = {}
+        self._change_counter = 0
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # the attribute proxies installed on the cell class are not pickled with it
+        for name in self._attribute_arrays:
+            _proxy_attribute(self.cell_cls, name)
+
+    def _detach_caches(self) -> None:
+        super()._detach_caches()
+        self._flow_directions = {}
+        self._distance_surfaces = {}
+        self._change_tiles = {
+            name: (tile_size, stamps.copy())
+            for name, (tile_size, stamps) in self._change_tiles.items()
+        }
+
+    def _initialize_cells(self, model: Model, cell_cls: type[Cell]):
+        if self._lazy:
+            self._materialized_cells = collections.OrderedDict()
+            self.cells = cast(list[list[Cell]], _LazyCells(self))
+            return
+        self.cells = []
+        for x in range(self.width):
+            col: list[cell_cls] = []
+            for y in range(self.height):
+                col.append(self._create_cell(x, y))
+            self.cells.append(col)
+
+    def _create_cell(self, x: int, y: int) -> Cell:
+        row_idx, col_idx = self.height - y - 1, x
+        if not self._array_backed:
+            return self.cell_cls(self.model, pos=(x, y), indices=(row_idx, col_idx))
+        cell = self.cell_cls(self.model, pos=(x, y), indices=(row_idx, col_idx))
+        self._bind_cell(cell)
+        return cell
+
+    def _bind_cell(self, cell: Cell) -> None:
+        """
+        Bind a cell to the attribute arrays of this layer.
+
+        Values assigned to raster attributes before binding, e.g., default values
+        set in the `__init__` of a cell class, are discarded in favour of the
+        values stored in the attribute arrays.
+        """
+
+        for name in self._attribute_arrays:
+            _discard_instance_attribute(cell, name)
+        cell._layer = self
+
+    def _get_lazy_cell(self, x: int, y: int) -> Cell:
+        """
+        Return the cell at (x, y) of a lazy layer, creating it if necessary.
+        """
+
+        cells = self._materialized_cells
+        cell = cells.get((x, y))
+        if cell is None:
+            cell = self._create_cell(x, y)
+            cells[(x, y)] = cell
+            if self._max_cells is not None and len(cells) > self._max_cells:
+                self._evict_cells()
+        elif self._max_cells is not None:
+            cells.move_to_end((x, y))
+        return cell
+
+    def _evict_cells(self) -> None:
+        """
+        Discard the least recently used cells of a lazy layer until at most
+        `max_cells` remain. Cells with state of their own are kept.
+        """
+
+        cells = self._materialized_cells
+        # the most recently used cell is never evicted
+        for _ in range(len(cells) - 1):
+            if len(cells) <= self._max_cells:
+                break
+            pos, cell = next(iter(cells.items()))
+            if _has_own_state(cell):
+                cells.move_to_end(pos)
+            else:
+                del cells[pos]
+                if isinstance(cell, Agent):
+                    cell.remove()
+
+    def _iter_materialized_cells(self) -> Iterator[Cell]:
+        if self._lazy:
+            return iter(list(self._materialized_cells.values()))
+        return iter(self)
+
+    @property
+    def lazy(self) -> bool:
+        """
+        Return whether cells are created only when they are first accessed.
+
+        :return: True if the layer is lazy, False otherwise.
+        :rtype: bool
+        """
+
+        return self._lazy
+
+    @property
+    def array_backed(self) -> bool:
+        """
+        Return whether the raster attributes are stored as numpy arrays on the layer.
+
+        :return: True if the layer is array-backed, False otherwise.
+        :rtype: bool
+        """
+
+        return self._array_backed
+
+    def _set_attribute_array(
+        self, attr_name: str, values: np.ndarray, copy: bool = True
+    ) -> None:
+        """
+        Store the values of an attribute in array-backed mode.
+
+        If the attribute already exists with the same dtype, the values are written
+        into the existing array, so that views of it remain valid.
+
+        :param str attr_name: Name of the attribute.
+        :param np.ndarray values: 2D numpy array with shape (height, width).
+        :param bool copy: Whether to copy `values` when storing a new array.
+            Default is True.
+        """
+
+        self._version += 1
+        existing = self._attribute_arrays.get(attr_name)
+        if existing is not None and existing.dtype == values.dtype:
+            self._mark_changed_tiles(attr_name, existing, values)
+            existing[...] = values
+            return
+        self._mark_changed(attr_name)
+        if copy:
+            array = self._new_attribute_array(attr_name, values.dtype)
+            array[...] = values
+            values = array
+        self._attribute_arrays[attr_name] = values
+        if existing is None:
+            _proxy_attribute(self.cell_cls, attr_name)
+            # discard values of the same name that were stored on the cells before
+            for cell in self._iter_materialized_cells():
+                _discard_instance_attribute(cell, attr_name)
+
+    def _new_attribute_array(self, attr_name: str, dtype: np.dtype) -> np.ndarray:
+        """
+        Allocate an uninitialized attribute array with shape (height, width), which is
+        memory-mapped to a file in `memmap_dir` if the layer has one.
+        """
+
+        shape = (self.height, self.width)
+        if self._memmap_dir is None:
+            return np.empty(shape, dtype=dtype)
+        # never overwrite or remove an existing file, which may still be mapped, e.g.,
+        # by another layer, and cannot be removed while mapped on Windows
+        filename = os.path.join(self._memmap_dir, f"{attr_name}.npy")
+        suffix = 0
+        while os.path.exists(filename):
+            suffix += 1
+            filename = os.path.join(self._memmap_dir, f"{attr_name}_{suffix}.npy")
+        return np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+
+    def track_changes(self, attr_name: str, tile_size: int = 256) -> None:
+        """
+        Start tracking which tiles of an attribute are modified, so that consumers such
+        as `to_image` and `to_file` can process only the tiles that have changed, as
+        returned by `get_changed_windows`.
+
+        Changes are tracked through `apply_raster`, `apply_kernel`, `apply_algebra`,
+        cell attributes and `values`. `apply_raster` and `apply_kernel` only mark the
+        tiles whose values differ. Writes into the arrays returned by `get_raster`
+        are not tracked. Tracking an attribute again starts over with a new tile size.
+
+        :param str attr_name: Name of the attribute.
+        :param int tile_size: The width and height of the tiles in cells. Default is 256.
+        :raises ValueError: If the layer is not array-backed, if the attribute does not
+            exist, or if the tile size is not a positive integer.
+        """
+
+        if not self._array_backed:
+            raise ValueError(
+                "Changes can only be tracked for array-backed layers, as changes to "
+                "the attributes of cells cannot be tracked otherwise."
+            )
+        if attr_name not in self.attributes:
+            raise ValueError(
+                f"Attribute {attr_name} does not exist. Choose from {self.attributes}."
+            )
+        if tile_size < 1:
+            raise ValueError(f"Tile size must be positive, received {tile_size}.")
+        self._change_tiles[attr_name] = (tile_size, self._new_change_stamps(tile_size))
+
+    def get_changed_windows(
+        self, attr_name: str, since: int = 0
+    ) -> tuple[list[Window], int]:
+        """
+        Return the windows of the tiles of an attribute modified since a point in time,
+        given by a token returned by an earlier call.
+
+        For example, to write a file and then only the tiles that have changed:
+
+        .. code-block:: python
+
+            layer.track_changes("fire")
+            layer.to_file("fire.tif", attr_name="fire")
+            _, token = layer.get_changed_windows("fire")
+            ...
+            windows, token = layer.get_changed_windows("fire", since=token)
+            layer.to_file("fire.tif", attr_name="fire", windows=windows)
+
+        Each consumer keeps a token of its own, so they do not interfere.
+
+        :param str attr_name: Name of the attribute, whose changes are tracked.
+        :param int since: The token returned by the last call of the consumer. All tiles
+            are returned for the default of 0.
+        :return: The windows of the modified tiles, in raster order, and the token to
+            pass to the next call.
+        :rtype: Tuple[List[Window], int]
+        :raises ValueError: If changes to the attribute are not tracked.
+        """
+
+        tracked = self._change_tiles.get(attr_name)
+        if tracked is None:
+            raise ValueError(
+                f"Changes to attribute {attr_name} are not tracked, "
+                "call `track_changes` first."
+            )
+        tile_size, stamps = tracked
+        windows = [
+            Window(
+                col * tile_size,
+                row * tile_size,
+                min(tile_size, self.width - col * tile_size),
+                min(tile_size, self.height - row * tile_size),
+            )
+            for row, col in zip(*np.nonzero(stamps > since))
+        ]
+        return windows, self._change_counter
+
+    def _new_change_stamps(self, tile_size: int) -> np.ndarray:
+        """
+        Return the stamps of the tiles of a newly tracked attribute, in which all tiles
+        are marked as changed.
+        """
+
+        self._change_counter += 1
+        shape = (-(-self.height // tile_size), -(-self.width // tile_size))
+        return np.full(shape, self._change_counter, dtype=np.int64)
+
+    def _mark_changed(
+        self, attr_name: str, region: tuple[int, int, int, int] | None = None
+    ) -> None:
+        """
+        Mark the tiles of an attribute covering a region, given by its first and last
+        row and column, or all tiles if `region` is None, as changed, if changes to the
+        attribute are tracked.
+        """
+
+        tracked = self._change_tiles.get(attr_name)
+        if tracked is None:
+            return
+        tile_size, stamps = tracked
+        self._change_counter += 1
+        if region is None:
+            stamps[...] = self._change_counter
+            return
+        first_row, last_row, first_col, last_col = region
+        stamps[
+            first_row // tile_size : last_row // tile_size + 1,
+            first_col // tile_size : last_col // tile_size + 1,
+        ] = self._change_counter
+
+    def _mark_changed_tiles(self, attr_name: str, old: Any, new: np.ndarray) -> None:
+        """
+        Mark the tiles of an attribute, in which its `old` and `new` values differ, as
+        changed, if changes to the attribute are tracked. All tiles are marked if the
+        old values are not held in memory, e.g., if they are read out-of-core.
+        """
+
+        tracked = self._change_tiles.get(attr_name)
+        if tracked is None:
+            return
+        if not isinstance(old, np.ndarray) or old.shape != new.shape:
+            self._mark_changed(attr_name)
+            return
+        tile_size, stamps = tracked
+        differs = old != new
+        if old.dtype.kind in "fc":
+            differs &= ~(np.isnan(old) & np.isnan(new))
+        changed = _reduce_blocks(differs, tile_size, np.logical_or)
+        if changed.any():
+            self._change_counter += 1
+            stamps[changed] = self._change_counter
+
+    def apply_memmap(
+        self,
+        filename: str,
+        attr_name: str | None = None,
+        mode: str = "r",
+        nodata: Any = None,
+    ) -> None:
+        """
+        Add an attribute whose values are memory-mapped from an existing `.npy` file,
+        e.g., one written by a layer with a `memmap_dir`.
+
+        With the default read-only mode, layers of several model replicates, also in
+        different processes, share the same pages of the file in memory.
+
+        :param str filename: Path to the `.npy` file holding an array with shape
+            (height, width).
+        :param str | None attr_name: Name of the attribute. If None, a random name will
+            be generated. Default is None.
+        :param str mode: The mode in which the file is memory-mapped, see `numpy.memmap`.
+            Default is "r", i.e., read-only.
+        :param nodata: The value marking cells without data. If None, all values are
+            valid. Default is None.
+        :raises ValueError: If the layer is not array-backed, or if the shape of the
+            array does not match the raster shape.
+        """
+
+        if not self._array_backed:
+            raise ValueError("Memory-mapped attributes require an array-backed layer.")
+        values = np.load(filename, mmap_mode=mode)
+        if values.shape != (self.height, self.width):
+            raise ValueError(
+                f"Data shape does not match raster shape. "
+                f"Expected {(self.height, self.width)}, received {values.shape}."
+            )
+        if attr_name is None:
+            attr_name = _default_attr_name(self.cell_cls)
+        self._attributes.add(attr_name)
+        self._set_nodata(attr_name, nodata)
+        self._attribute_arrays.pop(attr_name, None)
+        self._set_attribute_array(attr_name, values, copy=False)
+
+    @property
+    def attributes(self) -> set[str]:
+        """
+        Return the attributes of the cells in the raster layer.
+
+        :return: Attributes of the cells in the raster layer.
+        :rtype: Set[str]
+        """
+        return self._attributes
+
+    @overload
+    def __getitem__(self, index: int) -> list[Cell]: ...
+
+    @overload
+    def __getitem__(
+        self, index: tuple[int | slice, int | slice]
+    ) -> Cell | list[Cell]: ...
+
+    @overload
+    def __getitem__(self, index: Sequence[Coordinate]) -> list[Cell]: ...
+
+    def __getitem__(
+        self, index: int | Sequence[Coordinate] | tuple[int | slice, int | slice]
+    ) -> Cell | list[Cell]:
+        """
+        Access contents from the grid.
+        """
+
+        if isinstance(index, int):
+            # cells[x]
+            return self.cells[index]
+
+        if isinstance(index[0], tuple):
+            # cells[(x1, y1), (x2, y2)]
+            index = cast(Sequence[Coordinate], index)
+
+            cells = []
+            for pos in index:
+                x1, y1 = pos
+                cells.append(self.cells[x1][y1])
+            return cells
+
+        x, y = index
+
+        if isinstance(x, int) and isinstance(y, int):
+            # cells[x, y]
+            x, y = cast(Coordinate, index)
+            return self.cells[x][y]
+
+        if isinstance(x, int):
+            # cells[x, :]
+            x = slice(x, x + 1)
+
+        if isinstance(y, int):
+            # grid[:, y]
+            y = slice(y, y + 1)
+
+        # cells[:, :]
+        x, y = (cast(slice, x), cast(slice, y))
+        cells = []
+        for rows in self.cells[x]:
+            for cell in rows[y]:
+                cells.append(cell)
+        return cells
+
+    def values(self, attr_name: str) -> RasterValues:
+        """
+        Return the values of an attribute for reading and writing windows of it at once,
+        without accessing the cells, e.g.:
+
+        .. code-block:: python
+
+            fuel = layer.values("fuel")
+            burnt = fuel[10:20, 5:15] < 0.1
+            fuel[10:20, 5:15] = 0
+
+        The values are indexed by (x, y) positions like `layer[x, y]`, so that
+        `layer.values(attr_name)[x, y]` equals `getattr(layer[x, y], attr_name)`.
+
+        :param str attr_name: Name of the attribute.
+        :return: The values of the attribute, see `RasterValues`.
+        :rtype: RasterValues
+        :raises ValueError: If the attribute does not exist.
+        """
+
+        if attr_name not in self.attributes:
+            raise ValueError(
+                f"Attribute {attr_name} does not exist. Choose from {self.attributes}."
+            )
+        return RasterValues(self, attr_name)
+
+    def __iter__(self) -> Iterator[Cell]:
+        """
+        Create an iterator that chains the rows of the cells together
+        as if it is one list
+        """
+
+        return itertools.chain(*self.cells)
+
+    def coord_iter(self) -> Iterator[tuple[Cell, int, int]]:
+        """
+        An iterator that returns coordinates as well as cell contents.
+        """
+
+        for row in range(self.width):
+            for col in range(self.height):
+                yield self.cells[row][col], row, col  # cell, x, y
+
+    def get_positions(
+        self, mask: np.ndarray | None = None, shuffle: bool = False
+    ) -> np.ndarray:
+        """
+        Return the positions of all cells, or of the cells selected by a mask, as an
+        array rather than as cells, so that no cells need to be created for a lazy layer.
+
+        :param np.ndarray | None mask: Boolean array with shape (1, height, width), such
+            as a condition on the result of `get_raster`, selecting the cells whose
+            positions are returned. If None, all positions are returned. Default is None.
+        :param bool shuffle: Whether to return the positions in random order, drawn from
+            the random number generator `rng` of the model, instead of in raster order.
+            Default is False.
+        :return: An int array with shape (n, 2) of (x, y) positions.
+        :rtype: np.ndarray
+        :raises ValueError: If the shape of the mask is not (1, height, width).
+        """
+
+        if mask is None:
+            flat = np.arange(self.height * self.width)
+        else:
+            mask = np.asarray(mask)
+            if mask.shape != (1, self.height, self.width):
+                raise ValueError(
+                    f"Mask shape does not match raster shape. "
+                    f"Expected {(1, self.height, self.width)}, received {mask.shape}."
+                )
+            flat = np.flatnonzero(mask)
+        if shuffle:
+            flat = self.model.rng.permutation(flat)
+        rows, cols = np.divmod(flat, self.width)
+        return np.stack((cols, self.height - 1 - rows), axis=-1)
+
+    def iter_cells(
+        self, positions: np.ndarray | Sequence[Coordinate]
+    ) -> Iterator[Cell]:
+        """
+        Iterate over the cells at the given positions, e.g., from `get_positions`.
+        The cells of a lazy layer are only created when they are reached.
+
+        :param np.ndarray | Sequence[Coordinate] positions: Array-like with shape (n, 2)
+            of (x, y) positions.
+        :return: An iterator of the cells at the positions, in the same order.
+        :rtype: Iterator[Cell]
+        """
+
+        cells = self.cells
+        for x, y in np.asarray(positions, dtype=np.int64).reshape(-1, 2).tolist():
+            yield cells[x][y]
+
+    def shuffle_do(
+        self,
+        method: str | Callable,
+        *args,
+        mask: np.ndarray | None = None,
+        **kwargs,
+    ) -> None:
+        """
+        Invoke a method or function on the cells in random order, e.g.,
+        `layer.shuffle_do("step", mask=layer.get_raster("active") > 0)` to step only
+        the active cells of a model.
+
+        The order is drawn as a permutation of positions, so only the selected cells
+        are accessed, and a lazy layer creates no others.
+
+        :param str | Callable method: The name of the method to call on each cell, or a
+            function called with each cell as its first argument.
+        :param args: Positional arguments passed to the method.
+        :param np.ndarray | None mask: Boolean array with shape (1, height, width)
+            selecting the cells. If None, all cells are selected. Default is None.
+        :param kwargs: Keyword arguments passed to the method.
+        """
+
+        positions = self.get_positions(mask, shuffle=True)
+        if isinstance(method, str):
+            for cell in self.iter_cells(positions):
+                getattr(cell, method)(*args, **kwargs)
+        else:
+            for cell in self.iter_cells(positions):
+                method(cell, *args, **kwargs)
+
+    def apply_raster(
+        self, data: np.ndarray, attr_name: str | None = None, nodata: Any = None
+    ) -> None:
+        """
+        Apply raster data to the cells.
+
+        :param np.ndarray data: 2D numpy array with shape (1, height, width).
+        :param str | None attr_name: Name of the attribute to be added to the cells.
+            If None, a random name will be generated. Default is None.
+        :param nodata: The value marking cells without data, which are masked in
+            `get_raster(masked=True)` and skipped by vectorized operations such as
+            `focal`. If None, all values are valid. Default is None.
+        :raises ValueError: If the shape of the data is not (1, height, width).
+        """
+
+        if data.shape != (1, self.height, self.width):
+            raise ValueError(
+                f"Data shape does not match raster shape. "
+                f"Expected {(1, self.height, self.width)}, received {data.shape}."
+            )
+        if attr_name is None:
+            attr_name = _default_attr_name(self.cell_cls)
+        self._attributes.add(attr_name)
+        self._set_nodata(attr_name, nodata)
+        if self._array_backed:
+            self._set_attribute_array(attr_name, data[0])
+            return
+        for cell, value in zip(self._raster_order_cells(), data[0].ravel()):
+            setattr(cell, attr_name, value)
+
+    def get_raster(
+        self, attr_name: str | None = None, masked: bool = False
+    ) -> np.ndarray:
+        """
+        Return the values of given attribute.
+
+        :param str | None attr_name: Name of the attribute to be returned. If None,
+            returns all attributes. Default is None.
+        :param bool masked: If True, return a masked array in which the cells holding
+            the nodata value of an attribute are masked. Default is False.
+        :return: The values of given attribute as a 2D numpy array with shape (1, height, width).
+            The dtype of the applied raster data is preserved. If the layer is array-backed
+            and `attr_name` is given, this is a view of the stored attribute array rather
+            than a copy.
+        :rtype: np.ndarray
+        """
+
+        if attr_name is not None and attr_name not in self.attributes:
+            raise ValueError(
+                f"Attribute {attr_name} does not exist. "
+                f"Choose from {self.attributes}, or set `attr_name` to `None` to retrieve all."
+            )
+        attr_names = list(self.attributes) if attr_name is None else [attr_name]
+        if not attr_names:
+            data = np.empty((0, self.height, self.width))
+        elif attr_name is not None:
+            data = self._get_attribute_array(attr_name)[np.newaxis]
+        else:
+            data = np.stack([self._get_attribute_array(name) for name in attr_names])
+        if not masked:
+            return data
+        mask = np.zeros(data.shape, dtype=np.bool_)
+        for i, name in enumerate(attr_names):
+            nodata_mask = self._nodata_mask(name)
+            if nodata_mask is not None:
+                mask[i] = nodata_mask
+        return np.ma.MaskedArray(data, mask=mask)
+
+    @property
+    def nodata(self) -> dict[str, Any]:
+        """
+        Return the nodata values of the attributes that have one.
+
+        :return: A dictionary mapping attribute names to their nodata values.
+        :rtype: Dict[str, Any]
+        """
+
+        return dict(self._nodata)
+
+    def _set_nodata(self, attr_name: str, nodata: Any) -> None:
+        self._version += 1
+        if nodata is None:
+            self._nodata.pop(attr_name, None)
+        else:
+            self._nodata[attr_name] = nodata
+
+    def _nodata_mask(self, attr_name: str) -> np.ndarray | None:
+        """
+        Return a boolean array with shape (height, width) that is True for the cells
+        holding the nodata value of an attribute, or None if it has no nodata value.
+        """
+
+        nodata = self._nodata.get(attr_name)
+        if nodata is None:
+            return None
+        return _is_nodata(np.asarray(self._get_attribute_array(attr_name)), nodata)
+
+    def _get_attribute_array(self, attr_name: str) -> np.ndarray:
+        """
+        Return the values of an attribute as a 2D numpy array with shape (height, width).
+
+        For array-backed layers this is the stored array itself. Otherwise, the values
+        are gathered from the cells into a new array, whose dtype is inferred from the
+        values, so that e.g. a uint8 raster applied to the cells stays uint8.
+        """
+
+        if self._array_backed:
+            return self._attribute_arrays[attr_name]
+        values = list(map(operator.attrgetter(attr_name), self._raster_order_cells()))
+        return np.array(values).reshape(self.height, self.width)
+
+    def _raster_order_cells(self) -> list[Cell]:
+        """
+        Return a flat list of the cells in raster order, i.e., row by row starting from
+        the upper left corner, so that it lines up with a flattened (height, width) array.
+
+        The list is built once and reused.
+        """
+
+        if self._raster_order_cells_cache is None:
+            self._raster_order_cells_cache = [
+                self.cells[x][y]
+                for y in range(self.height - 1, -1, -1)
+                for x in range(self.width)
+            ]
+        return self._raster_order_cells_cache
+
+    def iter_neighborhood(
+        self,
+        pos: Coordinate,
+        moore: bool,
+        include_center: bool = False,
+        radius: int = 1,
+    ) -> Iterator[Coordinate]:
+        """
+        Return an iterator over cell coordinates that are in the
+        neighborhood of a certain point.
+
+        :param Coordinate pos: Coordinate tuple for the neighborhood to get.
+        :param bool moore: Whether to use Moore neighborhood or not. If True,
+            return Moore neighborhood (including diagonals). If False, return
+            Von Neumann neighborhood (exclude diagonals).
+        :param bool include_center: If True, return the (x, y) cell as well.
+            Otherwise, return surrounding cells only. Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :return: An iterator over cell coordinates that are in the neighborhood.
+            For example with radius 1, it will return list with number of elements
+            equals at most 9 (8) if Moore, 5 (4) if Von Neumann (if not including
+            the center).
+        :rtype: Iterator[Coordinate]
+        """
+
+        yield from self.get_neighborhood(pos, moore, include_center, radius)
+
+    def iter_neighbors(
+        self,
+        pos: Coordinate,
+        moore: bool,
+        include_center: bool = False,
+        radius: int = 1,
+    ) -> Iterator[Cell]:
+        """
+        Return an iterator over neighbors to a certain point.
+
+        :param Coordinate pos: Coordinate tuple for the neighborhood to get.
+        :param bool moore: Whether to use Moore neighborhood or not. If True,
+            return Moore neighborhood (including diagonals). If False, return
+            Von Neumann neighborhood (exclude diagonals).
+        :param bool include_center: If True, return the (x, y) cell as well.
+            Otherwise, return surrounding cells only. Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :return: An iterator of cells that are in the neighborhood; at most 9 (8)
+            if Moore, 5 (4) if Von Neumann (if not including the center).
+        :rtype: Iterator[Cell]
+        """
+
+        neighborhood = self.get_neighborhood(pos, moore, include_center, radius)
+        return self.iter_cell_list_contents(neighborhood)
+
+    @accept_tuple_argument
+    def iter_cell_list_contents(
+        self, cell_list: Iterable[Coordinate]
+    ) -> Iterator[Cell]:
+        """
+        Returns an iterator of the contents of the cells
+        identified in cell_list.
+
+        :param Iterable[Coordinate] cell_list: Array-like of (x, y) tuples,
+            or single tuple.
+        :return: An iterator of the contents of the cells identified in cell_list.
+        :rtype: Iterator[Cell]
+        """
+
+        # Note: filter(None, iterator) filters away an element of iterator that
+        # is falsy. Hence, iter_cell_list_contents returns only non-empty
+        # contents.
+        return filter(None, (self.cells[x][y] for x, y in cell_list))
+
+    @accept_tuple_argument
+    def get_cell_list_contents(self, cell_list: Iterable[Coordinate]) -> list[Cell]:
+        """
+        Returns a list of the contents of the cells
+        identified in cell_list.
+
+        Note: this method returns a list of cells.
+
+        :param Iterable[Coordinate] cell_list: Array-like of (x, y) tuples,
+            or single tuple.
+        :return: A list of the contents of the cells identified in cell_list.
+        :rtype: List[Cell]
+        """
+
+        return list(self.iter_cell_list_contents(cell_list))
+
+    def get_neighborhood(
+        self,
+        pos: Coordinate,
+        moore: bool,
+        include_center: bool = False,
+        radius: int = 1,
+    ) -> list[Coordinate]:
+        """
+        Return a list of cell coordinates that are in the neighborhood of a certain point.
+
+        The coordinates are computed from the offsets of the neighborhood. If
+        `neighborhood_cache_size` is not 0, the results of the most recent queries are
+        kept in a cache of at most that many entries.
+
+        :param Coordinate pos: Coordinate tuple for the neighborhood to get.
+        :param bool moore: Whether to use Moore neighborhood or not. If True,
+            return Moore neighborhood (including diagonals). If False, return
+            Von Neumann neighborhood (exclude diagonals).
+        :param bool include_center: If True, return the (x, y) cell as well.
+            Otherwise, return surrounding cells only. Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :return: A sorted list of cell coordinates that are in the neighborhood.
+        :rtype: List[Coordinate]
+        """
+
+        cache_size = self.neighborhood_cache_size
+        if cache_size == 0:
+            return self._compute_neighborhood(pos, moore, include_center, radius)
+
+        cache_key = (pos, moore, include_center, radius)
+        cache = self._neighborhood_cache
+        neighborhood = cache.get(cache_key, None)
+        if neighborhood is None:
+            neighborhood = self._compute_neighborhood(
+                pos, moore, include_center, radius
+            )
+            cache[cache_key] = neighborhood
+            if cache_size is not None and len(cache) > cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(cache_key)
+        return neighborhood
+
+    def _compute_neighborhood(
+        self, pos: Coordinate, moore: bool, include_center: bool, radius: int
+    ) -> list[Coordinate]:
+        """
+        Return the neighborhood of a position, computed from the offsets of the
+        neighborhood.
+        """
+
+        x, y = pos
+        offsets = _neighborhood_offsets(moore, include_center, radius)
+        width, height = self.width, self.height
+        if radius <= x < width - radius and radius <= y < height - radius:
+            # the whole neighborhood is inside of the raster
+            return [(x + dx, y + dy) for dx, dy in offsets]
+        return [
+            (x + dx, y + dy)
+            for dx, dy in offsets
+            if 0 <= x + dx < width and 0 <= y + dy < height
+        ]
+
+    def get_neighborhoods(
+        self,
+        positions: np.ndarray | Sequence[Coordinate],
+        moore: bool,
+        include_center: bool = False,
+        radius: int = 1,
+    ) -> np.ndarray:
+        """
+        Return the neighborhoods of many positions at once.
+
+        :param np.ndarray | Sequence[Coordinate] positions: Array-like with shape (n, 2)
+            of (x, y) positions.
+        :param bool moore: Whether to use Moore neighborhood or not.
+        :param bool include_center: Whether to include the position itself. Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :return: An int array with shape (n, k, 2) of (x, y) neighbor coordinates, where
+            k is the size of the full neighborhood. Neighbors outside of the raster are
+            padded with -1. The other neighbors are in the same order as `get_neighborhood`.
+        :rtype: np.ndarray
+        """
+
+        neighbor_x, neighbor_y, valid = self._batch_neighborhoods(
+            positions, moore, include_center, radius
+        )
+        neighbors = np.stack((neighbor_x, neighbor_y), axis=-1)
+        neighbors[~valid] = -1
+        return neighbors
+
+    def get_neighborhood_values(
+        self,
+        positions: np.ndarray | Sequence[Coordinate],
+        attr_name: str,
+        moore: bool,
+        include_center: bool = False,
+        radius: int = 1,
+    ) -> np.ma.MaskedArray:
+        """
+        Return the values of an attribute over the neighborhoods of many positions at once.
+
+        For example, the lowest neighbor of every raindrop is found with
+        `values.argmin(axis=1)` together with the coordinates from `get_neighborhoods`.
+
+        :param np.ndarray | Sequence[Coordinate] positions: Array-like with shape (n, 2)
+            of (x, y) positions.
+        :param str attr_name: Name of the attribute.
+        :param bool moore: Whether to use Moore neighborhood or not.
+        :param bool include_center: Whether to include the position itself. Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :return: A masked array with shape (n, k), aligned with the result of
+            `get_neighborhoods`, where neighbors outside of the raster and neighbors
+            holding the nodata value of the attribute are masked.
+        :rtype: np.ma.MaskedArray
+        :raises ValueError: If the attribute does not exist.
+        """
+
+        if attr_name not in self.attributes:
+            raise ValueError(
+                f"Attribute {attr_name} does not exist. Choose from {self.attributes}."
+            )
+        neighbor_x, neighbor_y, valid = self._batch_neighborhoods(
+            positions, moore, include_center, radius
+        )
+        rows = np.where(valid, self.height - 1 - neighbor_y, 0)
+        cols = np.where(valid, neighbor_x, 0)
+        values = np.asarray(self._get_attribute_array(attr_name)[rows, cols])
+        mask = ~valid
+        is_nodata = _is_nodata(values, self._nodata.get(attr_name))
+        if is_nodata is not None:
+            mask |= is_nodata
+        return np.ma.MaskedArray(values, mask=mask)
+
+    def _batch_neighborhoods(
+        self,
+        positions: np.ndarray | Sequence[Coordinate],
+        moore: bool,
+        include_center: bool,
+        radius: int,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return the x and y coordinates of the neighbors of many positions, each with
+        shape (n, k), together with a mask of the neighbors inside of the raster.
+        """
+
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        offsets = np.array(
+            _neighborhood_offsets(moore, include_center, radius), dtype=np.int64
+        ).reshape(-1, 2)
+        neighbor_x = positions[:, 0, np.newaxis] + offsets[:, 0]
+        neighbor_y = positions[:, 1, np.newaxis] + offsets[:, 1]
+        valid = (
+            (neighbor_x >= 0)
+            & (neighbor_x < self.width)
+            & (neighbor_y >= 0)
+            & (neighbor_y < self.height)
+        )
+        return neighbor_x, neighbor_y, valid
+
+    def get_neighbor_table(
+        self, moore: bool, include_center: bool = False, radius: int = 1
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the neighborhoods of all cells as a table in compressed sparse row (CSR) format.
+
+        Cells are identified by their flat index in raster order, i.e., `row * width + col`,
+        which is also their position in a flattened (height, width) attribute array such as
+        `get_raster(attr_name)[0].ravel()`. The flat indices of the neighbors of cell `i` are
+        `indices[indptr[i]:indptr[i + 1]]`, in the same order as `get_neighborhood`.
+
+        The table is built once per kind of neighborhood, and reused afterwards.
+
+        :param bool moore: Whether to use Moore neighborhood or not.
+        :param bool include_center: Whether to include the cell itself. Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :return: The `indptr` array of length `width * height + 1`, and the int32
+            `indices` array of the table.
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+
+        key = (moore, include_center, radius)
+        table = self._neighbor_tables.get(key)
+        if table is None:
+            offsets = _neighborhood_offsets(moore, include_center, radius)
+            rows, cols = np.indices((self.height, self.width), dtype=np.int32)
+            rows, cols = rows.ravel(), cols.ravel()
+            valid = np.empty((len(offsets), rows.size), dtype=np.bool_)
+            neighbors = np.empty((len(offsets), rows.size), dtype=np.int32)
+            for i, (dx, dy) in enumerate(offsets):
+                # y points up whereas rows point down
+                neighbor_rows, neighbor_cols = rows - dy, cols + dx
+                valid[i] = (
+                    (neighbor_rows >= 0)
+                    & (neighbor_rows < self.height)
+                    & (neighbor_cols >= 0)
+                    & (neighbor_cols < self.width)
+                )
+                neighbors[i] = neighbor_rows * self.width + neighbor_cols
+            indptr = np.zeros(rows.size + 1, dtype=np.int64)
+            np.cumsum(valid.sum(axis=0), out=indptr[1:])
+            table = (indptr, neighbors.T[valid.T])
+            self._neighbor_tables[key] = table
+        return table
+
+    def get_neighboring_cells(
+        self,
+        pos: Coordinate,
+        moore: bool,
+        include_center: bool = False,
+        radius: int = 1,
+    ) -> list[Cell]:
+        neighboring_cell_idx = self.get_neighborhood(pos, moore, include_center, radius)
+        return [self.cells[idx[0]][idx[1]] for idx in neighboring_cell_idx]
+
+    def focal(
+        self,
+        attr_name: str,
+        op: str,
+        moore: bool = True,
+        include_center: bool = False,
+        radius: int = 1,
+        out: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Compute a statistic of an attribute over the neighborhood of every cell at once.
+
+        The neighborhood of a cell is the same as the one returned by `get_neighborhood`,
+        i.e., positions outside of the raster are not part of it. For example, with
+        `op="mean"` the result at each cell equals the mean of the attribute over
+        `get_neighboring_cells(cell.pos, moore, include_center, radius)`. Cells holding
+        the nodata value of the attribute are left out of the neighborhoods as well.
+        Those cells, and cells without neighbors with data, hold the nodata value in
+        the result, or nan for `op="mean"`.
+
+        :param str attr_name: Name of the attribute.
+        :param str op: The statistic to compute, one of "sum", "mean", "min" or "max".
+        :param bool moore: Whether to use Moore neighborhood or not. If True,
+            use Moore neighborhood (including diagonals). If False, use
+            Von Neumann neighborhood (exclude diagonals). Default is True.
+        :param bool include_center: If True, include the cell itself in its neighborhood.
+            Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :param np.ndarray | None out: Array with shape (1, height, width) to write the
+            result into. If None, a new array is returned. Default is None.
+        :return: The result as a numpy array with shape (1, height, width).
+            The mean is always float64, and the sum of integers is int64.
+        :rtype: np.ndarray
+        :raises ValueError: If the attribute or the operation does not exist.
+        """
+
+        if op not in ("sum", "mean", "min", "max"):
+            raise ValueError(
+                f"Unknown focal operation {op}. Choose from sum, mean, min or max."
+            )
+        if attr_name not in self.attributes:
+            raise ValueError(
+                f"Attribute {attr_name} does not exist. Choose from {self.attributes}."
+            )
+        values = np.asarray(self._get_attribute_array(attr_name))
+        nodata_mask = self._nodata_mask(attr_name)
+        if op == "mean":
+            dtype = np.dtype(np.float64)
+        elif op == "sum" and not np.issubdtype(values.dtype, np.inexact):
+            dtype = np.dtype(np.int64)
+        else:
+            dtype = values.dtype
+        if out is None:
+            out = np.empty((1, self.height, self.width), dtype=dtype)
+        result = out[0]
+
+        offsets = _neighborhood_offsets(moore, include_center, radius)
+        fill_value = 0 if op in ("sum", "mean") else _focal_identity(op, values.dtype)
+        if nodata_mask is not None:
+            # cells without data are treated like cells outside of the raster
+            values = np.where(nodata_mask, fill_value, values)
+        count = None
+        if op == "mean" or nodata_mask is not None:
+            # the number of neighbors with data of every cell
+            count = np.zeros((self.height, self.width), dtype=np.int64)
+            if nodata_mask is None:
+                inside = np.ones((self.height, self.width), dtype=np.bool_)
+            else:
+                inside = ~nodata_mask
+            for window in self._iter_shifted(inside, offsets, fill_value=False):
+                count += window
+        if op in ("sum", "mean"):
+            result.fill(0)
+            for window in self._iter_shifted(values, offsets, fill_value=0):
+                np.add(result, window, out=result, casting="unsafe")
+            if op == "mean":
+                np.divide(result, count, out=result, where=count > 0)
+                result[count == 0] = np.nan
+        else:
+            reduce = np.minimum if op == "min" else np.maximum
+            result.fill(fill_value)
+            for window in self._iter_shifted(values, offsets, fill_value=fill_value):
+                reduce(result, window, out=result, casting="unsafe")
+        if nodata_mask is not None:
+            # cells without data, or without neighbors with data, have no result
+            no_result = nodata_mask | (count == 0)
+            result[no_result] = np.nan if op == "mean" else self._nodata[attr_name]
+        return out
+
+    def _iter_shifted(
+        self, values: np.ndarray, offsets: Iterable[Coordinate], fill_value: Any
+    ) -> Iterator[np.ndarray]:
+        """
+        Yield, for each (dx, dy) offset, an array with shape (height, width) holding at
+        every cell the value of its neighbor at that offset, or `fill_value` where the
+        neighbor is outside of the raster.
+        """
+
+        offsets = tuple(offsets)
+        radius = max((max(abs(dx), abs(dy)) for dx, dy in offsets), default=0)
+        padded = np.pad(values, radius, constant_values=fill_value)
+        for dx, dy in offsets:
+            # y points up whereas rows point down
+            row_start, col_start = radius - dy, radius + dx
+            yield padded[
+                row_start : row_start + self.height, col_start : col_start + self.width
+            ]
+
+    def get_neighbor_stack(
+        self,
+        values: np.ndarray,
+        moore: bool = True,
+        include_center: bool = False,
+        radius: int = 1,
+        fill_value: Any = 0,
+    ) -> np.ndarray:
+        """
+        Stack the values of the neighbors of every cell, e.g., inside of a kernel
+        passed to `apply_kernel`.
+
+        :param np.ndarray values: Array with shape (height, width) in raster order.
+        :param bool moore: Whether to use Moore neighborhood or not. Default is True.
+        :param bool include_center: If True, include the cell itself in its neighborhood.
+            Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :param fill_value: The value of neighbors outside of the raster. Default is 0.
+        :return: An array with shape (k, height, width), where k is the size of the full
+            neighborhood, holding the neighbors in the same order as `get_neighborhood`.
+        :rtype: np.ndarray
+        :raises ValueError: If the shape of the values is not (height, width).
+        """
+
+        values = np.asarray(values)
+        if values.shape != (self.height, self.width):
+            raise ValueError(
+                f"Values shape does not match raster shape. "
+                f"Expected {(self.height, self.width)}, received {values.shape}."
+            )
+        offsets = _neighborhood_offsets(moore, include_center, radius)
+        return np.stack(list(self._iter_shifted(values, offsets, fill_value)))
+
+    def apply_kernel(
+        self,
+        fn: Callable[..., np.ndarray | Sequence[np.ndarray]],
+        inputs: Sequence[str],
+        outputs: Sequence[str],
+    ) -> None:
+        """
+        Update attributes of all cells at once, synchronously, with a function of whole
+        attribute arrays, e.g., a step of a cellular automaton:
+
+        .. code-block:: python
+
+            def grow(urban, suitability):
+                neighbors = layer.get_neighbor_stack(urban).sum(axis=0)
+                return urban | ((neighbors >= 3) & (suitability > 0.5))
+
+            layer.apply_kernel(grow, inputs=["urban", "suitability"], outputs=["urban"])
+
+        All results are computed from the values before the update, and only written to
+        the attributes at the end, so no kernel sees a partially updated attribute. They
+        are written into the existing attribute arrays if the dtype is unchanged, so
+        arrays returned by `get_raster` and `values` remain views of the attributes.
+
+        :param fn: A function called with one read-only array with shape (height, width)
+            per attribute in `inputs`, returning one array with shape (height, width)
+            per attribute in `outputs`, or a single array if there is one output.
+        :param Sequence[str] inputs: Names of the attributes passed to `fn`.
+        :param Sequence[str] outputs: Names of the attributes updated with the results of
+            `fn`. Attributes that do not exist yet are added.
+        :raises ValueError: If an input attribute does not exist, or if `fn` does not
+            return one array with shape (height, width) per output.
+        """
+
+        for name in inputs:
+            if name not in self.attributes:
+                raise ValueError(
+                    f"Attribute {name} does not exist. Choose from {self.attributes}."
+                )
+        arrays = []
+        for name in inputs:
+            array = np.asarray(self._get_attribute_array(name)).view()
+            array.flags.writeable = False
+            arrays.append(array)
+        results = fn(*arrays)
+        if len(outputs) == 1 and not isinstance(results, tuple | list):
+            results = (results,)
+        if len(results) != len(outputs):
+            raise ValueError(
+                f"Expected {len(outputs)} results from the kernel, received {len(results)}."
+            )
+        results = [np.asarray(result) for result in results]
+        for result in results:
+            if result.shape != (self.height, self.width):
+                raise ValueError(
+                    f"Result shape does not match raster shape. "
+                    f"Expected {(self.height, self.width)}, received {result.shape}."
+                )
+
+        # results that are views of an output, e.g., an unchanged input, are copied
+        # first, so that writing one output does not change the result of another
+        fronts = [
+            array
+            for array in map(self._attribute_arrays.get, outputs)
+            if isinstance(array, np.ndarray)
+        ]
+        results = [
+            result.copy()
+            if any(np.may_share_memory(result, front) for front in fronts)
+            else result
+            for result in results
+        ]
+        for name, result in zip(outputs, results):
+            self.apply_raster(
+                result[np.newaxis], attr_name=name, nodata=self._nodata.get(name)
+            )
+
+    def apply_algebra(
+        self,
+        fn: Callable[..., np.ndarray],
+        inputs: Sequence[str | tuple[RasterLayer, str]],
+        output: str,
+        nodata: Any = None,
+    ) -> None:
+        """
+        Compute an attribute of this layer from attributes of aligned raster layers,
+        e.g., a suitability from the slope, land cover and distance to roads of layers
+        sharing the same grid:
+
+        .. code-block:: python
+
+            def suitability(slope, land_cover, distance):
+                return (slope < 15) * (land_cover == 3) * np.exp(-distance / 1000)
+
+            suitability_layer.apply_algebra(
+                suitability,
+                inputs=[(terrain, "slope"), (land, "land_cover"), "distance"],
+                output="suitability",
+                nodata=-1,
+            )
+
+        The input arrays are views of the attribute arrays of array-backed layers rather
+        than copies, and the result is written into the existing array of the output
+        attribute if it has the same dtype.
+
+        :param fn: A function called with one read-only array with shape (height, width)
+            per attribute in `inputs`, returning an array with shape (height, width).
+        :param inputs: The attributes passed to `fn`, each given either by its name for an
+            attribute of this layer, or as a tuple of a layer and the name of one of its
+            attributes. Each layer must be aligned with this one, see `is_aligned`.
+        :param str output: Name of the attribute of this layer to write the result to.
+            It is added if it does not exist yet.
+        :param nodata: The nodata value of the output, which is written to the cells
+            holding the nodata value of any input. If None, the nodata value of the
+            output is kept, and the result is written as is. Default is None.
+        :raises ValueError: If a layer is not aligned with this one, if an input
+            attribute does not exist, or if `fn` does not return an array with shape
+            (height, width).
+        """
+
+        arrays = []
+        masks = []
+        for item in inputs:
+            layer, name = (self, item) if isinstance(item, str) else item
+            if not self.is_aligned(layer):
+                raise ValueError(
+                    f"The layer of attribute {name} is not aligned with this layer."
+                )
+            if name not in layer.attributes:
+                raise ValueError(
+                    f"Attribute {name} does not exist. Choose from {layer.attributes}."
+                )
+            array = np.asarray(layer._get_attribute_array(name)).view()
+            array.flags.writeable = False
+            arrays.append(array)
+            if nodata is not None:
+                mask = layer._nodata_mask(name)
+                if mask is not None:
+                    masks.append(mask)
+        result = np.asarray(fn(*arrays))
+        if result.shape != (self.height, self.width):
+            raise ValueError(
+                f"Result shape does not match raster shape. "
+                f"Expected {(self.height, self.width)}, received {result.shape}."
+            )
+        if masks:
+            mask = functools.reduce(np.logical_or, masks)
+            if result.flags.owndata and result.flags.writeable:
+                np.copyto(result, nodata, where=mask, casting="unsafe")
+            else:
+                result = np.where(mask, nodata, result).astype(result.dtype, copy=False)
+        self.apply_raster(
+            result[np.newaxis],
+            attr_name=output,
+            nodata=self._nodata.get(output) if nodata is None else nodata,
+        )
+
+    def apply_cell_kernel(
+        self,
+        fn: Callable[..., None],
+        inputs: Sequence[str],
+        outputs: Sequence[str],
+        moore: bool = True,
+        include_center: bool = False,
+        radius: int = 1,
+        jit: bool = True,
+    ) -> None:
+        """
+        Update attributes of all cells at once, synchronously, with a function called
+        for each cell, for rules that are hard to express with whole arrays as in
+        `apply_kernel`, e.g., stochastic transitions with branching:
+
+        .. code-block:: python
+
+            def spread(row, col, neighbors, inputs, outputs):
+                burning, draw = inputs
+                height, width = burning.shape
+                if burning[row, col]:
+                    return
+                for i in range(neighbors.shape[0]):
+                    r, c = row + neighbors[i, 0], col + neighbors[i, 1]
+                    if 0 <= r < height and 0 <= c < width and burning[r, c]:
+                        if draw[row, col] < 0.3:
+                            outputs[0][row, col] = True
+                        return
+
+            layer.apply_raster(model.rng.random((1, layer.height, layer.width)), "draw")
+            layer.apply_cell_kernel(spread, inputs=["burning", "draw"], outputs=["burning"])
+
+        If Numba is installed, `fn` is compiled, and the cells are processed in parallel
+        across rows. Otherwise, it runs as plain Python. For results that do not depend
+        on the order of the cells, draw random numbers beforehand, as above, instead of
+        inside of `fn`. As in `apply_kernel`, all cells read the values before the update.
+
+        :param fn: A function called as `fn(row, col, neighbors, inputs, outputs)` for
+            each cell, where `neighbors` is an int array with shape (k, 2) of the
+            (row, col) offsets of the neighborhood in the order of `get_neighborhood`,
+            `inputs` is a tuple of read-only arrays with shape (height, width) of the
+            attributes in `inputs`, and `outputs` a tuple of arrays of the attributes
+            in `outputs`, holding their values before the update. It may only write
+            to the cell at `row` and `col` of the outputs.
+        :param Sequence[str] inputs: Names of the attributes passed to `fn`.
+        :param Sequence[str] outputs: Names of the existing attributes updated by `fn`.
+        :param bool moore: Whether to use Moore neighborhood or not. Default is True.
+        :param bool include_center: If True, include the cell itself in its neighborhood.
+            Default is False.
+        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
+        :param bool jit: Whether to compile `fn` with Numba if it is installed.
+            Default is True.
+        :raises ValueError: If there are no outputs, or if an attribute does not exist.
+        """
+
+        if not outputs:
+            raise ValueError("At least one output attribute is required.")
+        for name in outputs:
+            if name not in self.attributes:
+                raise ValueError(
+                    f"Attribute {name} does not exist. Choose from {self.attributes}."
+                )
+        neighbors = np.array(
+            [
+                (-dy, dx)
+                for dx, dy in _neighborhood_offsets(moore, include_center, radius)
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        loop = _compile_cell_loop(fn, jit)
+        num_inputs = len(inputs)
+
+        def kernel(*arrays):
+            # the outputs start as writable copies of their values before the update
+            results = tuple(np.array(array) for array in arrays[num_inputs:])
+            loop(neighbors, arrays[:num_inputs], results)
+            return results
+
+        self.apply_kernel(kernel, [*inputs, *outputs], outputs)
+
+    def get_flow_direction(self, attr_name: str | Sequence[str]) -> np.ndarray:
+        """
+        Return the D8 flow direction of every cell, i.e., the Moore neighbor with the
+        steepest descent of a surface such as elevation.
+
+        The flow directions of an array-backed layer are kept until the layer is
+        modified. When only a few cells change, e.g., the water level of some cells
+        of a surface made up of elevation and water level, use `update_flow_direction`
+        to update the directions around them instead of recomputing all of them.
+
+        :param str | Sequence[str] attr_name: Name of the attribute holding the surface,
+            or names of several attributes that add up to the surface. Cells holding the
+            nodata value of any of them neither flow nor receive flow.
+        :return: A read-only int array with shape (1, height, width) holding the flat
+            index `row * width + col` of the neighbor each cell flows to, or -1 for
+            cells without a lower neighbor, such as pits, flats and outlets at the edge.
+            Slopes are measured in the units of the crs.
+        :rtype: np.ndarray
+        :raises ValueError: If an attribute does not exist.
+        """
+
+        key = self._flow_key(attr_name)
+        entry = self._flow_directions.get(key)
+        if entry is None or entry[0] != self._version or not self._array_backed:
+            surface = self._flow_surface(key)
+            directions = _steepest_descent(surface, self.resolution)
+            directions.flags.writeable = False
+            entry = (self._version, surface, directions)
+            self._flow_directions[key] = entry
+        return entry[2][np.newaxis]
+
+    def update_flow_direction(
+        self,
+        attr_name: str | Sequence[str],
+        positions: np.ndarray | Sequence[Coordinate],
+    ) -> None:
+        """
+        Update the flow directions returned by `get_flow_direction` after the surface
+        has changed only at the given positions.
+
+        Only the directions of these cells and of their neighbors are recomputed, so all
+        other changes to the layer since the directions were last computed are ignored.
+
+        :param str | Sequence[str] attr_name: Name of the attribute holding the surface,
+            or names of several attributes that add up to the surface.
+        :param np.ndarray | Sequence[Coordinate] positions: Array-like with shape (n, 2)
+            of the (x, y) positions at which the surface has changed.
+        :raises ValueError: If an attribute does not exist.
+        """
+
+        key = self._flow_key(attr_name)
+        if key not in self._flow_directions:
+            self.get_flow_direction(key)
+            return
+        _, surface, directions = self._flow_directions[key]
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        changed = (self.height - 1 - positions[:, 1], positions[:, 0])
+        surface[changed] = self._flow_surface(key, changed)
+        neighbor_x, neighbor_y, valid = self._batch_neighborhoods(
+            positions, moore=True, include_center=True, radius=1
+        )
+        flat = np.unique(
+            (self.height - 1 - neighbor_y[valid]) * self.width + neighbor_x[valid]
+        )
+        rows, cols = np.divmod(flat, self.width)
+        directions.flags.writeable = True
+        directions[rows, cols] = _steepest_descent(surface, self.resolution, rows, cols)
+        directions.flags.writeable = False
+        self._flow_directions[key] = (self._version, surface, directions)
+
+    def get_flow_accumulation(
+        self, attr_name: str | Sequence[str], weights: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        Return the flow accumulation of every cell, i.e., the number of cells, including
+        itself, whose flow passes through it along the directions of `get_flow_direction`.
+
+        :param str | Sequence[str] attr_name: Name of the attribute holding the surface,
+            or names of several attributes that add up to the surface.
+        :param np.ndarray | None weights: Array with shape (1, height, width) of the
+            amount contributed by each cell, e.g., rainfall, instead of one per cell.
+            Default is None.
+        :return: A float array with shape (1, height, width). Cells holding nodata
+            do not contribute.
+        :rtype: np.ndarray
+        :raises ValueError: If an attribute does not exist, or if the shape of the weights
+            is not (1, height, width).
+        """
+
+        directions = self.get_flow_direction(attr_name).ravel()
+        if weights is None:
+            weights = np.ones(directions.size)
+        elif weights.shape != (1, self.height, self.width):
+            raise ValueError(
+                f"Weights shape does not match raster shape. "
+                f"Expected {(1, self.height, self.width)}, received {weights.shape}."
+            )
+        surface = self._flow_directions[self._flow_key(attr_name)][1]
+        weights = np.where(np.isnan(surface.ravel()), 0, weights.ravel())
+        accumulation = _flow_accumulation(directions, weights)
+        return accumulation.reshape(1, self.height, self.width)
+
+    def flow_downstream(
+        self,
+        positions: np.ndarray | Sequence[Coordinate],
+        attr_name: str | Sequence[str],
+        steps: int = 1,
+    ) -> np.ndarray:
+        """
+        Move many positions at once along the flow directions of `get_flow_direction`,
+        e.g., to advance all raindrops of a model in one call.
+
+        :param np.ndarray | Sequence[Coordinate] positions: Array-like with shape (n, 2)
+            of (x, y) positions.
+        :param str | Sequence[str] attr_name: Name of the attribute holding the surface,
+            or names of several attributes that add up to the surface.
+        :param int steps: The number of cells to move downstream. Positions stay at
+            cells without a lower neighbor. Default is 1.
+        :return: An int array with shape (n, 2) of the (x, y) positions after moving.
+        :rtype: np.ndarray
+        :raises ValueError: If an attribute does not exist, or if a position is
+            outside of the raster.
+        """
+
+        directions = self.get_flow_direction(attr_name).ravel()
+        flat = self._flat_indices(positions)
+        for _ in range(steps):
+            downstream = directions[flat]
+            flat = np.where(downstream >= 0, downstream, flat)
+        rows, cols = np.divmod(flat, self.width)
+        return np.stack((cols, self.height - 1 - rows), axis=-1)
+
+    def _flow_key(self, attr_name: str | Sequence[str]) -> tuple[str, ...]:
+        key = (attr_name,) if isinstance(attr_name, str) else tuple(attr_name)
+        for name in key:
+            if name not in self.attributes:
+                raise ValueError(
+                    f"Attribute {name} does not exist. Choose from {self.attributes}."
+                )
+        return key
+
+    def _flow_surface(
+        self, key: tuple[str, ...], indices: Any = Ellipsis
+    ) -> np.ndarray:
+        """
+        Return the sum of the attributes in `key` at `indices` as floats, with nan in
+        cells holding the nodata value of any of them.
+        """
+
+        surface = None
+        for name in key:
+            values = np.asarray(self._get_attribute_array(name)[indices])
+            nodata = self._nodata.get(name)
+            if nodata is not None:
+                values = np.where(values == nodata, np.nan, values)
+            values = values.astype(np.float64)
+            surface = values if surface is None else surface + values
+        return surface
+
+    def get_distance_transform(
+        self, sources: np.ndarray | Sequence[Coordinate]
+    ) -> np.ndarray:
+        """
+        Return the Euclidean distance from every cell to the nearest source, in the
+        units of the crs, e.g., the distance of every cell to the nearest shelter.
+
+        The result is kept until the sources or the grid of the layer change.
+
+        :param np.ndarray | Sequence[Coordinate] sources: Array-like with shape (n, 2)
+            of (x, y) positions of the sources, or a boolean array with shape
+            (1, height, width) that is True at the sources.
+        :return: A read-only float array with shape (1, height, width).
+        :rtype: np.ndarray
+        :raises ValueError: If there are no sources, or if a source is outside of
+            the raster.
+        """
+
+        flat = self._source_indices(sources)
+        key = ("euclidean",)
+        grid = (self.width, self.height, self.transform)
+        entry = self._distance_surfaces.get(key)
+        if entry is None or entry[0] != grid or not np.array_equal(entry[1], flat):
+            is_background = np.ones(self.height * self.width, dtype=np.bool_)
+            is_background[flat] = False
+            res_x, res_y = self.resolution
+            distances = ndimage.distance_transform_edt(
+                is_background.reshape(self.height, self.width), sampling=(res_y, res_x)
+            )
+            distances.flags.writeable = False
+            entry = (grid, flat, distances, None)
+            self._distance_surfaces[key] = entry
+        return entry[2][np.newaxis]
+
+    def get_cost_distance(
+        self,
+        attr_name: str,
+        sources: np.ndarray | Sequence[Coordinate],
+        moore: bool = True,
+    ) -> np.ndarray:
+        """
+        Return the accumulated cost of the least-cost path from every cell to the nearest
+        source over a cost surface, e.g., the effort of walking to the nearest water.
+
+        Moving between two neighboring cells costs the distance between their centers,
+        in the units of the crs, times the mean of their costs. For an array-backed layer,
+        the result is kept until the layer is modified or the sources change, and shared
+        by `trace_cost_paths` and `get_cost_path`.
+
+        :param str attr_name: Name of the attribute holding the cost of crossing a cell.
+            Cells holding its nodata value, nan or inf cannot be crossed.
+        :param np.ndarray | Sequence[Coordinate] sources: Array-like with shape (n, 2)
+            of (x, y) positions of the sources, or a boolean array with shape
+            (1, height, width) that is True at the sources.
+        :param bool moore: Whether paths may move diagonally. Default is True.
+        :return: A read-only float array with shape (1, height, width), which is inf
+            for cells from which no source can be reached.
+        :rtype: np.ndarray
+        :raises ValueError: If the attribute does not exist, if a cost is negative, if
+            there are no sources, or if a source is outside of the raster.
+        """
+
+        return self._cost_surface(attr_name, sources, moore)[0][np.newaxis]
+
+    def trace_cost_paths(
+        self,
+        positions: np.ndarray | Sequence[Coordinate],
+        attr_name: str,
+        sources: np.ndarray | Sequence[Coordinate],
+        moore: bool = True,
+        steps: int = 1,
+    ) -> np.ndarray:
+        """
+        Move many positions at once along their least-cost paths to the nearest source,
+        as found by `get_cost_distance`, e.g., to advance all evacuating agents by one
+        cell in one call.
+
+        :param np.ndarray | Sequence[Coordinate] positions: Array-like with shape (n, 2)
+            of (x, y) positions.
+        :param str attr_name: Name of the attribute holding the cost of crossing a cell.
+        :param np.ndarray | Sequence[Coordinate] sources: The sources, as for
+            `get_cost_distance`.
+        :param bool moore: Whether paths may move diagonally. Default is True.
+        :param int steps: The number of cells to move. Positions stay at sources and at
+            cells from which no source can be reached. Default is 1.
+        :return: An int array with shape (n, 2) of the (x, y) positions after moving.
+        :rtype: np.ndarray
+        :raises ValueError: As `get_cost_distance`, or if a position is outside of
+            the raster.
+        """
+
+        predecessors = self._cost_surface(attr_name, sources, moore)[1]
+        flat = self._flat_indices(positions)
+        for _ in range(steps):
+            previous = predecessors[flat]
+            flat = np.where(previous >= 0, previous, flat)
+        rows, cols = np.divmod(flat, self.width)
+        return np.stack((cols, self.height - 1 - rows), axis=-1)
+
+    def get_cost_path(
+        self,
+        pos: Coordinate,
+        attr_name: str,
+        sources: np.ndarray | Sequence[Coordinate],
+        moore: bool = True,
+    ) -> list[Coordinate]:
+        """
+        Return the least-cost path from a position to the nearest source, as found by
+        `get_cost_distance`.
+
+        :param Coordinate pos: The (x, y) position to start from.
+        :param str attr_name: Name of the attribute holding the cost of crossing a cell.
+        :param np.ndarray | Sequence[Coordinate] sources: The sources, as for
+            `get_cost_distance`.
+        :param bool moore: Whether paths may move diagonally. Default is True.
+        :return: The (x, y) positions of the path, from `pos` to the source, or only
+            `pos` if no source can be reached from it.
+        :rtype: List[Coordinate]
+        :raises ValueError: As `get_cost_distance`, or if the position is outside of
+            the raster.
+        """
+
+        predecessors = self._cost_surface(attr_name, sources, moore)[1]
+        flat = int(self._flat_indices([pos])[0])
+        path = [divmod(flat, self.width)]
+        while predecessors[flat] >= 0:
+            flat = int(predecessors[flat])
+            path.append(divmod(flat, self.width))
+        return [(col, self.height - 1 - row) for row, col in path]
+
+    def _flat_indices(self, positions: np.ndarray | Sequence[Coordinate]) -> np.ndarray:
+        """
+        Return the flat indices `row * width + col` of (x, y) positions.
+        """
+
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        x, y = positions[:, 0], positions[:, 1]
+        if np.any((x < 0) | (x >= self.width) | (y < 0) | (y >= self.height)):
+            raise ValueError("Positions must be inside of the raster.")
+        return (self.height - 1 - y) * self.width + x
+
+    def _source_indices(self, sources: np.ndarray | Sequence[Coordinate]) -> np.ndarray:
+        """
+        Return the sorted, unique flat indices of sources given as positions or a mask.
+        """
+
+        sources = np.asarray(sources)
+        if sources.dtype == np.bool_:
+            if sources.shape != (1, self.height, self.width):
+                raise ValueError(
+                    f"Sources shape does not match raster shape. "
+                    f"Expected {(1, self.height, self.width)}, received {sources.shape}."
+                )
+            flat = np.flatnonzero(sources)
+        else:
+            flat = np.unique(self._flat_indices(sources))
+        if not flat.size:
+            raise ValueError("At least one source is required.")
+        return flat
+
+    def _cost_surface(
+        self,
+        attr_name: str,
+        sources: np.ndarray | Sequence[Coordinate],
+        moore: bool,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the accumulated costs with shape (height, width) and the flat index of
+        the next cell towards the nearest source of every cell, or -1 if there is none,
+        computed with Dijkstra's algorithm from all sources at once.
+        """
+
+        if attr_name not in self.attributes:
+            raise ValueError(
+                f"Attribute {attr_name} does not exist. Choose from {self.attributes}."
+            )
+        flat = self._source_indices(sources)
+        key = ("cost", attr_name, moore)
+        entry = self._distance_surfaces.get(key)
+        if (
+            entry is not None
+            and self._array_backed
+            and entry[0] == self._version
+            and np.array_equal(entry[1], flat)
+        ):
+            return entry[2], entry[3]
+
+        costs = np.asarray(self._get_attribute_array(attr_name), dtype=np.float64)
+        costs = costs.ravel()
+        nodata_mask = self._nodata_mask(attr_name)
+        if nodata_mask is not None:
+            costs = np.where(nodata_mask.ravel(), np.inf, costs)
+        if np.any(costs < 0):
+            raise ValueError("Costs must not be negative.")
+        indptr, neighbors = self.get_neighbor_table(moore)
+        cells = np.repeat(np.arange(costs.size), np.diff(indptr))
+        rows, cols = np.divmod(cells, self.width)
+        neighbor_rows, neighbor_cols = np.divmod(neighbors, self.width)
+        res_x, res_y = self.resolution
+        lengths = np.hypot(
+            (neighbor_cols - cols) * res_x, (neighbor_rows - rows) * res_y
+        )
+        weights = lengths * (costs[cells] + costs[neighbors]) / 2
+        # edges from or to cells that cannot be crossed are left out
+        passable = np.isfinite(weights)
+        graph = sparse.csr_matrix(
+            (weights[passable], (cells[passable], neighbors[passable])),
+            shape=(costs.size, costs.size),
+        )
+        distances, predecessors, _ = dijkstra(
+            graph, indices=flat, min_only=True, return_predecessors=True
+        )
+        distances = distances.reshape(self.height, self.width)
+        predecessors = np.where(predecessors < 0, -1, predecessors).astype(np.int64)
+        distances.flags.writeable = False
+        predecessors.flags.writeable = False
+        self._distance_surfaces[key] = (self._version, flat, distances, predecessors)
+        return distances, predecessors
+
+    def build_overviews(
+        self,
+        attr_name: str,
+        factors: Sequence[int] = (2, 4, 8),
+        aggregation: str = "mean",
+    ) -> None:
+        """
+        Build overview levels of an attribute, each decimated by one of `factors`,
+        for multi-resolution access through `get_overview`.
+
+        The levels are kept by an array-backed layer, and rebuilt lazily on access
+        once the layer has been modified. In object mode, they are built on each access.
+
+        :param str attr_name: Name of the attribute.
+        :param Sequence[int] factors: The decimation factors of the levels, e.g.,
+            a factor of 2 aggregates blocks of 2 x 2 cells. Default is (2, 4, 8).
+        :param str aggregation: How the values of a block are aggregated. One of
+            "mean", "sum", "min", "max" and "nearest", which takes the value of the
+            top-left cell of the block. Cells holding the nodata value of the attribute
+            are left out. Default is "mean".
+        :raises ValueError: If the attribute does not exist, or if the factors or
+            aggregation are invalid.
+        """
+
+        if attr_name not in self.attributes:
+            raise ValueError(
+                f"Attribute {attr_name} does not exist. Choose from {self.attributes}."
+            )
+        self._set_overview_levels(attr_name, factors, aggregation)
+        if self._array_backed:
+            self.get_overview(attr_name, self._overview_levels[attr_name][0][0])
+
+    def get_overview(self, attr_name: str, factor: int) -> np.ndarray:
+        """
+        Return an overview level of an attribute built by `build_overviews`.
 
-        yield from self.get_neighborhood(pos, moore, include_center, radius)
+        :param str attr_name: Name of the attribute.
+        :param int factor: The decimation factor of the level.
+        :return: The aggregated values as a read-only numpy array with shape
+            (1, ceil(height / factor), ceil(width / factor)). Its georeferencing is
+            given by `get_overview_transform(factor)`.
+        :rtype: np.ndarray
+        :raises ValueError: If no overviews of the attribute with this factor exist.
+        """
 
-    def iter_neighbors(
+        values = self._get_overview_values(
+            attr_name,
+            factor,
+            lambda: np.asarray(self._get_attribute_array(attr_name)),
+            nodata=self._nodata.get(attr_name),
+            tracked=self._array_backed,
+        )
+        return values[np.newaxis]
+
+    def coarsen(
         self,
-        pos: Coordinate,
-        moore: bool,
-        include_center: bool = False,
-        radius: int = 1,
-    ) -> Iterator[Cell]:
+        factor: int,
+        how: str = "mean",
+        attr_name: str | Sequence[str] | None = None,
+    ) -> RasterLayer:
         """
-        Return an iterator over neighbors to a certain point.
+        Create a coarser raster layer, each of whose cells aggregates a block of
+        `factor` x `factor` cells of this layer.
 
-        :param Coordinate pos: Coordinate tuple for the neighborhood to get.
-        :param bool moore: Whether to use Moore neighborhood or not. If True,
-            return Moore neighborhood (including diagonals). If False, return
-            Von Neumann neighborhood (exclude diagonals).
-        :param bool include_center: If True, return the (x, y) cell as well.
-            Otherwise, return surrounding cells only. Default is False.
-        :param int radius: Radius, in cells, of the neighborhood. Default is 1.
-        :return: An iterator of cells that are in the neighborhood; at most 9 (8)
-            if Moore, 5 (4) if Von Neumann (if not including the center).
-        :rtype: Iterator[Cell]
+        If the width or height of the layer is not a multiple of `factor`, the last
+        column or row of the new layer covers a partial block, and extends beyond the
+        bounds of this layer.
+
+        :param int factor: The number of cells along each side of a block.
+        :param str how: How the values of a block are aggregated. One of "mean", "sum",
+            "min", "max", "nearest", which takes the value of the top-left cell of the
+            block, and "mode", which takes the most frequent value, e.g., for land cover
+            classes. Cells holding the nodata value of an attribute are left out.
+            Default is "mean".
+        :param str | Sequence[str] | None attr_name: The name of the attribute, or the
+            names of the attributes, to aggregate. If None, all attributes are
+            aggregated. Default is None.
+        :return: A new raster layer with the same model, cell class and storage mode,
+            which keeps its attributes in memory.
+        :rtype: RasterLayer
+        :raises ValueError: If the factor or aggregation is invalid, or if an attribute
+            does not exist.
         """
 
-        neighborhood = self.get_neighborhood(pos, moore, include_center, radius)
-        return self.iter_cell_list_contents(neighborhood)
+        if how not in (*_OVERVIEW_AGGREGATIONS, "mode"):
+            raise ValueError(
+                f"Unknown aggregation {how}. "
+                f"Choose from {', '.join(_OVERVIEW_AGGREGATIONS)}, mode."
+            )
+        self._check_factor(factor)
+        width, height = -(-self.width // factor), -(-self.height // factor)
+        layer = self._new_layer(
+            width, height, self.crs, self.get_overview_transform(factor)
+        )
+        for name in self._attribute_names(attr_name):
+            values = np.asarray(self._get_attribute_array(name))
+            nodata = self._nodata.get(name)
+            if how == "mode":
+                coarse = _block_mode(values, factor, nodata)
+            else:
+                coarse = _build_overviews(values, (factor,), how, nodata)[factor]
+            layer.apply_raster(coarse[np.newaxis], attr_name=name, nodata=nodata)
+        return layer
 
-    @accept_tuple_argument
-    def iter_cell_list_contents(
-        self, cell_list: Iterable[Coordinate]
-    ) -> Iterator[Cell]:
+    def refine(
+        self, factor: int, attr_name: str | Sequence[str] | None = None
+    ) -> RasterLayer:
         """
-        Returns an iterator of the contents of the cells
-        identified in cell_list.
+        Create a finer raster layer over the same bounds, in which each cell of this
+        layer is split into `factor` x `factor` cells holding its values.
 
-        :param Iterable[Coordinate] cell_list: Array-like of (x, y) tuples,
-            or single tuple.
-        :return: An iterator of the contents of the cells identified in cell_list.
-        :rtype: Iterator[Cell]
+        For other resampling methods, such as bilinear interpolation, create the finer
+        layer and use `resample_to` instead.
+
+        :param int factor: The number of cells each cell is split into along each side.
+        :param str | Sequence[str] | None attr_name: The name of the attribute, or the
+            names of the attributes, to copy. If None, all attributes are copied.
+            Default is None.
+        :return: A new raster layer with the same model, cell class and storage mode,
+            which keeps its attributes in memory.
+        :rtype: RasterLayer
+        :raises ValueError: If the factor is invalid, or if an attribute does not exist.
         """
 
-        # Note: filter(None, iterator) filters away an element of iterator that
-        # is falsy. Hence, iter_cell_list_contents returns only non-empty
-        # contents.
-        return filter(None, (self.cells[x][y] for x, y in cell_list))
+        self._check_factor(factor)
+        layer = self._new_layer(
+            self.width * factor,
+            self.height * factor,
+            self.crs,
+            self.transform @ Affine.scale(1 / factor),
+        )
+        for name in self._attribute_names(attr_name):
+            values = np.asarray(self._get_attribute_array(name))
+            fine = values.repeat(factor, axis=0).repeat(factor, axis=1)
+            layer.apply_raster(
+                fine[np.newaxis], attr_name=name, nodata=self._nodata.get(name)
+            )
+        return layer
 
-    @accept_tuple_argument
-    def get_cell_list_contents(self, cell_list: Iterable[Coordinate]) -> list[Cell]:
+    def resample_to(
+        self,
+        layer: RasterLayer,
+        attr_name: str | Sequence[str] | None = None,
+        resampling: Resampling = Resampling.nearest,
+        num_threads: int = 1,
+    ) -> None:
         """
-        Returns a list of the contents of the cells
-        identified in cell_list.
+        Resample attributes of this layer onto the grid of another raster layer, which
+        may have a different resolution, extent and crs, and add them to it.
 
-        Note: this method returns a list of cells.
+        For example, to give each cell of a fine land cover layer the temperature of
+        a coarse climate layer, interpolated bilinearly:
 
-        :param Iterable[Coordinate] cell_list: Array-like of (x, y) tuples,
-            or single tuple.
-        :return: A list of the contents of the cells identified in cell_list.
-        :rtype: List[Cell]
+        .. code-block:: python
+
+            climate.resample_to(
+                land_cover, attr_name="temperature", resampling=Resampling.bilinear
+            )
+
+        Cells of `layer` outside of the area covered by this layer hold the nodata value
+        of an attribute, which is assigned as in `to_crs` if it has none.
+
+        :param RasterLayer layer: The raster layer to add the attributes to. Attributes
+            of the same name are overwritten.
+        :param str | Sequence[str] | None attr_name: The name of the attribute, or the
+            names of the attributes, to resample. If None, all attributes are resampled.
+            Default is None.
+        :param Resampling resampling: The resampling method, see `rasterio.warp.Resampling`.
+            Default is nearest neighbor.
+        :param int num_threads: The number of threads used for warping. Default is 1.
+        :raises ValueError: If an attribute does not exist.
+        :raises TypeError: If the crs of either layer is missing.
         """
 
-        return list(self.iter_cell_list_contents(cell_list))
+        self._to_crs_check(layer.crs)
+        names = self._attribute_names(attr_name)
+        dst_arrays = self._reproject_attributes(
+            names,
+            rio.crs.CRS.from_user_input(layer.crs),
+            layer.transform,
+            layer.width,
+            layer.height,
+            resampling,
+            num_threads,
+        )
+        for name in names:
+            values, nodata = dst_arrays[name]
+            layer.apply_raster(values[np.newaxis], attr_name=name, nodata=nodata)
 
-    def get_neighborhood(
-        self,
-        pos: Coordinate,
-        moore: bool,
-        include_center: bool = False,
-        radius: int = 1,
-    ) -> list[Coordinate]:
-        cache_key = (pos, moore, include_center, radius)
-        neighborhood = self._neighborhood_cache.get(cache_key, None)
+    def _check_factor(self, factor: int) -> None:
+        if not isinstance(factor, int | np.integer) or factor < 1:
+            raise ValueError(f"Factor must be a positive integer, received {factor}.")
 
-        if neighborhood is None:
-            coordinates: set[Coordinate] = set()
+    def _attribute_names(self, attr_name: str | Sequence[str] | None) -> list[str]:
+        if attr_name is None:
+            return sorted(self.attributes)
+        attr_names = [attr_name] if isinstance(attr_name, str) else list(attr_name)
+        for name in attr_names:
+            if name not in self.attributes:
+                raise ValueError(
+                    f"Attribute {name} does not exist. Choose from {self.attributes}."
+                )
+        return attr_names
+
+    def _new_layer(
+        self,
+        width: int,
+        height: int,
+        crs: Any,
+        transform: Affine,
+        lazy: bool | None = None,
+    ) -> RasterLayer:
+        """
+        Create an empty raster layer on the grid given by `transform` with the model,
+        cell class and storage mode of this layer, but without its `memmap_dir`.
+        If `lazy` is given, it overrides whether the new layer is lazy.
+        """
 
-            x, y = pos
-            for dy in range(-radius, radius + 1):
-                for dx in range(-radius, radius + 1):
-                    if dx == 0 and dy == 0 and not include_center:
-                        continue
-                    # Skip coordinates that are outside manhattan distance
-                    if not moore and abs(dx) + abs(dy) > radius:
-                        continue
+        lazy = self._lazy if lazy is None else lazy
 
-                    coord = (x + dx, y + dy)
+        layer = self.__class__(
+            width,
+            height,
+            crs,
+            [*rio.transform.array_bounds(height, width, transform)],
+            self.model,
+            self.cell_cls,
+            array_backed=self._array_backed,
+            lazy=lazy,
+            max_cells=self._max_cells if lazy else None,
+        )
+        layer._transform = transform
+        return layer
 
-                    if self.out_of_bounds(coord):
-                        continue
-                    coordinates.add(coord)
+    def _reproject_attributes(
+        self,
+        attr_names: Sequence[str],
+        dst_crs: rio.crs.CRS,
+        dst_transform: Affine,
+        dst_width: int,
+        dst_height: int,
+        resampling: Resampling,
+        num_threads: int,
+    ) -> dict[str, tuple[np.ndarray, Any]]:
+        """
+        Resample the values of attributes onto the grid given by `dst_transform`,
+        `dst_width` and `dst_height` in `dst_crs`. Attributes sharing a dtype and
+        nodata value are resampled together in one call.
 
-            neighborhood = sorted(coordinates)
-            self._neighborhood_cache[cache_key] = neighborhood
+        Return the resampled values of each attribute together with its nodata value,
+        which cells outside of the area covered by this layer hold. Attributes without
+        a nodata value are given one by `_spare_nodata` if possible, and hold 0 there
+        otherwise.
+        """
 
-        return neighborhood
+        src_crs = rio.crs.CRS.from_user_input(self.crs)
+        groups: dict[tuple[np.dtype, Any], list[str]] = {}
+        for name in attr_names:
+            values = self._get_attribute_array(name)
+            groups.setdefault((values.dtype, self._nodata.get(name)), []).append(name)
+        dst_arrays = {}
+        for (dtype, src_nodata), names in groups.items():
+            # GDAL has no boolean data type
+            work_dtype = np.uint8 if dtype == np.bool_ else dtype
+            source = np.stack(
+                [np.asarray(self._get_attribute_array(name)) for name in names]
+            )
+            nodata = _spare_nodata(source) if src_nodata is None else src_nodata
+            source = source.astype(work_dtype, copy=False)
+            destination = np.full(
+                (len(names), dst_height, dst_width),
+                0 if nodata is None else nodata,
+                dtype=work_dtype,
+            )
+            reproject(
+                source=source,
+                destination=destination,
+                src_transform=self.transform,
+                src_crs=src_crs,
+                src_nodata=src_nodata,
+                dst_transform=dst_transform,
+                dst_crs=dst_crs,
+                dst_nodata=nodata,
+                resampling=resampling,
+                num_threads=num_threads,
+            )
+            for name, values in zip(names, destination.astype(dtype, copy=False)):
+                dst_arrays[name] = (values, nodata)
+        return dst_arrays
 
-    def get_neighboring_cells(
+    def to_crs(
         self,
-        pos: Coordinate,
-        moore: bool,
-        include_center: bool = False,
-        radius: int = 1,
-    ) -> list[Cell]:
-        neighboring_cell_idx = self.get_neighborhood(pos, moore, include_center, radius)
-        return [self.cells[idx[0]][idx[1]] for idx in neighboring_cell_idx]
+        crs,
+        inplace=False,
+        resampling: Resampling = Resampling.nearest,
+        num_threads: int = 1,
+    ) -> RasterLayer | None:
+        """
+        Transform the raster layer to a new coordinate reference system.
 
-    def to_crs(self, crs, inplace=False) -> RasterLayer | None:
-        super()._to_crs_check(crs)
-        layer = self if inplace else copy.copy(self)
+        The values of all attributes are resampled onto a new grid in the target crs,
+        whose width and height may differ from those of the original grid, and the cells
+        are created anew. Attributes sharing a dtype and nodata value are reprojected
+        together in one call.
 
-        src_crs = rio.crs.CRS.from_user_input(layer.crs)
+        Cells of the new grid outside of the area covered by the original one hold the
+        nodata value of an attribute. Attributes without one are given one: nan for
+        floating-point attributes, and the smallest or largest integer that does not
+        occur in integer attributes. Boolean attributes are False there.
+
+        :param crs: The coordinate reference system to transform to.
+        :param inplace: Whether to transform the raster layer in place or return a new
+            one. When transformed in place, the old cells are removed from the model.
+            Default is False.
+        :param Resampling resampling: The resampling method, see `rasterio.warp.Resampling`.
+            Default is nearest neighbor.
+        :param int num_threads: The number of threads used for warping. Default is 1.
+        :return: The transformed raster layer if not inplace. A new layer is lazy, so
+            that its cells are only created, and added to the model, when accessed. It
+            does not share the `memmap_dir` of the original one, and keeps its attributes
+            in memory.
+            For an array-backed layer, the new layer is cached, and returned again by
+            later calls with the same `crs` and `resampling` until either layer is
+            modified. Writes into the arrays returned by `get_raster` are not tracked.
+        :rtype: RasterLayer | None
+        """
+
+        super()._to_crs_check(crs)
+        use_cache = not inplace and self._array_backed
+        if use_cache:
+            key = self._reprojection_key(crs, resampling)
+            cached = self._get_cached_reprojection(key)
+            if cached is not None:
+                return cached
+        src_crs = rio.crs.CRS.from_user_input(self.crs)
         dst_crs = rio.crs.CRS.from_user_input(crs)
-        if not layer.crs.is_exact_same(crs):
+        if self.crs.is_exact_same(crs):
+            layer = self if inplace else copy.copy(self)
+            layer._detach_caches()
+        else:
             transform, dst_width, dst_height = calculate_default_transform(
                 src_crs,
                 dst_crs,
                 self.width,
                 self.height,
-                *layer.total_bounds,
+                *self.total_bounds,
             )
-            layer._total_bounds = [
-                *transform_bounds(src_crs, dst_crs, *layer.total_bounds)
-            ]
-            layer.crs = crs
-            layer._transform = transform
+            dst_arrays = self._reproject_attributes(
+                sorted(self.attributes),
+                dst_crs,
+                transform,
+                dst_width,
+                dst_height,
+                resampling,
+                num_threads,
+            )
+
+            total_bounds = [*transform_bounds(src_crs, dst_crs, *self.total_bounds)]
+            if inplace:
+                layer = self
+                layer._detach_caches()
+                for cell in self._iter_materialized_cells():
+                    if isinstance(cell, Agent):
+                        cell.remove()
+                layer.crs = crs
+                layer._width, layer._height = dst_width, dst_height
+                layer._transform = transform
+                layer._reset_grid()
+            else:
+                # a lazy layer, so that no cells are added to the model up front
+                layer = self._new_layer(
+                    dst_width, dst_height, crs, transform, lazy=True
+                )
+                layer._overview_levels = dict(self._overview_levels)
+            layer._total_bounds = total_bounds
+            for name, (values, nodata) in dst_arrays.items():
+                layer.apply_raster(values[np.newaxis], attr_name=name, nodata=nodata)
+            if not inplace:
+                for name, (tile_size, _) in self._change_tiles.items():
+                    layer.track_changes(name, tile_size)
 
+        if use_cache:
+            self._cache_reprojection(key, layer)
         if not inplace:
             return layer
 
-    def to_image(self, colormap) -> ImageLayer:
+    def _reset_grid(self) -> None:
+        """
+        Create new cells for the current width and height of the layer, and discard
+        its attributes and everything derived from the old grid.
+        """
+
+        self._attribute_arrays = {}
+        self._attributes = set()
+        self._nodata = {}
+        self._raster_order_cells_cache = None
+        self._neighborhood_cache = collections.OrderedDict()
+        self._neighbor_tables = {}
+        self._flow_directions = {}
+        self._distance_surfaces = {}
+        self._change_tiles = {
+            name: (tile_size, self._new_change_stamps(tile_size))
+            for name, (tile_size, _) in self._change_tiles.items()
+        }
+        self._version += 1
+        self._initialize_cells(self.model, self.cell_cls)
+
+    def to_image(
+        self,
+        colormap: Callable | Mapping[Any, Any] | np.ndarray,
+        attr_name: str | None = None,
+        norm: Callable | None = None,
+        image: ImageLayer | None = None,
+        windows: Sequence[Window] | None = None,
+    ) -> ImageLayer:
         """
         Returns an ImageLayer colored by the provided colormap.
+
+        Without `attr_name`, the colormap is called with each cell in turn. Given the
+        name of an attribute, all cells are colored at once from the values of the
+        attribute, with one of the following colormaps:
+
+        - a function called with the array of values with shape (height, width),
+          returning an array of RGB or RGBA colors with shape (height, width, 3 or 4);
+        - a dictionary mapping the categories of a categorical attribute, such as land
+          cover classes, to RGB or RGBA colors;
+        - a lookup table, i.e., an array of RGB or RGBA colors with shape (n, 3 or 4),
+          indexed by the integer values of the attribute;
+        - a matplotlib `Colormap`, applied to the values normalized by `norm`.
+
+        For example:
+
+        .. code-block:: python
+
+            layer.to_image({1: (0, 128, 0), 2: (0, 0, 255)}, attr_name="land_cover")
+            layer.to_image(
+                matplotlib.colormaps["terrain"],
+                attr_name="elevation",
+                norm=matplotlib.colors.Normalize(vmin=0, vmax=3000),
+            )
+
+        Floating-point colors are taken to be in [0, 1], as in matplotlib, and integer
+        colors in [0, 255]. Cells holding the nodata value of the attribute, or a value
+        missing from a dictionary or lookup table, are transparent.
+
+        An image returned before can be updated in place by recoloring only the windows
+        that have changed since, as returned by `get_changed_windows`:
+
+        .. code-block:: python
+
+            layer.track_changes("fire")
+            image = layer.to_image(colors, attr_name="fire")
+            _, token = layer.get_changed_windows("fire")
+            ...
+            windows, token = layer.get_changed_windows("fire", since=token)
+            layer.to_image(colors, attr_name="fire", image=image, windows=windows)
+
+        The values in each window are then colored separately, so give a matplotlib
+        colormap a fixed `norm`.
+
+        :param colormap: A function of a cell returning a (r, g, b, a) tuple, or, if
+            `attr_name` is given, a vectorized colormap.
+        :param str | None attr_name: The name of the attribute to color the cells by.
+            Default is None.
+        :param Callable | None norm: A function normalizing the values to [0, 1] for a
+            matplotlib colormap, e.g., `matplotlib.colors.Normalize`. If None, the values
+            are scaled linearly between their minimum and maximum. Default is None.
+        :param ImageLayer | None image: An image with uint8 values of shape
+            (4, height, width) returned by an earlier call with `attr_name`, to update
+            in place instead of creating a new one. Default is None.
+        :param Sequence[Window] | None windows: The windows of `image` to recolor. If None,
+            the whole image is recolored. Default is None.
+        :return: An ImageLayer whose values have shape (4, height, width). They are the
+            colors returned by the colormap if `attr_name` is None, and uint8 RGBA
+            colors otherwise. If `image` is given, it is returned.
+        :rtype: ImageLayer
+        :raises ValueError: If the attribute does not exist, if the colormap does not
+            return one color per cell, if `image` or `windows` are given without
+            `attr_name`, if `windows` are given without `image`, or if `image` does not
+            match the layer.
         """
 
+        if attr_name is not None:
+            if attr_name not in self.attributes:
+                raise ValueError(
+                    f"Attribute {attr_name} does not exist. "
+                    f"Choose from {self.attributes}."
+                )
+            values = np.asarray(self._get_attribute_array(attr_name))
+            nodata = self._nodata.get(attr_name)
+            if image is None:
+                if windows is not None:
+                    raise ValueError("Windows can only be recolored in an `image`.")
+                rgba = _apply_colormap(values, colormap, nodata=nodata, norm=norm)
+                return ImageLayer(
+                    values=rgba.transpose(2, 0, 1),
+                    crs=self.crs,
+                    total_bounds=self.total_bounds,
+                )
+            expected = (4, self.height, self.width)
+            if image.values.shape != expected or image.values.dtype != np.uint8:
+                raise ValueError(
+                    f"Image does not match raster shape. Expected uint8 values with "
+                    f"shape {expected}, received {image.values.dtype} values with "
+                    f"shape {image.values.shape}."
+                )
+            if windows is None:
+                windows = [Window(0, 0, self.width, self.height)]
+            for window in windows:
+                rows, cols = window.toslices()
+                rgba = _apply_colormap(
+                    values[rows, cols], colormap, nodata=nodata, norm=norm
+                )
+                image.values[:, rows, cols] = rgba.transpose(2, 0, 1)
+            image._version += 1
+            return image
+
+        if image is not None or windows is not None:
+            raise ValueError("An `image` can only be updated with an `attr_name`.")
+
         values = np.empty(shape=(4, self.height, self.width))
         for cell in self:
             row, col = cell.indices
@@ -539,59 +3747,226 @@ class RasterLayer(RasterBase):
         raster_file: str,
         model: Model,
         cell_cls: type[Cell] = Cell,
-        attr_name: str | None = None,
+        attr_name: str | Sequence[str] | None = None,
         rio_opener: Callable | None = None,
+        array_backed: bool = False,
+        lazy: bool = False,
+        max_cells: int | None = None,
+        memmap_dir: str | None = None,
+        bounds: Sequence[float] | None = None,
+        bands: Sequence[int] | None = None,
+        decimation: int = 1,
+        out_of_core: bool = False,
     ) -> RasterLayer:
         """
         Creates a RasterLayer from a raster file.
 
         :param str raster_file: Path to the raster file.
         :param Type[Cell] cell_cls: The class of the cells in the layer.
-        :param str | None attr_name: The name of the attribute to use for the cell values.
-            If None, a random name will be generated. Default is None.
+        :param str | Sequence[str] | None attr_name: The name of the attribute to use for
+            the cell values. If None, a random name will be generated. Default is None.
+            If more than one band is read, a sequence of names, one for each band.
         :param Callable | None rio_opener: A callable passed to Rasterio open() function.
+        :param bool array_backed: Whether to store raster attributes as numpy arrays
+            on the layer instead of on each cell. Default is False.
+        :param bool lazy: Whether to create cells only when they are first accessed.
+            Default is False.
+        :param int | None max_cells: Maximum number of cells kept in memory by a lazy
+            layer. Default is None.
+        :param str | None memmap_dir: A directory in which the attribute arrays are stored
+            as memory-mapped `.npy` files. The values are read from the raster file
+            directly into them. Ignored if `out_of_core` is True. Default is None.
+        :param Sequence[float] | None bounds: Only read the pixels overlapping these
+            bounds, in [min_x, min_y, max_x, max_y] format and in the CRS of the file.
+            If None, the whole file is read. Default is None.
+        :param Sequence[int] | None bands: The (1-based) indices of the bands to read.
+            If None, all bands are read. Default is None.
+        :param int decimation: Only read every `decimation`-th row and column, so that
+            each cell covers `decimation` x `decimation` pixels of the file. Default is 1.
+        :param bool out_of_core: If True, the values are not read up front. Instead, the
+            blocks of the file are read when cells or regions of the attributes are first
+            accessed. The layer is then array-backed, and using it together with
+            `lazy=True` is recommended. Values written to the attributes are kept in
+            memory, and are not written back to the file. Default is False.
+        :raises ValueError: If the number of attribute names does not match the number
+            of bands read.
         """
 
         with rio.open(raster_file, "r", opener=rio_opener) as dataset:
-            values = dataset.read()
-            _, height, width = values.shape
-            total_bounds = [
-                dataset.bounds.left,
-                dataset.bounds.bottom,
-                dataset.bounds.right,
-                dataset.bounds.top,
-            ]
-            obj = cls(width, height, dataset.crs, total_bounds, model, cell_cls)
-            obj._transform = dataset.transform
-            obj.apply_raster(values, attr_name=attr_name)
+            window, height, width, transform = _dataset_window(
+                dataset, bounds, decimation
+            )
+            indexes = list(dataset.indexes if bands is None else bands)
+            if attr_name is None or isinstance(attr_name, str):
+                if len(indexes) > 1:
+                    raise ValueError(
+                        f"Reading {len(indexes)} bands requires one attribute name "
+                        "for each band."
+                    )
+                attr_names = [
+                    attr_name if attr_name is not None else _default_attr_name(cell_cls)
+                ]
+            else:
+                attr_names = list(attr_name)
+                if len(attr_names) != len(indexes):
+                    raise ValueError(
+                        f"Received {len(attr_names)} attribute names "
+                        f"for {len(indexes)} bands."
+                    )
+            obj = cls(
+                width,
+                height,
+                dataset.crs,
+                [*rio.windows.bounds(window, dataset.transform)],
+                model,
+                cell_cls,
+                array_backed=array_backed or out_of_core,
+                lazy=lazy,
+                max_cells=max_cells,
+                memmap_dir=None if out_of_core else memmap_dir,
+            )
+            obj._transform = transform
+            if out_of_core:
+                for band, name in zip(indexes, attr_names):
+                    obj._attributes.add(name)
+                    obj._set_nodata(name, dataset.nodatavals[band - 1])
+                    obj._set_attribute_array(
+                        name,
+                        _OutOfCoreArray(
+                            raster_file,
+                            band,
+                            window,
+                            (height, width),
+                            decimation=decimation,
+                            rio_opener=rio_opener,
+                        ),
+                        copy=False,
+                    )
+                return obj
+            if obj.array_backed:
+                for band, name in zip(indexes, attr_names):
+                    # read each band directly into its attribute array
+                    array = obj._new_attribute_array(name, dataset.dtypes[band - 1])
+                    dataset.read(band, window=window, out=array)
+                    obj._attributes.add(name)
+                    obj._set_nodata(name, dataset.nodatavals[band - 1])
+                    obj._set_attribute_array(name, array, copy=False)
+                return obj
+            values = dataset.read(
+                indexes, window=window, out_shape=(len(indexes), height, width)
+            )
+            for i, (band, name) in enumerate(zip(indexes, attr_names)):
+                obj.apply_raster(
+                    values[i : i + 1],
+                    attr_name=name,
+                    nodata=dataset.nodatavals[band - 1],
+                )
             return obj
 
     def to_file(
-        self, raster_file: str, attr_name: str | None = None, driver: str = "GTiff"
-    ) -> None:
+        self,
+        raster_file: str,
+        attr_name: str | Sequence[str] | None = None,
+        driver: str = "GTiff",
+        dtype: str | np.dtype | None = None,
+        background: bool = False,
+        windows: Sequence[Window] | None = None,
+        **creation_options,
+    ) -> concurrent.futures.Future | None:
         """
-        Writes a raster layer to a file.
+        Writes a raster layer to a file, with one band per attribute, described by the
+        name of the attribute.
+
+        For example, to write a compressed and tiled GeoTIFF without blocking the
+        simulation:
+
+        .. code-block:: python
+
+            layer.to_file(
+                "snapshot.tif",
+                background=True,
+                tiled=True,
+                blockxsize=256,
+                blockysize=256,
+                compress="zstd",
+                predictor=2,
+                BIGTIFF="IF_SAFER",
+            )
 
         :param str raster_file: The path to the raster file to write to.
-        :param str | None attr_name: The name of the attribute to write to the raster.
-            If None, all attributes are written. Default is None.
+        :param str | Sequence[str] | None attr_name: The name of the attribute, or the
+            names of the attributes, to write to the raster. If None, all attributes are
+            written. Default is None.
         :param str driver: The GDAL driver to use for writing the raster file.
             Default is 'GTiff'. See GDAL docs at https://gdal.org/drivers/raster/index.html.
+        :param str | np.dtype | None dtype: The data type of the file. If None, the common
+            type of the attributes, so that attributes of the same type keep it.
+            Boolean attributes are written as uint8. Default is None.
+        :param bool background: Whether to write the file in a background thread and
+            return immediately. The values are copied first, so the layer can be
+            modified while the file is written. Default is False.
+        :param Sequence[Window] | None windows: If given, only these windows are written,
+            into an existing file written before with the same attributes, e.g., the
+            windows returned by `get_changed_windows`. The values are converted to the
+            data type of the file, and `driver`, `dtype` and the creation options are
+            ignored. Default is None.
+        :param creation_options: Creation options of the driver, such as `tiled`,
+            `blockxsize`, `blockysize`, `compress`, `predictor` or `BIGTIFF`.
+            See https://gdal.org/drivers/raster/gtiff.html#creation-options.
+        :return: If `background` is True, a future that is done once the file has been
+            written, and raises the error of the writer, if any. Background writes are
+            done one at a time, in order.
+        :rtype: concurrent.futures.Future | None
+        :raises ValueError: If an attribute does not exist.
         """
 
-        data = self.get_raster(attr_name)
-        with rio.open(
-            raster_file,
-            "w",
-            driver=driver,
-            width=self.width,
-            height=self.height,
-            count=data.shape[0],
-            dtype=data.dtype,
-            crs=self.crs,
-            transform=self.transform,
-        ) as dataset:
-            dataset.write(data)
+        if attr_name is None:
+            attr_names = list(self.attributes)
+        elif isinstance(attr_name, str):
+            attr_names = [attr_name]
+        else:
+            attr_names = list(attr_name)
+        for name in attr_names:
+            if name not in self.attributes:
+                raise ValueError(
+                    f"Attribute {name} does not exist. Choose from {self.attributes}."
+                )
+        bands = [np.asarray(self._get_attribute_array(name)) for name in attr_names]
+        if windows is not None:
+            blocks = [
+                (window, np.stack([band[window.toslices()] for band in bands]))
+                for window in windows
+            ]
+            if background:
+                return _background_writer().submit(_write_windows, raster_file, blocks)
+            _write_windows(raster_file, blocks)
+            return None
+        if dtype is None:
+            dtype = np.result_type(*bands) if bands else np.float64
+        if np.dtype(dtype) == np.bool_:
+            # GDAL has no boolean data type
+            dtype = np.uint8
+        if background:
+            bands = [np.array(band, dtype=dtype) for band in bands]
+        # a file has a single nodata value, so it is only written if all bands share it
+        nodata_values = {self._nodata.get(name) for name in attr_names}
+        nodata = nodata_values.pop() if len(nodata_values) == 1 else None
+        profile = {
+            "driver": driver,
+            "width": self.width,
+            "height": self.height,
+            "count": len(bands),
+            "dtype": dtype,
+            "crs": self.crs,
+            "transform": self.transform,
+            "nodata": nodata,
+            **creation_options,
+        }
+        if background:
+            return _background_writer().submit(
+                _write_bands, raster_file, profile, attr_names, bands
+            )
+        _write_bands(raster_file, profile, attr_names, bands)
 
 
 class ImageLayer(RasterBase):
@@ -638,9 +4013,82 @@ class ImageLayer(RasterBase):
         self._height = values.shape[1]
         self._update_transform()
 
-    def to_crs(self, crs, inplace=False) -> ImageLayer | None:
+    def build_overviews(
+        self, factors: Sequence[int] = (2, 4, 8), aggregation: str = "mean"
+    ) -> None:
+        """
+        Build overview levels of the image, each decimated by one of `factors`, for
+        multi-resolution access through `get_overview`.
+
+        The levels are kept by the layer, and rebuilt lazily on access once `values`
+        has been assigned.
+
+        :param Sequence[int] factors: The decimation factors of the levels, e.g.,
+            a factor of 2 aggregates blocks of 2 x 2 pixels. Default is (2, 4, 8).
+        :param str aggregation: How the values of a block are aggregated. One of
+            "mean", "sum", "min", "max" and "nearest", which takes the value of the
+            top-left pixel of the block. Default is "mean".
+        :raises ValueError: If the factors or aggregation are invalid.
+        """
+
+        self._set_overview_levels(None, factors, aggregation)
+        self.get_overview(self._overview_levels[None][0][0])
+
+    def get_overview(self, factor: int) -> ImageLayer:
+        """
+        Return an overview level of the image built by `build_overviews`.
+
+        :param int factor: The decimation factor of the level.
+        :return: An image layer of the aggregated values. The mean of integer values
+            is rounded to keep their dtype.
+        :rtype: ImageLayer
+        :raises ValueError: If no overviews with this factor exist.
+        """
+
+        values = self._get_overview_values(None, factor, lambda: self.values)
+        if (
+            self._overview_levels[None][1] == "mean"
+            and values.dtype != self.values.dtype
+        ):
+            values = np.rint(values).astype(self.values.dtype)
+        height, width = values.shape[1:]
+        total_bounds = rio.transform.array_bounds(
+            height, width, self.get_overview_transform(factor)
+        )
+        return ImageLayer(values, crs=self.crs, total_bounds=[*total_bounds])
+
+    def to_crs(
+        self,
+        crs,
+        inplace=False,
+        resampling: Resampling = Resampling.nearest,
+        num_threads: int = 1,
+    ) -> ImageLayer | None:
+        """
+        Transform the image layer to a new coordinate reference system.
+
+        All bands are reprojected together in one call, and keep their dtype.
+
+        :param crs: The coordinate reference system to transform to.
+        :param inplace: Whether to transform the image layer in place or return a new
+            one. Default is False.
+        :param Resampling resampling: The resampling method, see `rasterio.warp.Resampling`.
+            Default is nearest neighbor.
+        :param int num_threads: The number of threads used for warping. Default is 1.
+        :return: The transformed image layer if not inplace. It is cached, and returned
+            again by later calls with the same `crs` and `resampling` until either layer
+            is modified. Only assignments to `values` are tracked, not writes into it.
+        :rtype: ImageLayer | None
+        """
+
         super()._to_crs_check(crs)
+        if not inplace:
+            key = self._reprojection_key(crs, resampling)
+            cached = self._get_cached_reprojection(key)
+            if cached is not None:
+                return cached
         layer = self if inplace else copy.copy(self)
+        layer._detach_caches()
 
         src_crs = rio.crs.CRS.from_user_input(layer.crs)
         dst_crs = rio.crs.CRS.from_user_input(crs)
@@ -653,17 +4101,19 @@ class ImageLayer(RasterBase):
                 src_height,
                 *layer.total_bounds,
             )
-            dst = np.empty(shape=(num_bands, dst_height, dst_width))
-            for i, band in enumerate(layer.values):
-                reproject(
-                    source=band,
-                    destination=dst[i],
-                    src_transform=layer.transform,
-                    src_crs=src_crs,
-                    dst_transform=transform,
-                    dst_crs=dst_crs,
-                    resampling=Resampling.nearest,
-                )
+            dst = np.zeros(
+                shape=(num_bands, dst_height, dst_width), dtype=layer.values.dtype
+            )
+            reproject(
+                source=layer.values,
+                destination=dst,
+                src_transform=layer.transform,
+                src_crs=src_crs,
+                dst_transform=transform,
+                dst_crs=dst_crs,
+                resampling=resampling,
+                num_threads=num_threads,
+            )
             layer._total_bounds = [
                 *transform_bounds(src_crs, dst_crs, *layer.total_bounds)
             ]
@@ -672,30 +4122,308 @@ class ImageLayer(RasterBase):
             layer._width = layer._values.shape[2]
             layer.crs = crs
             layer._transform = transform
+            layer._version += 1
         if not inplace:
+            self._cache_reprojection(key, layer)
             return layer
 
     @classmethod
-    def from_file(cls, image_file) -> ImageLayer:
+    def from_file(
+        cls,
+        image_file,
+        bounds: Sequence[float] | None = None,
+        bands: Sequence[int] | None = None,
+        decimation: int = 1,
+    ) -> ImageLayer:
         """
         Creates an ImageLayer from an image file.
 
         :param image_file: The path to the image file.
+        :param Sequence[float] | None bounds: Only read the pixels overlapping these
+            bounds, in [min_x, min_y, max_x, max_y] format and in the CRS of the file.
+            If None, the whole file is read. Default is None.
+        :param Sequence[int] | None bands: The (1-based) indices of the bands to read.
+            If None, all bands are read. Default is None.
+        :param int decimation: Only read every `decimation`-th row and column.
+            Default is 1.
         :return: The ImageLayer.
         :rtype: ImageLayer
         """
 
         with rio.open(image_file, "r") as dataset:
-            values = dataset.read()
-            total_bounds = [
-                dataset.bounds.left,
-                dataset.bounds.bottom,
-                dataset.bounds.right,
-                dataset.bounds.top,
-            ]
+            window, height, width, transform = _dataset_window(
+                dataset, bounds, decimation
+            )
+            indexes = list(dataset.indexes if bands is None else bands)
+            values = dataset.read(
+                indexes, window=window, out_shape=(len(indexes), height, width)
+            )
+            total_bounds = [*rio.windows.bounds(window, dataset.transform)]
             obj = cls(values=values, crs=dataset.crs, total_bounds=total_bounds)
-            obj._transform = dataset.transform
+            obj._transform = transform
             return obj
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(crs={self.crs}, total_bounds={self.total_bounds}, values={self.values!r})"
+
+
+class RasterRecorder:
+    """
+    Records attributes of a `RasterLayer` over the steps of a run into a single
+    directory, which holds the georeferencing of the layer in `metadata.json`, and
+    for each attribute, a file of raw values and a file indexing them.
+
+    The layer is split into square blocks. With `deltas`, a block is only written when
+    its values have changed since the previous record, so that mostly static
+    attributes take little space and time to record. Recorded values are read back
+    with `read`, also after the run through `RasterRecorder.open`.
+    """
+
+    _METADATA_FILE = "metadata.json"
+    _STEPS_FILE = "steps.dat"
+
+    def __init__(
+        self,
+        layer: RasterLayer,
+        path: str,
+        attr_name: str | Sequence[str] | None = None,
+        block_size: int = 256,
+        deltas: bool = True,
+    ) -> None:
+        """
+        Create a recorder that writes to a new directory.
+
+        :param RasterLayer layer: The raster layer to record.
+        :param str path: The directory to record to. It is created if it does not
+            exist, and must not hold a recording yet.
+        :param str | Sequence[str] | None attr_name: The name of the attribute, or the
+            names of the attributes, to record. If None, all current attributes are
+            recorded. Default is None.
+        :param int block_size: The width and height of the blocks, in cells.
+            Default is 256.
+        :param bool deltas: Whether to write only the blocks that have changed since the
+            previous record. If False, all blocks are written at every record.
+            Default is True.
+        :raises ValueError: If an attribute does not exist, or if the directory already
+            holds a recording.
+        """
+
+        if attr_name is None:
+            attr_names = sorted(layer.attributes)
+        elif isinstance(attr_name, str):
+            attr_names = [attr_name]
+        else:
+            attr_names = list(attr_name)
+        for name in attr_names:
+            if name not in layer.attributes:
+                raise ValueError(
+                    f"Attribute {name} does not exist. Choose from {layer.attributes}."
+                )
+        if os.path.exists(os.path.join(path, self._METADATA_FILE)):
+            raise ValueError(f"{path} already holds a recording.")
+        os.makedirs(path, exist_ok=True)
+
+        attributes = {}
+        for name in attr_names:
+            nodata = layer.nodata.get(name)
+            attributes[name] = {
+                "dtype": np.asarray(layer._get_attribute_array(name)).dtype.str,
+                "nodata": nodata.item() if isinstance(nodata, np.generic) else nodata,
+            }
+        metadata = {
+            "width": layer.width,
+            "height": layer.height,
+            "crs": None if layer.crs is None else layer.crs.to_wkt(),
+            "transform": list(layer.transform)[:6],
+            "block_size": block_size,
+            "attributes": attributes,
+        }
+        with open(os.path.join(path, self._METADATA_FILE), "w") as file:
+            json.dump(metadata, file)
+        open(os.path.join(path, self._STEPS_FILE), "wb").close()
+        for name in attr_names:
+            open(self._data_file(path, name), "wb").close()
+            open(self._index_file(path, name), "wb").close()
+
+        self._init_from_metadata(path, metadata)
+        self._layer = layer
+        self._deltas = deltas
+        self._previous: dict[str, np.ndarray] = {}
+
+    @classmethod
+    def open(cls, path: str) -> RasterRecorder:
+        """
+        Open an existing recording to read it.
+
+        :param str path: The directory of the recording.
+        :return: A recorder that can only read.
+        :rtype: RasterRecorder
+        """
+
+        with open(os.path.join(path, cls._METADATA_FILE)) as file:
+            metadata = json.load(file)
+        recorder = cls.__new__(cls)
+        recorder._init_from_metadata(path, metadata)
+        recorder._layer = None
+        return recorder
+
+    def _init_from_metadata(self, path: str, metadata: dict[str, Any]) -> None:
+        self.path = path
+        self.width = metadata["width"]
+        self.height = metadata["height"]
+        self.crs = None if metadata["crs"] is None else pyproj.CRS(metadata["crs"])
+        self.transform = Affine(*metadata["transform"])
+        self.block_size = metadata["block_size"]
+        self._dtypes = {
+            name: np.dtype(attribute["dtype"])
+            for name, attribute in metadata["attributes"].items()
+        }
+        self.nodata = {
+            name: attribute["nodata"]
+            for name, attribute in metadata["attributes"].items()
+            if attribute["nodata"] is not None
+        }
+
+    @staticmethod
+    def _data_file(path: str, attr_name: str) -> str:
+        return os.path.join(path, f"{attr_name}.dat")
+
+    @staticmethod
+    def _index_file(path: str, attr_name: str) -> str:
+        return os.path.join(path, f"{attr_name}.idx")
+
+    @property
+    def attributes(self) -> list[str]:
+        """
+        Return the names of the recorded attributes.
+
+        :return: The names of the recorded attributes.
+        :rtype: List[str]
+        """
+
+        return list(self._dtypes)
+
+    @property
+    def steps(self) -> np.ndarray:
+        """
+        Return the steps that have been recorded.
+
+        :return: An int array of the recorded steps, in increasing order.
+        :rtype: np.ndarray
+        """
+
+        return np.fromfile(os.path.join(self.path, self._STEPS_FILE), dtype=np.int64)
+
+    def record(self, step: int | None = None) -> None:
+        """
+        Record the current values of the attributes.
+
+        :param int | None step: The step to record the values as. If None, the current
+            step of the model of the layer. Default is None.
+        :raises ValueError: If the recorder can only read, if the step is not greater
+            than the previously recorded one, or if the shape of the layer has changed.
+        """
+
+        if self._layer is None:
+            raise ValueError("This recording has been opened for reading only.")
+        layer = self._layer
+        if (layer.height, layer.width) != (self.height, self.width):
+            raise ValueError(
+                "The shape of the layer has changed since recording began."
+            )
+        if step is None:
+            step = layer.model.steps
+        steps = self.steps
+        if steps.size and step <= steps[-1]:
+            raise ValueError(
+                f"Step {step} must be greater than the last recorded step {steps[-1]}."
+            )
+
+        size = self.block_size
+        for name, dtype in self._dtypes.items():
+            values = np.asarray(layer._get_attribute_array(name)).astype(
+                dtype, copy=False
+            )
+            previous = self._previous.get(name)
+            if previous is None or not self._deltas:
+                changed = np.ones(
+                    (-(-self.height // size), -(-self.width // size)), dtype=np.bool_
+                )
+            else:
+                different = values != previous
+                if np.issubdtype(dtype, np.inexact):
+                    different &= ~(np.isnan(values) & np.isnan(previous))
+                changed = _reduce_blocks(different, size, np.logical_or)
+            block_rows, block_cols = np.nonzero(changed)
+            records = np.empty((block_rows.size, 4), dtype=np.int64)
+            with open(self._data_file(self.path, name), "ab") as data_file:
+                offset = data_file.tell()
+                for i, (block_row, block_col) in enumerate(
+                    zip(block_rows.tolist(), block_cols.tolist())
+                ):
+                    block = values[
+                        block_row * size : (block_row + 1) * size,
+                        block_col * size : (block_col + 1) * size,
+                    ]
+                    data_file.write(np.ascontiguousarray(block).tobytes())
+                    records[i] = step, block_row, block_col, offset
+                    offset += block.nbytes
+            with open(self._index_file(self.path, name), "ab") as index_file:
+                records.tofile(index_file)
+            if self._deltas:
+                if previous is None:
+                    self._previous[name] = values.copy()
+                else:
+                    previous[...] = values
+        with open(os.path.join(self.path, self._STEPS_FILE), "ab") as steps_file:
+            np.array([step], dtype=np.int64).tofile(steps_file)
+
+    def read(self, attr_name: str, step: int | None = None) -> np.ndarray:
+        """
+        Read the values of an attribute as recorded at a step.
+
+        :param str attr_name: The name of the attribute.
+        :param int | None step: The recorded step to read. If None, the last one.
+            Default is None.
+        :return: The values as a numpy array with shape (1, height, width), as returned
+            by `RasterLayer.get_raster` at that step.
+        :rtype: np.ndarray
+        :raises ValueError: If the attribute or the step has not been recorded.
+        """
+
+        if attr_name not in self._dtypes:
+            raise ValueError(
+                f"Attribute {attr_name} has not been recorded. "
+                f"Choose from {self.attributes}."
+            )
+        steps = self.steps
+        if step is None:
+            if not steps.size:
+                raise ValueError("No steps have been recorded.")
+            step = steps[-1]
+        elif step not in steps:
+            raise ValueError(f"Step {step} has not been recorded.")
+
+        dtype = self._dtypes[attr_name]
+        index = np.fromfile(self._index_file(self.path, attr_name), dtype=np.int64)
+        index = index.reshape(-1, 4)
+        index = index[index[:, 0] <= step]
+        # the last record of each block holds its values at the step
+        size = self.block_size
+        block_ids = index[:, 1] * (-(-self.width // size)) + index[:, 2]
+        _, last = np.unique(block_ids[::-1], return_index=True)
+        index = index[index.shape[0] - 1 - last]
+
+        data = np.memmap(
+            self._data_file(self.path, attr_name), dtype=np.uint8, mode="r"
+        )
+        values = np.empty((self.height, self.width), dtype=dtype)
+        for _, block_row, block_col, offset in index.tolist():
+            block = values[
+                block_row * size : (block_row + 1) * size,
+                block_col * size : (block_col + 1) * size,
+            ]
+            block[...] = (
+                data[offset : offset + block.nbytes].view(dtype).reshape(block.shape)
+            )
+        return values[np.newaxis]
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 
 import numpy as np
@@ -85,3 +87,90 @@ class TestImageLayer(unittest.TestCase):
         self.assertTrue(self.image_layer.transform.almost_equals(self.dst_transform))
         np.testing.assert_almost_equal(self.image_layer.total_bounds, self.dst_bounds)
         np.testing.assert_almost_equal(self.image_layer.resolution, self.dst_resolution)
+
+    def test_from_file_window(self):
+        values = np.arange(3 * 40 * 50, dtype=np.uint8).reshape(3, 40, 50)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            image_file = os.path.join(tmp_dir, "image.tif")
+            with rio.open(
+                image_file,
+                "w",
+                driver="GTiff",
+                width=50,
+                height=40,
+                count=3,
+                dtype=values.dtype,
+                crs=self.src_crs,
+                transform=rio.transform.from_origin(-122, 43, 0.01, 0.01),
+            ) as dataset:
+                dataset.write(values)
+
+            image_layer = mg.ImageLayer.from_file(
+                image_file, bounds=[-121.9, 42.7, -121.7, 42.9], bands=[1, 3]
+            )
+            np.testing.assert_array_equal(
+                image_layer.values, values[[0, 2], 10:30, 10:30]
+            )
+            np.testing.assert_almost_equal(
+                image_layer.total_bounds, [-121.9, 42.7, -121.7, 42.9]
+            )
+
+            image_layer = mg.ImageLayer.from_file(image_file, decimation=2)
+            self.assertEqual(image_layer.values.shape, (3, 20, 25))
+            np.testing.assert_almost_equal(image_layer.resolution, (0.02, 0.02))
+
+    def test_to_crs_resampling(self):
+        image_layer = mg.ImageLayer(
+            values=np.random.randint(0, 255, size=self.src_shape, dtype=np.uint8),
+            crs=self.src_crs,
+            total_bounds=self.src_bounds,
+        )
+        nearest = image_layer.to_crs(self.dst_crs, num_threads=2)
+        self.assertEqual(nearest.values.dtype, np.uint8)
+        self.assertEqual(nearest.values.shape, self.dst_shape)
+        self.assertTrue(
+            set(np.unique(nearest.values)) <= set(np.unique(image_layer.values))
+        )
+
+        bilinear = image_layer.to_crs(
+            self.dst_crs, resampling=rio.warp.Resampling.bilinear
+        )
+        self.assertEqual(bilinear.values.shape, self.dst_shape)
+        self.assertFalse(np.array_equal(bilinear.values, nearest.values))
+
+    def test_to_crs_cache(self):
+        transformed_image_layer = self.image_layer.to_crs(self.dst_crs)
+        self.assertIs(self.image_layer.to_crs(self.dst_crs), transformed_image_layer)
+        self.assertIsNot(
+            self.image_layer.to_crs(
+                self.dst_crs, resampling=rio.warp.Resampling.bilinear
+            ),
+            transformed_image_layer,
+        )
+
+        self.image_layer.values = np.zeros(self.src_shape)
+        retransformed_image_layer = self.image_layer.to_crs(self.dst_crs)
+        self.assertIsNot(retransformed_image_layer, transformed_image_layer)
+        self.assertEqual(retransformed_image_layer.values.max(), 0)
+
+        retransformed_image_layer.values = np.ones(self.dst_shape)
+        self.assertIsNot(
+            self.image_layer.to_crs(self.dst_crs), retransformed_image_layer
+        )
+
+    def test_overviews(self):
+        image_layer = mg.ImageLayer(
+            values=np.arange(3 * 4 * 6, dtype=np.uint8).reshape(3, 4, 6),
+            crs=self.src_crs,
+            total_bounds=[0, 0, 6, 4],
+        )
+        image_layer.build_overviews(factors=(2,))
+        overview = image_layer.get_overview(2)
+        self.assertEqual(overview.values.dtype, np.uint8)
+        self.assertEqual(overview.values.shape, (3, 2, 3))
+        self.assertEqual(overview.values[0, 0, 0], 4)
+        np.testing.assert_almost_equal(overview.total_bounds, [0, 0, 6, 4])
+        self.assertEqual(overview.resolution, (2, 2))
+
+        image_layer.values = np.zeros((3, 4, 6), dtype=np.uint8)
+        self.assertEqual(image_layer.get_overview(2).values.max(), 0)
@@ -1,10 +1,20 @@
+import itertools
+import os
+import tempfile
 import unittest
 
 import mesa
 import numpy as np
+import rasterio as rio
+from matplotlib import colors
 
 import mesa_geo as mg
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
 
 class TestRasterLayer(unittest.TestCase):
     def setUp(self) -> None:
@@ -120,3 +130,1605 @@ class TestRasterLayer(unittest.TestCase):
         )
         self.assertEqual(max_cell.pos, (1, 1))
         self.assertEqual(max_cell.elevation, 4)
+
+    def test_array_backed_layer(self):
+        layer = mg.RasterLayer(
+            width=2,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            array_backed=True,
+        )
+        self.assertTrue(layer.array_backed)
+        raster_data = np.array([[[1, 2], [3, 4], [5, 6]]], dtype=np.int16)
+        layer.apply_raster(raster_data, attr_name="elevation")
+        self.assertEqual(layer.cells[0][1].elevation, 3)
+        self.assertNotIn("elevation", layer.cells[0][1].__dict__)
+
+        # values are copied on apply, and get_raster returns a view
+        raster_data[0, 0, 0] = 100
+        self.assertEqual(layer.cells[0][2].elevation, 1)
+        view = layer.get_raster("elevation")
+        self.assertEqual(view.dtype, np.int16)
+        np.testing.assert_array_equal(view, [[[1, 2], [3, 4], [5, 6]]])
+
+        # writes through cells and through the view are shared
+        layer.cells[1][0].elevation = 60
+        self.assertEqual(view[0, 2, 1], 60)
+        view[0, 0, 1] = 20
+        self.assertEqual(layer.cells[1][2].elevation, 20)
+
+        # non-raster attributes are still stored on the cell
+        layer.cells[0][0].visited = True
+        self.assertTrue(layer.cells[0][0].visited)
+        with self.assertRaises(AttributeError):
+            _ = layer.cells[0][0].not_existing_attr
+
+    def test_object_mode_cells_are_not_proxied(self):
+        class PlainCell(mg.Cell):
+            pass
+
+        layer = mg.RasterLayer(
+            width=2,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            cell_cls=PlainCell,
+        )
+        layer.apply_raster(np.zeros((1, 3, 2)), attr_name="elevation")
+        # attribute access on cells in object mode keeps its default speed
+        self.assertIs(PlainCell.__setattr__, object.__setattr__)
+        self.assertNotIn("__getattr__", vars(mg.Cell))
+        self.assertNotIn("elevation", vars(PlainCell))
+        self.assertEqual(layer.cells[0][0].__dict__["elevation"], 0)
+
+    def test_array_backed_layer_discards_cell_defaults(self):
+        class ElevationCell(mg.Cell):
+            def __init__(self, model, pos=None, indices=None):
+                super().__init__(model, pos, indices)
+                self.elevation = None
+
+        layer = mg.RasterLayer(
+            width=2,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            cell_cls=ElevationCell,
+            array_backed=True,
+        )
+        # cells keep the class given to the layer
+        self.assertIs(type(layer.cells[0][0]), ElevationCell)
+        self.assertEqual(len(self.model.agents_by_type[ElevationCell]), 6)
+        self.assertIsNone(layer.cells[0][0].elevation)
+        layer.apply_raster(np.array([[[1, 2], [3, 4], [5, 6]]]), attr_name="elevation")
+        self.assertEqual(layer.cells[0][0].elevation, 5)
+
+    def test_get_raster_preserves_dtype(self):
+        raster_data = np.array([[[1, 2], [3, 4], [5, 6]]], dtype=np.uint8)
+        self.raster_layer.apply_raster(raster_data, attr_name="landcover")
+        data = self.raster_layer.get_raster("landcover")
+        self.assertEqual(data.dtype, np.uint8)
+        np.testing.assert_array_equal(data, raster_data)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raster_file = os.path.join(tmp_dir, "landcover.tif")
+            self.raster_layer.to_file(raster_file, attr_name="landcover")
+            with rio.open(raster_file) as dataset:
+                self.assertEqual(dataset.dtypes[0], "uint8")
+                np.testing.assert_array_equal(dataset.read(), raster_data)
+
+    def test_to_file_bool_attribute(self):
+        raster_data = np.array([[[True, False], [False, True], [True, True]]])
+        for array_backed in (False, True):
+            raster_layer = mg.RasterLayer(
+                width=2,
+                height=3,
+                crs="epsg:4326",
+                total_bounds=self.raster_layer.total_bounds,
+                model=self.model,
+                array_backed=array_backed,
+            )
+            raster_layer.apply_raster(raster_data, attr_name="flooded")
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                raster_file = os.path.join(tmp_dir, "flooded.tif")
+                raster_layer.to_file(raster_file, attr_name="flooded")
+                with rio.open(raster_file) as dataset:
+                    self.assertEqual(dataset.dtypes[0], "uint8")
+                    np.testing.assert_array_equal(dataset.read(), raster_data)
+
+    def test_lazy_layer(self):
+        num_agents = len(self.model.agents)
+        layer = mg.RasterLayer(
+            width=2,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            lazy=True,
+        )
+        self.assertTrue(layer.array_backed)
+        self.assertEqual(len(self.model.agents), num_agents)
+
+        layer.apply_raster(np.array([[[1, 2], [3, 4], [5, 6]]]), attr_name="elevation")
+        self.assertEqual(layer.cells[0][1].elevation, 3)
+        self.assertIs(layer.cells[0][1], layer[0, 1])
+        self.assertEqual(len(self.model.agents), num_agents + 1)
+
+        min_cell = min(
+            layer.get_neighboring_cells(pos=(0, 2), moore=True),
+            key=lambda cell: cell.elevation,
+        )
+        self.assertEqual(min_cell.pos, (1, 2))
+        self.assertEqual([cell.pos for cell in layer[:, 0]], [(0, 0), (1, 0)])
+        self.assertEqual(layer.cells[-1][-1].pos, (1, 2))
+        self.assertEqual(len(list(layer)), 6)
+
+    def test_lazy_layer_max_cells(self):
+        layer = mg.RasterLayer(
+            width=2,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            lazy=True,
+            max_cells=2,
+        )
+        layer.apply_raster(np.array([[[1, 2], [3, 4], [5, 6]]]), attr_name="elevation")
+        layer[0, 0].visited = True
+        layer[0, 1].elevation = 30
+        layer[0, 2]
+        layer[1, 0]
+        # the cell with state of its own is kept, others are discarded
+        self.assertEqual(set(layer._materialized_cells), {(0, 0), (1, 0)})
+        self.assertTrue(layer[0, 0].visited)
+        self.assertEqual(layer[0, 1].elevation, 30)
+
+        with self.assertRaises(ValueError):
+            mg.RasterLayer(
+                width=2,
+                height=3,
+                crs="epsg:4326",
+                total_bounds=self.raster_layer.total_bounds,
+                model=self.model,
+                max_cells=2,
+            )
+
+    def test_lightweight_cells(self):
+        num_agents = len(self.model.agents)
+        layer = mg.RasterLayer(
+            width=2,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            cell_cls=mg.LightweightCell,
+            array_backed=True,
+        )
+        self.assertEqual(len(self.model.agents), num_agents)
+        layer.apply_raster(np.array([[[1, 2], [3, 4], [5, 6]]]), attr_name="elevation")
+        self.assertEqual(layer.cells[0][1].elevation, 3)
+        self.assertFalse(hasattr(layer.cells[0][1], "__dict__"))
+
+        max_cell = max(
+            layer.get_neighboring_cells(pos=(0, 2), moore=True),
+            key=lambda cell: cell.elevation,
+        )
+        self.assertEqual(max_cell.pos, (1, 1))
+        self.assertEqual(len(list(layer)), 6)
+        with self.assertRaises(AttributeError):
+            layer.cells[0][1].visited = True
+
+        with self.assertRaises(ValueError):
+            mg.RasterLayer(
+                width=2,
+                height=3,
+                crs="epsg:4326",
+                total_bounds=self.raster_layer.total_bounds,
+                model=self.model,
+                cell_cls=mg.LightweightCell,
+            )
+
+    def test_focal(self):
+        self.raster_layer.apply_raster(
+            np.array([[[1, 2], [3, 4], [5, 6]]]), attr_name="elevation"
+        )
+        for op, func in (("sum", sum), ("min", min), ("max", max)):
+            for moore, include_center in itertools.product((True, False), repeat=2):
+                result = self.raster_layer.focal(
+                    "elevation", op, moore=moore, include_center=include_center
+                )
+                self.assertEqual(result.shape, (1, 3, 2))
+                for cell in self.raster_layer:
+                    neighbors = self.raster_layer.get_neighboring_cells(
+                        cell.pos, moore=moore, include_center=include_center
+                    )
+                    row, col = cell.indices
+                    self.assertEqual(
+                        result[0, row, col], func(n.elevation for n in neighbors)
+                    )
+
+        mean = self.raster_layer.focal("elevation", "mean", radius=2)
+        self.assertEqual(mean.dtype, np.float64)
+        # (0, 2) has all other cells as neighbors within radius 2
+        self.assertAlmostEqual(mean[0, 0, 0], 20 / 5)
+
+        out = np.empty((1, 3, 2))
+        self.assertIs(self.raster_layer.focal("elevation", "max", out=out), out)
+        with self.assertRaises(ValueError):
+            self.raster_layer.focal("elevation", "median")
+        with self.assertRaises(ValueError):
+            self.raster_layer.focal("not_existing_attr", "sum")
+
+    def test_focal_nodata(self):
+        raster_layer = mg.RasterLayer(
+            width=3,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+        )
+        n = -9999
+        raster_data = np.array([[[1, n, 3], [n, n, 5], [n, 7, n]]], dtype=np.int16)
+        raster_layer.apply_raster(raster_data, attr_name="elevation", nodata=n)
+
+        # cells without data, and (0, 0) and (2, 1) without neighbors with data,
+        # have no result
+        for op in ("sum", "min", "max"):
+            result = raster_layer.focal("elevation", op, moore=False)
+            self.assertEqual(result.dtype, np.int64 if op == "sum" else np.int16)
+            np.testing.assert_array_equal(result, [[[n, n, 5], [n, n, 3], [n, n, n]]])
+        mean = raster_layer.focal("elevation", "mean", moore=False)
+        np.testing.assert_array_equal(
+            mean, [[[np.nan, np.nan, 5], [np.nan, np.nan, 3], [np.nan] * 3]]
+        )
+
+    def test_get_neighbor_table(self):
+        for moore, include_center, radius in itertools.product(
+            (True, False), (True, False), (1, 2)
+        ):
+            indptr, indices = self.raster_layer.get_neighbor_table(
+                moore, include_center=include_center, radius=radius
+            )
+            self.assertEqual(indices.dtype, np.int32)
+            self.assertEqual(len(indptr), 2 * 3 + 1)
+            for cell in self.raster_layer:
+                row, col = cell.indices
+                i = row * 2 + col
+                neighbor_indices = [
+                    divmod(int(index), 2)
+                    for index in indices[indptr[i] : indptr[i + 1]]
+                ]
+                self.assertEqual(
+                    [(col, 3 - row - 1) for row, col in neighbor_indices],
+                    self.raster_layer.get_neighborhood(
+                        cell.pos, moore, include_center, radius
+                    ),
+                )
+        self.assertIs(
+            self.raster_layer.get_neighbor_table(True),
+            self.raster_layer.get_neighbor_table(True),
+        )
+
+    def test_get_neighborhood_inside_and_at_edges(self):
+        raster_layer = mg.RasterLayer(
+            width=5,
+            height=4,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+        )
+        for moore, radius in itertools.product((True, False), (1, 2)):
+            for x, y in itertools.product(range(5), range(4)):
+                expected = sorted(
+                    (nx, ny)
+                    for nx, ny in itertools.product(range(5), range(4))
+                    if (nx, ny) != (x, y)
+                    and (
+                        max(abs(nx - x), abs(ny - y)) <= radius
+                        if moore
+                        else abs(nx - x) + abs(ny - y) <= radius
+                    )
+                )
+                self.assertEqual(
+                    raster_layer.get_neighborhood((x, y), moore, radius=radius),
+                    expected,
+                )
+
+    def test_neighborhood_cache_size(self):
+        # neighborhoods are not cached by default
+        for cell in self.raster_layer:
+            self.raster_layer.get_neighborhood(cell.pos, moore=True)
+        self.assertEqual(len(self.raster_layer._neighborhood_cache), 0)
+
+        self.raster_layer.neighborhood_cache_size = 2
+        for cell in self.raster_layer:
+            self.raster_layer.get_neighborhood(cell.pos, moore=True)
+        self.assertEqual(len(self.raster_layer._neighborhood_cache), 2)
+        self.assertEqual(
+            self.raster_layer.get_neighborhood((0, 0), moore=False),
+            [(0, 1), (1, 0)],
+        )
+
+    def test_get_neighborhoods(self):
+        self.raster_layer.apply_raster(
+            np.array([[[1, 2], [3, 4], [5, 6]]]), attr_name="elevation"
+        )
+        positions = np.array([cell.pos for cell in self.raster_layer])
+        for moore, include_center in itertools.product((True, False), repeat=2):
+            neighbors = self.raster_layer.get_neighborhoods(
+                positions, moore, include_center=include_center
+            )
+            values = self.raster_layer.get_neighborhood_values(
+                positions, "elevation", moore, include_center=include_center
+            )
+            self.assertEqual(neighbors.shape[:2], values.shape)
+            for pos, pos_neighbors, pos_values in zip(positions, neighbors, values):
+                expected = self.raster_layer.get_neighboring_cells(
+                    tuple(pos), moore, include_center
+                )
+                self.assertEqual(
+                    [tuple(n) for n in pos_neighbors if n[0] != -1],
+                    [cell.pos for cell in expected],
+                )
+                self.assertEqual(
+                    pos_values.compressed().tolist(),
+                    [cell.elevation for cell in expected],
+                )
+
+        values = self.raster_layer.get_neighborhood_values(
+            [(0, 2)], "elevation", moore=True
+        )
+        neighbors = self.raster_layer.get_neighborhoods([(0, 2)], moore=True)
+        self.assertEqual(tuple(neighbors[0, values.argmin(axis=1)[0]]), (1, 2))
+        with self.assertRaises(ValueError):
+            self.raster_layer.get_neighborhood_values(
+                [(0, 0)], "not_existing_attr", True
+            )
+
+    def _write_raster_file(self, raster_file, values, nodata=None):
+        with rio.open(
+            raster_file,
+            "w",
+            driver="GTiff",
+            width=values.shape[2],
+            height=values.shape[1],
+            count=values.shape[0],
+            dtype=values.dtype,
+            crs="epsg:3857",
+            transform=rio.transform.from_origin(1000, 2000, 10, 10),
+            tiled=True,
+            blockxsize=16,
+            blockysize=16,
+            nodata=nodata,
+        ) as dataset:
+            dataset.write(values)
+
+    def test_from_file_window(self):
+        values = np.arange(2 * 40 * 50, dtype=np.int32).reshape(2, 40, 50)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raster_file = os.path.join(tmp_dir, "dem.tif")
+            self._write_raster_file(raster_file, values)
+
+            layer = mg.RasterLayer.from_file(
+                raster_file,
+                self.model,
+                attr_name="elevation",
+                bounds=[1100, 1700, 1300, 1900],
+                bands=[2],
+                array_backed=True,
+            )
+            self.assertEqual((layer.width, layer.height), (20, 20))
+            np.testing.assert_array_equal(layer.total_bounds, [1100, 1700, 1300, 1900])
+            np.testing.assert_array_equal(
+                layer.get_raster("elevation")[0], values[1, 10:30, 10:30]
+            )
+
+            # bounds within pixels cover all pixels they overlap
+            layer = mg.RasterLayer.from_file(
+                raster_file,
+                self.model,
+                attr_name="elevation",
+                bounds=[1105, 1705, 1295, 1895],
+                bands=[2],
+            )
+            np.testing.assert_array_equal(layer.total_bounds, [1100, 1700, 1300, 1900])
+            with self.assertRaises(ValueError):
+                mg.RasterLayer.from_file(
+                    raster_file,
+                    self.model,
+                    bands=[1],
+                    bounds=[3000, 3000, 3100, 3100],
+                )
+
+            layer = mg.RasterLayer.from_file(
+                raster_file,
+                self.model,
+                attr_name=["a", "b"],
+                decimation=3,
+                array_backed=True,
+            )
+            self.assertEqual((layer.width, layer.height), (16, 13))
+            self.assertEqual(layer.resolution, (30, 30))
+            np.testing.assert_array_equal(
+                layer.get_raster("b")[0], values[1, 1:39:3, 1:49:3]
+            )
+
+            with self.assertRaises(ValueError):
+                mg.RasterLayer.from_file(raster_file, self.model)
+            with self.assertRaises(ValueError):
+                mg.RasterLayer.from_file(
+                    raster_file, self.model, bands=[1], decimation=0
+                )
+
+    def test_from_file_out_of_core(self):
+        values = np.random.default_rng(0).random((1, 40, 50)).astype(np.float32)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raster_file = os.path.join(tmp_dir, "dem.tif")
+            self._write_raster_file(raster_file, values)
+
+            for decimation in (1, 2):
+                in_memory = mg.RasterLayer.from_file(
+                    raster_file,
+                    self.model,
+                    attr_name="elevation",
+                    bounds=[1050, 1650, 1450, 1950],
+                    decimation=decimation,
+                    lazy=True,
+                )
+                layer = mg.RasterLayer.from_file(
+                    raster_file,
+                    self.model,
+                    attr_name="elevation",
+                    bounds=[1050, 1650, 1450, 1950],
+                    decimation=decimation,
+                    lazy=True,
+                    out_of_core=True,
+                )
+                array = layer._attribute_arrays["elevation"]
+                self.assertEqual(len(array._blocks), 0)
+                cell = layer.cells[1][2]
+                self.assertEqual(cell.elevation, in_memory.cells[1][2].elevation)
+                self.assertEqual(len(array._blocks), 1)
+                expected = in_memory.get_raster("elevation")[0]
+                np.testing.assert_array_equal(array[3:15, 2:20], expected[3:15, 2:20])
+                rows, cols = np.array([0, 5, 9]), np.array([3, 7, 1])
+                np.testing.assert_array_equal(array[rows, cols], expected[rows, cols])
+                # negative indices wrap around, and indices out of bounds raise
+                rows, cols = np.array([-1, -2]), np.array([0, -3])
+                np.testing.assert_array_equal(array[rows, cols], expected[rows, cols])
+                height, width = array.shape
+                for rows, cols in (
+                    ([height], [0]),
+                    ([0], [width]),
+                    ([-height - 1], [0]),
+                ):
+                    with self.assertRaises(IndexError):
+                        _ = array[np.array(rows), np.array(cols)]
+                    with self.assertRaises(IndexError):
+                        array[np.array(rows), np.array(cols)] = 0
+
+                cell.elevation = -1
+                self.assertEqual(layer.cells[1][2].elevation, -1)
+                array[0:2, 0:2] = 5
+                expected[layer.cells[1][2].indices] = -1
+                expected[0:2, 0:2] = 5
+                np.testing.assert_array_equal(
+                    layer.get_raster("elevation")[0], expected
+                )
+
+    def test_get_neighborhood_values_out_of_core(self):
+        values = np.random.default_rng(0).random((1, 40, 50)).astype(np.float32)
+        values[0, 38, 2] = -9
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raster_file = os.path.join(tmp_dir, "dem.tif")
+            self._write_raster_file(raster_file, values, nodata=-9)
+            layer = mg.RasterLayer.from_file(
+                raster_file,
+                self.model,
+                attr_name="elevation",
+                lazy=True,
+                out_of_core=True,
+            )
+            neighbors = layer.get_neighborhood_values([(2, 2)], "elevation", moore=True)
+            # only the block holding the neighborhood is read
+            self.assertEqual(len(layer._attribute_arrays["elevation"]._blocks), 1)
+            np.testing.assert_array_equal(
+                neighbors.mask,
+                [[False, False, False, True, False, False, False, False]],
+            )
+            self.assertEqual(neighbors.count(), 7)
+
+    def test_memmap_layer(self):
+        raster_data = np.array([[[1, 2], [3, 4], [5, 6]]], dtype=np.float32)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            layer = mg.RasterLayer(
+                width=2,
+                height=3,
+                crs="epsg:4326",
+                total_bounds=self.raster_layer.total_bounds,
+                model=self.model,
+                memmap_dir=tmp_dir,
+            )
+            self.assertTrue(layer.array_backed)
+            layer.apply_raster(raster_data, attr_name="elevation")
+            elevation = layer.get_raster("elevation")
+            self.assertIsInstance(elevation.base, np.memmap)
+            layer.cells[0][2].elevation = 10
+            elevation_file = os.path.join(tmp_dir, "elevation.npy")
+            np.testing.assert_array_equal(
+                np.load(elevation_file), [[10, 2], [3, 4], [5, 6]]
+            )
+
+            raster_file = os.path.join(tmp_dir, "elevation.tif")
+            layer.to_file(raster_file)
+            with rio.open(raster_file) as dataset:
+                np.testing.assert_array_equal(dataset.read(), elevation)
+
+            with tempfile.TemporaryDirectory() as replica_dir:
+                replica_layer = mg.RasterLayer.from_file(
+                    raster_file,
+                    self.model,
+                    attr_name="elevation",
+                    memmap_dir=replica_dir,
+                    lazy=True,
+                )
+                self.assertEqual(replica_layer.cells[0][2].elevation, 10)
+                del replica_layer
+
+            # a new dtype is stored in a new file, as the old one is still mapped
+            layer.apply_raster(raster_data.astype(np.int16), attr_name="elevation")
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, "elevation_1.npy")))
+            np.testing.assert_array_equal(elevation[0, 0], [10, 2])
+
+            shared_layer = mg.RasterLayer(
+                width=2,
+                height=3,
+                crs="epsg:4326",
+                total_bounds=self.raster_layer.total_bounds,
+                model=self.model,
+                cell_cls=mg.LightweightCell,
+                array_backed=True,
+            )
+            shared_layer.apply_memmap(elevation_file, attr_name="elevation")
+            self.assertEqual(shared_layer.cells[0][2].elevation, 10)
+            with self.assertRaises(ValueError):
+                shared_layer.cells[0][2].elevation = 0
+            with self.assertRaises(ValueError):
+                self.raster_layer.apply_memmap(elevation_file)
+            del elevation, layer, shared_layer
+
+    def test_nodata(self):
+        raster_data = np.array([[[1, 2], [255, 4], [5, 255]]], dtype=np.uint8)
+        self.raster_layer.apply_raster(raster_data, attr_name="landcover", nodata=255)
+        self.assertEqual(self.raster_layer.nodata, {"landcover": 255})
+
+        data = self.raster_layer.get_raster("landcover", masked=True)
+        self.assertEqual(data.dtype, np.uint8)
+        np.testing.assert_array_equal(
+            data.mask, [[[False, False], [True, False], [False, True]]]
+        )
+        self.assertEqual(data.sum(), 12)
+
+        result = self.raster_layer.focal("landcover", "max", include_center=True)
+        self.assertEqual(result[0, 2, 0], 5)
+        mean = self.raster_layer.focal("landcover", "mean")
+        self.assertEqual(mean[0, 1, 1], (1 + 2 + 5) / 3)
+        values = self.raster_layer.get_neighborhood_values(
+            [(1, 1)], "landcover", moore=True
+        )
+        self.assertEqual(sorted(values.compressed()), [1, 2, 5])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raster_file = os.path.join(tmp_dir, "landcover.tif")
+            self.raster_layer.to_file(raster_file)
+            with rio.open(raster_file) as dataset:
+                self.assertEqual(dataset.nodata, 255)
+                self.assertEqual(dataset.dtypes[0], "uint8")
+
+            layer = mg.RasterLayer.from_file(
+                raster_file, self.model, attr_name="landcover", array_backed=True
+            )
+            self.assertEqual(layer.nodata, {"landcover": 255})
+            np.testing.assert_array_equal(
+                layer.get_raster("landcover", masked=True).mask, data.mask
+            )
+
+        self.raster_layer.apply_raster(raster_data, attr_name="landcover")
+        self.assertEqual(self.raster_layer.nodata, {})
+
+    def test_to_crs(self):
+        raster_data = np.array([[[1, 2], [3, 4], [5, 6]]], dtype=np.int32)
+        for array_backed in (False, True):
+            raster_layer = mg.RasterLayer(
+                width=20,
+                height=30,
+                crs="epsg:4326",
+                total_bounds=self.raster_layer.total_bounds,
+                model=self.model,
+                array_backed=array_backed,
+            )
+            values = np.repeat(np.repeat(raster_data, 10, axis=1), 10, axis=2)
+            raster_layer.apply_raster(values, attr_name="elevation", nodata=0)
+            raster_layer.apply_raster(values > 3, attr_name="flooded")
+
+            # the cells of new layers are only created when accessed
+            num_agents = len(self.model.agents)
+            for _ in range(3):
+                raster_layer.to_crs("epsg:3857")
+            self.assertEqual(len(self.model.agents), num_agents)
+
+            transformed = raster_layer.to_crs("epsg:3857", num_threads=2)
+            self.assertTrue(transformed.lazy)
+            self.assertEqual(transformed.crs, "epsg:3857")
+            self.assertEqual(len(transformed.cells), transformed.width)
+            self.assertEqual(len(transformed.cells[0]), transformed.height)
+            self.assertEqual(transformed.attributes, {"elevation", "flooded"})
+            self.assertEqual(transformed.nodata, {"elevation": 0})
+            elevation = transformed.get_raster("elevation")
+            self.assertEqual(
+                elevation.shape, (1, transformed.height, transformed.width)
+            )
+            self.assertEqual(elevation.dtype, np.int32)
+            self.assertEqual(set(np.unique(elevation)), {1, 2, 3, 4, 5, 6})
+            self.assertEqual(transformed.get_raster("flooded").dtype, bool)
+            np.testing.assert_array_equal(
+                transformed.get_raster("flooded"), elevation > 3
+            )
+            cell = transformed.cells[0][0]
+            self.assertEqual(cell.elevation, elevation[0, -1, 0])
+
+            # no change to original layer
+            self.assertEqual(raster_layer.crs, "epsg:4326")
+            self.assertEqual((raster_layer.width, raster_layer.height), (20, 30))
+            np.testing.assert_array_equal(raster_layer.get_raster("elevation"), values)
+
+            num_agents = len(self.model.agents)
+            old_cell = raster_layer.cells[0][0]
+            raster_layer.to_crs("epsg:3857", inplace=True)
+            self.assertEqual(
+                (raster_layer.width, raster_layer.height),
+                (transformed.width, transformed.height),
+            )
+            np.testing.assert_array_equal(
+                raster_layer.get_raster("elevation"), elevation
+            )
+            self.assertNotIn(old_cell, self.model.agents)
+            self.assertEqual(
+                len(self.model.agents),
+                num_agents - 20 * 30 + transformed.width * transformed.height,
+            )
+
+    def test_to_crs_outside_of_footprint(self):
+        raster_layer = mg.RasterLayer(
+            width=40,
+            height=40,
+            crs="epsg:4326",
+            total_bounds=[0, 40, 20, 60],
+            model=self.model,
+            array_backed=True,
+        )
+        raster_layer.apply_raster(np.full((1, 40, 40), 500.0), attr_name="elevation")
+        raster_layer.apply_raster(
+            np.full((1, 40, 40), 7, dtype=np.int16), attr_name="landcover"
+        )
+        transformed = raster_layer.to_crs("epsg:3035")
+
+        # cells outside of the original grid hold nodata rather than made-up values
+        elevation = transformed.get_raster("elevation")
+        outside = np.isnan(elevation)
+        self.assertTrue(outside.any())
+        np.testing.assert_array_equal(elevation[~outside], 500.0)
+        self.assertTrue(np.isnan(transformed.nodata["elevation"]))
+        self.assertTrue(transformed.get_raster("elevation", masked=True).mask.any())
+        landcover = transformed.get_raster("landcover")
+        self.assertEqual(transformed.nodata["landcover"], -32768)
+        np.testing.assert_array_equal(landcover[outside], -32768)
+        np.testing.assert_array_equal(landcover[~outside], 7)
+
+    def test_to_crs_cache(self):
+        raster_layer = mg.RasterLayer(
+            width=2,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            array_backed=True,
+        )
+        raster_layer.apply_raster(np.ones((1, 3, 2)), attr_name="elevation")
+        transformed = raster_layer.to_crs("epsg:3857")
+        self.assertIs(raster_layer.to_crs("epsg:3857"), transformed)
+
+        raster_layer.cells[0][0].elevation = 2
+        self.assertIsNot(raster_layer.to_crs("epsg:3857"), transformed)
+
+        # object-mode layers are not cached, as changes to the cells cannot be tracked
+        self.raster_layer.apply_raster(np.ones((1, 3, 2)), attr_name="elevation")
+        self.assertIsNot(
+            self.raster_layer.to_crs("epsg:3857"), self.raster_layer.to_crs("epsg:3857")
+        )
+
+    def test_overviews(self):
+        raster_layer = mg.RasterLayer(
+            width=5,
+            height=4,
+            crs="epsg:4326",
+            total_bounds=[0, 0, 5, 4],
+            model=self.model,
+            array_backed=True,
+        )
+        values = np.arange(20, dtype=np.int16).reshape(1, 4, 5)
+        values[0, 0, 0] = -1
+        raster_layer.apply_raster(values, attr_name="elevation", nodata=-1)
+        raster_layer.build_overviews("elevation", factors=(4, 2), aggregation="max")
+
+        np.testing.assert_array_equal(
+            raster_layer.get_overview("elevation", 2), [[[6, 8, 9], [16, 18, 19]]]
+        )
+        np.testing.assert_array_equal(
+            raster_layer.get_overview("elevation", 4), [[[18, 19]]]
+        )
+        self.assertEqual(raster_layer.get_overview("elevation", 2).dtype, np.int16)
+        self.assertEqual(
+            raster_layer.get_overview_transform(2),
+            rio.transform.from_origin(0, 4, 2, 2),
+        )
+        with self.assertRaises(ValueError):
+            raster_layer.get_overview("elevation", 8)
+        with self.assertRaises(ValueError):
+            raster_layer.build_overviews("elevation", aggregation="median")
+
+        raster_layer.cells[4][3].elevation = 100
+        np.testing.assert_array_equal(
+            raster_layer.get_overview("elevation", 4), [[[18, 100]]]
+        )
+
+        raster_layer.build_overviews("elevation", factors=(2,), aggregation="mean")
+        np.testing.assert_array_equal(
+            raster_layer.get_overview("elevation", 2),
+            [[[(1 + 5 + 6) / 3, 5, (100 + 9) / 2], [13, 15, 16.5]]],
+        )
+
+        # overviews of object-mode layers are built on each access
+        self.raster_layer.apply_raster(
+            np.array([[[1, 2], [3, 4], [5, 6]]]), attr_name="elevation"
+        )
+        self.raster_layer.build_overviews("elevation", factors=(2,), aggregation="sum")
+        np.testing.assert_array_equal(
+            self.raster_layer.get_overview("elevation", 2), [[[10], [11]]]
+        )
+        self.raster_layer.cells[0][0].elevation = 10
+        np.testing.assert_array_equal(
+            self.raster_layer.get_overview("elevation", 2), [[[10], [16]]]
+        )
+
+        # a nan nodata value, as is usual for floating-point rasters
+        values = np.arange(20, dtype=np.float64).reshape(1, 4, 5)
+        values[0, 0, 0] = np.nan
+        raster_layer.apply_raster(values, attr_name="depth", nodata=np.nan)
+        raster_layer.build_overviews("depth", factors=(2,), aggregation="mean")
+        np.testing.assert_array_equal(
+            raster_layer.get_overview("depth", 2),
+            [[[(1 + 5 + 6) / 3, 5, 6.5], [13, 15, 16.5]]],
+        )
+
+    def test_coarsen_and_refine(self):
+        raster_layer = mg.RasterLayer(
+            width=5,
+            height=4,
+            crs="epsg:3857",
+            total_bounds=[0, 0, 5, 4],
+            model=self.model,
+            lazy=True,
+        )
+        elevation = np.arange(20, dtype=np.int16).reshape(1, 4, 5)
+        elevation[0, 0, 0] = -1
+        raster_layer.apply_raster(elevation, attr_name="elevation", nodata=-1)
+        land_cover = np.array(
+            [[[1, 1, 2, 3, 3], [2, 1, 2, 2, 3], [4, 4, 5, 6, 0], [0, 0, 5, 6, 0]]],
+            dtype=np.uint8,
+        )
+        raster_layer.apply_raster(land_cover, attr_name="land_cover", nodata=0)
+
+        coarse = raster_layer.coarsen(2, how="mode", attr_name="land_cover")
+        self.assertTrue(coarse.lazy)
+        self.assertEqual((coarse.width, coarse.height), (3, 2))
+        self.assertEqual(coarse.transform, rio.transform.from_origin(0, 4, 2, 2))
+        np.testing.assert_array_equal(coarse.total_bounds, [0, 0, 6, 4])
+        self.assertEqual(coarse.attributes, {"land_cover"})
+        self.assertEqual(coarse.nodata, {"land_cover": 0})
+        np.testing.assert_array_equal(
+            coarse.get_raster("land_cover"), [[[1, 2, 3], [4, 5, 0]]]
+        )
+        self.assertEqual(coarse.get_raster("land_cover").dtype, np.uint8)
+
+        coarse = raster_layer.coarsen(2, how="max")
+        self.assertEqual(coarse.attributes, {"elevation", "land_cover"})
+        np.testing.assert_array_equal(
+            coarse.get_raster("elevation"), [[[6, 8, 9], [16, 18, 19]]]
+        )
+        # a nan nodata value is left out of the aggregation
+        depth = np.arange(20, dtype=np.float64).reshape(1, 4, 5)
+        depth[0, 0, 0] = np.nan
+        depth[0, 2:, 4] = np.nan
+        raster_layer.apply_raster(depth, attr_name="depth", nodata=np.nan)
+        for how, expected in (
+            ("mean", [[4, 5, 6.5], [13, 15, np.nan]]),
+            ("sum", [[12, 20, 13], [52, 60, np.nan]]),
+            ("min", [[1, 2, 4], [10, 12, np.nan]]),
+            ("max", [[6, 8, 9], [16, 18, np.nan]]),
+            ("mode", [[1, 2, 4], [10, 12, np.nan]]),
+        ):
+            np.testing.assert_array_equal(
+                raster_layer.coarsen(2, how=how, attr_name="depth").get_raster(),
+                [expected],
+            )
+        with self.assertRaises(ValueError):
+            raster_layer.coarsen(2, how="median")
+        with self.assertRaises(ValueError):
+            raster_layer.coarsen(0)
+        with self.assertRaises(ValueError):
+            raster_layer.coarsen(2, attr_name="temperature")
+
+        fine = coarse.refine(2, attr_name="elevation")
+        self.assertEqual((fine.width, fine.height), (6, 4))
+        np.testing.assert_array_equal(fine.total_bounds, coarse.total_bounds)
+        self.assertEqual(fine.transform, rio.transform.from_origin(0, 4, 1, 1))
+        np.testing.assert_array_equal(
+            fine.get_raster("elevation")[0, :2], [[6, 6, 8, 8, 9, 9]] * 2
+        )
+        self.assertEqual(fine.nodata, {"elevation": -1})
+        self.assertEqual(fine.cells[5][0].elevation, 19)
+
+        # object-mode layers produce object-mode layers
+        self.raster_layer.apply_raster(
+            np.array([[[1, 2], [3, 4], [5, 6]]]), attr_name="elevation"
+        )
+        coarse = self.raster_layer.coarsen(2, how="sum")
+        self.assertFalse(coarse.array_backed)
+        np.testing.assert_array_equal(coarse.get_raster("elevation"), [[[10], [11]]])
+        self.assertEqual(coarse.cells[0][0].elevation, 11)
+
+    def test_resample_to(self):
+        climate = mg.RasterLayer(
+            width=2,
+            height=2,
+            crs="epsg:3857",
+            total_bounds=[0, 0, 4, 4],
+            model=self.model,
+            array_backed=True,
+        )
+        climate.apply_raster(
+            np.array([[[10.0, 20.0], [30.0, 40.0]]]), attr_name="temperature"
+        )
+        land_cover = mg.RasterLayer(
+            width=4,
+            height=4,
+            crs="epsg:3857",
+            total_bounds=[0, 0, 4, 4],
+            model=self.model,
+            array_backed=True,
+        )
+        climate.resample_to(land_cover)
+        self.assertEqual(land_cover.attributes, {"temperature"})
+        np.testing.assert_array_equal(
+            land_cover.get_raster("temperature"),
+            climate.refine(2).get_raster("temperature"),
+        )
+
+        land_cover.apply_raster(np.ones((1, 4, 4)), attr_name="vegetation", nodata=-1)
+        land_cover.resample_to(
+            climate, attr_name="vegetation", resampling=rio.enums.Resampling.average
+        )
+        np.testing.assert_array_equal(
+            climate.get_raster("vegetation"), np.ones((1, 2, 2))
+        )
+        self.assertEqual(climate.nodata, {"vegetation": -1})
+
+        # onto a grid in another crs, extending beyond the bounds of the source
+        other = mg.RasterLayer(
+            width=3,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=[0, 0, 6e-5, 6e-5],
+            model=self.model,
+        )
+        climate.resample_to(other, attr_name="vegetation")
+        vegetation = other.get_raster("vegetation")
+        self.assertEqual(vegetation.shape, (1, 3, 3))
+        self.assertEqual(set(np.unique(vegetation)), {-1, 1})
+        self.assertEqual(other.cells[0][0].vegetation, 1)
+
+    def test_flow_direction(self):
+        raster_layer = mg.RasterLayer(
+            width=3,
+            height=3,
+            crs="epsg:3857",
+            total_bounds=[0, 0, 3, 3],
+            model=self.model,
+            array_backed=True,
+        )
+        elevation = np.array([[[9, 8, 7], [8, 5, 4], [7, 4, 0]]], dtype=np.int32)
+        raster_layer.apply_raster(elevation, attr_name="elevation")
+        raster_layer.apply_raster(np.zeros((1, 3, 3)), attr_name="water_level")
+
+        directions = raster_layer.get_flow_direction("elevation")
+        self.assertEqual(directions.shape, (1, 3, 3))
+        # every cell flows to its steepest lower neighbor, the pit at the bottom right
+        # has no lower neighbor
+        np.testing.assert_array_equal(directions, [[[4, 4, 5], [4, 8, 8], [7, 8, -1]]])
+        self.assertIs(
+            raster_layer.get_flow_direction("elevation").base, directions.base
+        )
+
+        accumulation = raster_layer.get_flow_accumulation("elevation")
+        np.testing.assert_array_equal(accumulation, [[[1, 1, 1], [1, 4, 2], [1, 2, 9]]])
+        weighted = raster_layer.get_flow_accumulation(
+            "elevation", weights=np.full((1, 3, 3), 2.0)
+        )
+        np.testing.assert_array_equal(weighted, 2 * accumulation)
+
+        positions = raster_layer.flow_downstream([(0, 2), (2, 2), (2, 0)], "elevation")
+        np.testing.assert_array_equal(positions, [[1, 1], [2, 1], [2, 0]])
+        positions = raster_layer.flow_downstream([(0, 2), (2, 2)], "elevation", steps=5)
+        np.testing.assert_array_equal(positions, [[2, 0], [2, 0]])
+        with self.assertRaises(ValueError):
+            raster_layer.flow_downstream([(3, 0)], "elevation")
+
+        # water filling the pit makes it flow into a neighbor, which becomes a pit
+        surface = ["elevation", "water_level"]
+        raster_layer.get_flow_direction(surface)
+        raster_layer.cells[2][0].water_level = 5
+        raster_layer.update_flow_direction(surface, [(2, 0)])
+        updated = raster_layer.get_flow_direction(surface)
+        self.assertEqual(updated[0, 2, 2], 7)
+        self.assertEqual(updated[0, 2, 1], -1)
+        self.assertEqual(updated[0, 1, 2], -1)
+        water_level = raster_layer.get_raster("water_level").copy()
+        raster_layer.apply_raster(water_level, attr_name="water_level")
+        np.testing.assert_array_equal(raster_layer.get_flow_direction(surface), updated)
+
+    def test_apply_kernel(self):
+        for array_backed in (False, True):
+            raster_layer = mg.RasterLayer(
+                width=4,
+                height=3,
+                crs="epsg:4326",
+                total_bounds=self.raster_layer.total_bounds,
+                model=self.model,
+                array_backed=array_backed,
+            )
+            alive = np.zeros((1, 3, 4), dtype=bool)
+            alive[0, 1, :3] = True
+            raster_layer.apply_raster(alive, attr_name="alive")
+
+            def life(alive, raster_layer=raster_layer):
+                neighbors = raster_layer.get_neighbor_stack(alive).sum(axis=0)
+                return (neighbors == 3) | (alive & (neighbors == 2))
+
+            view = raster_layer.get_raster("alive")
+
+            # a blinker oscillates only if all cells are updated synchronously
+            raster_layer.apply_kernel(life, inputs=["alive"], outputs=["alive"])
+            vertical = np.zeros((3, 4), dtype=bool)
+            vertical[:, 1] = True
+            np.testing.assert_array_equal(raster_layer.get_raster("alive")[0], vertical)
+            self.assertTrue(raster_layer.cells[1][0].alive)
+            raster_layer.apply_kernel(life, inputs=["alive"], outputs=["alive"])
+            np.testing.assert_array_equal(raster_layer.get_raster("alive"), alive)
+            if array_backed:
+                # views of the attribute stay live across updates
+                self.assertIs(raster_layer.get_raster("alive").base, view.base)
+                raster_layer.apply_kernel(life, inputs=["alive"], outputs=["alive"])
+                np.testing.assert_array_equal(view[0], vertical)
+                raster_layer.apply_kernel(life, inputs=["alive"], outputs=["alive"])
+                np.testing.assert_array_equal(view, alive)
+
+            raster_layer.apply_kernel(
+                lambda alive: (alive.astype(np.int8), ~alive),
+                inputs=["alive"],
+                outputs=["count", "dead"],
+            )
+            self.assertEqual(raster_layer.get_raster("count").dtype, np.int8)
+            np.testing.assert_array_equal(raster_layer.get_raster("dead"), ~alive)
+
+            with self.assertRaises(ValueError):
+                raster_layer.apply_kernel(life, inputs=["alive"], outputs=["a", "b"])
+            with self.assertRaises(ValueError):
+                raster_layer.apply_kernel(
+                    lambda alive: alive[0], inputs=["alive"], outputs=["alive"]
+                )
+            with self.assertRaises(ValueError):
+
+                def write_input(alive):
+                    alive[0, 0] = True
+                    return alive
+
+                raster_layer.apply_kernel(
+                    write_input, inputs=["alive"], outputs=["alive"]
+                )
+
+    def test_apply_algebra(self):
+        def make_layer(array_backed=True, total_bounds=(0, 0, 2, 3)):
+            return mg.RasterLayer(
+                width=2,
+                height=3,
+                crs="epsg:3857",
+                total_bounds=list(total_bounds),
+                model=self.model,
+                array_backed=array_backed,
+            )
+
+        terrain, land, target = make_layer(), make_layer(False), make_layer()
+        self.assertTrue(terrain.is_aligned(land))
+        self.assertTrue(terrain.is_aligned(land))
+        self.assertFalse(terrain.is_aligned(make_layer(total_bounds=(0, 0, 4, 6))))
+        land.crs = "epsg:4326"
+        self.assertFalse(terrain.is_aligned(land))
+        land.crs = "epsg:3857"
+
+        terrain.apply_raster(
+            np.array([[[5, 20], [10, -1], [1, 2]]], dtype=np.int16),
+            attr_name="slope",
+            nodata=-1,
+        )
+        land.apply_raster(np.array([[[3, 3], [1, 3], [3, 3]]]), attr_name="land_cover")
+        target.apply_raster(np.full((1, 3, 2), 0.5), attr_name="distance")
+        suitability = np.zeros((3, 2))
+        target.apply_raster(suitability[np.newaxis], attr_name="suitability")
+        view = target.get_raster("suitability")
+
+        def suitability_fn(slope, land_cover, distance):
+            self.assertFalse(slope.flags.writeable)
+            return (slope < 15) * (land_cover == 3) * distance
+
+        target.apply_algebra(
+            suitability_fn,
+            inputs=[(terrain, "slope"), (land, "land_cover"), "distance"],
+            output="suitability",
+            nodata=-1.0,
+        )
+        np.testing.assert_array_equal(view, [[[0.5, 0], [0, -1], [0.5, 0.5]]])
+        self.assertEqual(target.nodata, {"suitability": -1.0})
+        self.assertEqual(target.cells[1][1].suitability, -1)
+
+        # a result that is a view of an input is not written to
+        target.apply_algebra(lambda slope: slope, [(terrain, "slope")], "slope", 0)
+        np.testing.assert_array_equal(
+            target.get_raster("slope"), [[[5, 20], [10, 0], [1, 2]]]
+        )
+        np.testing.assert_array_equal(
+            terrain.get_raster("slope"), [[[5, 20], [10, -1], [1, 2]]]
+        )
+
+        # object-mode target layers
+        land.apply_algebra(lambda a, b: a + b, ["land_cover", (target, "slope")], "sum")
+        self.assertEqual(land.cells[1][1].sum, 3)
+
+        with self.assertRaises(ValueError):
+            target.apply_algebra(
+                lambda slope: slope,
+                [(make_layer(total_bounds=(0, 0, 4, 6)), "slope")],
+                "slope",
+            )
+        with self.assertRaises(ValueError):
+            target.apply_algebra(lambda x: x, [(terrain, "elevation")], "slope")
+        with self.assertRaises(ValueError):
+            target.apply_algebra(lambda x: x[0], ["slope"], "slope")
+
+    def test_get_neighbor_stack(self):
+        values = np.arange(6).reshape(3, 2)
+        stack = self.raster_layer.get_neighbor_stack(values, moore=False, fill_value=-1)
+        self.assertEqual(stack.shape, (4, 3, 2))
+        # the neighbors of position (0, 1), at row 1 and column 0, in the order of
+        # get_neighborhood, padded with the fill value outside of the raster
+        neighborhood = self.raster_layer.get_neighborhood((0, 1), moore=False)
+        self.assertEqual(neighborhood, [(0, 0), (0, 2), (1, 1)])
+        self.assertEqual(list(stack[:, 1, 0]), [-1, 4, 0, 3])
+
+    def test_apply_cell_kernel(self):
+        raster_layer = mg.RasterLayer(
+            width=4,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            array_backed=True,
+        )
+        burning = np.zeros((1, 3, 4), dtype=bool)
+        burning[0, 0, 0] = True
+        raster_layer.apply_raster(burning, attr_name="burning")
+        raster_layer.apply_raster(np.zeros((1, 3, 4)), attr_name="draw")
+        raster_layer.apply_raster(np.zeros((1, 3, 4), dtype=np.int64), "neighbors")
+
+        def spread(row, col, neighbors, inputs, outputs):
+            burning, draw = inputs
+            height, width = burning.shape
+            count = 0
+            for i in range(neighbors.shape[0]):
+                r, c = row + neighbors[i, 0], col + neighbors[i, 1]
+                if 0 <= r < height and 0 <= c < width and burning[r, c]:
+                    count += 1
+            outputs[1][row, col] = count
+            if count > 0 and draw[row, col] < 0.5:
+                outputs[0][row, col] = True
+
+        for jit in (True, False):
+            raster_layer.apply_raster(burning, attr_name="burning")
+            raster_layer.apply_cell_kernel(
+                spread,
+                inputs=["burning", "draw"],
+                outputs=["burning", "neighbors"],
+                moore=False,
+                jit=jit,
+            )
+            expected = np.zeros((3, 4), dtype=bool)
+            expected[0, :2] = expected[1, 0] = True
+            np.testing.assert_array_equal(
+                raster_layer.get_raster("burning")[0], expected
+            )
+            np.testing.assert_array_equal(
+                raster_layer.get_raster("neighbors")[0],
+                [[0, 1, 0, 0], [1, 0, 0, 0], [0, 0, 0, 0]],
+            )
+
+        with self.assertRaises(ValueError):
+            raster_layer.apply_cell_kernel(spread, inputs=["burning"], outputs=["x"])
+
+    @unittest.skipUnless(numba, "numba is not installed")
+    def test_apply_cell_kernel_jit(self):
+        raster_layer = mg.RasterLayer(
+            width=4,
+            height=3,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            array_backed=True,
+        )
+        raster_layer.apply_raster(np.zeros((1, 3, 4), dtype=np.int64), "count")
+        cached_loops = len(mg.raster_layers._compiled_cell_loops)
+
+        def make_kernel(increment):
+            def count(row, col, neighbors, inputs, outputs):
+                outputs[0][row, col] = inputs[0][row, col] + increment
+
+            return count
+
+        for step in range(3):
+            # a new function on each step, as when defined in the step of a model
+            raster_layer.apply_cell_kernel(
+                make_kernel(2), inputs=["count"], outputs=["count"], jit=True
+            )
+            np.testing.assert_array_equal(
+                raster_layer.get_raster("count")[0], np.full((3, 4), 2 * (step + 1))
+            )
+        # the loop is compiled once, and reused for the later definitions
+        self.assertEqual(len(mg.raster_layers._compiled_cell_loops), cached_loops + 1)
+
+        # functions compiled with Numba already are cached by themselves
+        compiled = numba.njit(make_kernel(-6))
+        for _ in range(2):
+            raster_layer.apply_cell_kernel(
+                compiled, inputs=["count"], outputs=["count"], jit=True
+            )
+        np.testing.assert_array_equal(raster_layer.get_raster("count")[0], -6)
+        self.assertEqual(len(mg.raster_layers._compiled_cell_loops), cached_loops + 2)
+
+    def test_get_positions(self):
+        positions = self.raster_layer.get_positions()
+        self.assertEqual(
+            positions.tolist(), [[0, 2], [1, 2], [0, 1], [1, 1], [0, 0], [1, 0]]
+        )
+        shuffled = self.raster_layer.get_positions(shuffle=True)
+        self.assertEqual(sorted(shuffled.tolist()), sorted(positions.tolist()))
+
+        mask = np.array([[[True, False], [False, False], [False, True]]])
+        self.assertEqual(
+            self.raster_layer.get_positions(mask).tolist(), [[0, 2], [1, 0]]
+        )
+        with self.assertRaises(ValueError):
+            self.raster_layer.get_positions(mask[0])
+
+        cells = list(self.raster_layer.iter_cells([(0, 2), (1, 0)]))
+        self.assertEqual([cell.pos for cell in cells], [(0, 2), (1, 0)])
+
+    def test_shuffle_do(self):
+        class CountingCell(mg.Cell):
+            steps = 0
+
+            def step(self):
+                self.steps += 1
+
+        raster_layer = mg.RasterLayer(
+            width=10,
+            height=10,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            cell_cls=CountingCell,
+            lazy=True,
+        )
+        active = np.zeros((1, 10, 10), dtype=bool)
+        active[0, 2, 3] = active[0, 5, 5] = True
+        raster_layer.shuffle_do("step", mask=active)
+        # only the active cells are created
+        self.assertEqual(len(raster_layer._materialized_cells), 2)
+        self.assertEqual(raster_layer.cells[3][7].steps, 1)
+
+        visited = []
+        raster_layer.shuffle_do(lambda cell, scale: visited.append(cell.pos), 2)
+        self.assertEqual(len(visited), 100)
+        self.assertEqual(len(set(visited)), 100)
+
+    def test_to_image(self):
+        self.raster_layer.apply_raster(
+            np.array([[[1, 2], [3, 0], [2, 1]]], dtype=np.uint8),
+            attr_name="land_cover",
+            nodata=0,
+        )
+        self.raster_layer.apply_raster(
+            np.array([[[0.0, 0.5], [1.0, np.nan], [0.25, 0.75]]]),
+            attr_name="elevation",
+            nodata=np.nan,
+        )
+
+        # one call per cell
+        image = self.raster_layer.to_image(lambda cell: (cell.land_cover, 0, 0, 1))
+        np.testing.assert_array_equal(image.values[0], [[1, 2], [3, 0], [2, 1]])
+
+        image = self.raster_layer.to_image(
+            {1: (255, 0, 0), 2: (0.0, 1.0, 0.0, 0.5)}, attr_name="land_cover"
+        )
+        self.assertEqual(image.values.dtype, np.uint8)
+        self.assertEqual(image.values.shape, (4, 3, 2))
+        np.testing.assert_array_equal(
+            image.total_bounds, self.raster_layer.total_bounds
+        )
+        np.testing.assert_array_equal(image.values[:, 0, 0], [255, 0, 0, 255])
+        np.testing.assert_array_equal(image.values[:, 0, 1], [0, 255, 0, 128])
+        # a value missing from the dictionary, and nodata
+        np.testing.assert_array_equal(image.values[:, 1, 0], [0, 0, 0, 0])
+        np.testing.assert_array_equal(image.values[:, 1, 1], [0, 0, 0, 0])
+
+        table = np.array([[0, 0, 0], [10, 10, 10], [20, 20, 20]])
+        image = self.raster_layer.to_image(table, attr_name="land_cover")
+        np.testing.assert_array_equal(image.values[0], [[10, 20], [0, 0], [20, 10]])
+        np.testing.assert_array_equal(image.values[3], [[255, 255], [0, 0], [255, 255]])
+        with self.assertRaises(ValueError):
+            self.raster_layer.to_image(table, attr_name="elevation")
+
+        image = self.raster_layer.to_image(
+            lambda values: np.stack([values] * 3, axis=-1), attr_name="elevation"
+        )
+        np.testing.assert_array_equal(image.values[0], [[0, 128], [255, 0], [64, 191]])
+        np.testing.assert_array_equal(
+            image.values[3], [[255, 255], [255, 0], [255, 255]]
+        )
+        with self.assertRaises(ValueError):
+            self.raster_layer.to_image(lambda values: values, attr_name="elevation")
+        with self.assertRaises(ValueError):
+            self.raster_layer.to_image(table, attr_name="temperature")
+
+    def test_to_image_matplotlib(self):
+        colormap = colors.ListedColormap([(0, 0, 0), (1, 1, 1)])
+        self.raster_layer.apply_raster(
+            np.array([[[10, 20], [30, -1], [40, 10]]]), attr_name="elevation", nodata=-1
+        )
+        image = self.raster_layer.to_image(colormap, attr_name="elevation")
+        np.testing.assert_array_equal(image.values[0], [[0, 0], [255, 0], [255, 0]])
+        np.testing.assert_array_equal(
+            image.values[3], [[255, 255], [255, 0], [255, 255]]
+        )
+
+        image = self.raster_layer.to_image(
+            colormap, attr_name="elevation", norm=colors.Normalize(vmin=0, vmax=20)
+        )
+        # values above vmax take the last color
+        np.testing.assert_array_equal(
+            image.values[0], [[255, 255], [255, 0], [255, 255]]
+        )
+
+    def test_to_file_options(self):
+        raster_layer = mg.RasterLayer(
+            width=64,
+            height=32,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            array_backed=True,
+        )
+        elevation = np.arange(32 * 64, dtype=np.int16).reshape(1, 32, 64)
+        raster_layer.apply_raster(elevation, attr_name="elevation")
+        raster_layer.apply_raster(elevation > 100, attr_name="flooded")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raster_file = os.path.join(tmp_dir, "compressed.tif")
+            raster_layer.to_file(
+                raster_file,
+                attr_name=["elevation", "flooded"],
+                tiled=True,
+                blockxsize=16,
+                blockysize=16,
+                compress="deflate",
+                predictor=2,
+            )
+            with rio.open(raster_file) as dataset:
+                self.assertEqual(dataset.dtypes, ("int16", "int16"))
+                self.assertEqual(dataset.descriptions, ("elevation", "flooded"))
+                self.assertEqual(dataset.compression, rio.enums.Compression.deflate)
+                self.assertEqual(dataset.block_shapes, [(16, 16), (16, 16)])
+                np.testing.assert_array_equal(dataset.read(1), elevation[0])
+                np.testing.assert_array_equal(dataset.read(2), elevation[0] > 100)
+
+            raster_file = os.path.join(tmp_dir, "background.tif")
+            future = raster_layer.to_file(
+                raster_file, attr_name="elevation", dtype="float32", background=True
+            )
+            # the snapshot is taken before returning
+            raster_layer.apply_raster(elevation * 0, attr_name="elevation")
+            self.assertIsNone(future.result())
+            with rio.open(raster_file) as dataset:
+                self.assertEqual(dataset.dtypes, ("float32",))
+                np.testing.assert_array_equal(dataset.read(1), elevation[0])
+
+            future = raster_layer.to_file(
+                os.path.join(tmp_dir, "missing", "background.tif"), background=True
+            )
+            with self.assertRaises(rio.errors.RasterioIOError):
+                future.result()
+
+    def test_track_changes(self):
+        raster_layer = mg.RasterLayer(
+            width=10,
+            height=6,
+            crs="epsg:3857",
+            total_bounds=[0, 0, 10, 6],
+            model=self.model,
+            array_backed=True,
+        )
+        raster_layer.apply_raster(np.zeros((1, 6, 10), dtype=np.uint8), "fire")
+        with self.assertRaises(ValueError):
+            raster_layer.get_changed_windows("fire")
+        raster_layer.track_changes("fire", tile_size=4)
+
+        windows, token = raster_layer.get_changed_windows("fire")
+        self.assertEqual(len(windows), 6)
+        self.assertEqual(windows[-1], rio.windows.Window(8, 4, 2, 2))
+        self.assertEqual(raster_layer.get_changed_windows("fire", since=token)[0], [])
+
+        # the cell at (x, y) = (5, 0) is at (row, col) = (5, 5)
+        raster_layer.cells[5][0].fire = 1
+        windows, other_token = raster_layer.get_changed_windows("fire", since=token)
+        self.assertEqual(windows, [rio.windows.Window(4, 4, 4, 2)])
+        raster_layer.values("fire")[0:2, 5] = 2
+        windows, other_token = raster_layer.get_changed_windows(
+            "fire", since=other_token
+        )
+        self.assertEqual(windows, [rio.windows.Window(0, 0, 4, 4)])
+        # tokens of other consumers are not affected
+        windows, token = raster_layer.get_changed_windows("fire", since=token)
+        self.assertEqual(len(windows), 2)
+
+        # kernels and applied rasters only mark the tiles whose values differ
+        raster_layer.apply_kernel(lambda fire: fire, inputs=["fire"], outputs=["fire"])
+        self.assertEqual(raster_layer.get_changed_windows("fire", since=token)[0], [])
+
+        def ignite(fire):
+            fire = fire.copy()
+            fire[5, 9] = 3
+            return fire
+
+        raster_layer.apply_kernel(ignite, inputs=["fire"], outputs=["fire"])
+        windows, token = raster_layer.get_changed_windows("fire", since=token)
+        self.assertEqual(windows, [rio.windows.Window(8, 4, 2, 2)])
+        raster_data = raster_layer.get_raster("fire").copy()
+        raster_data[0, 0, 0] = 4
+        raster_layer.apply_raster(raster_data, "fire")
+        windows, token = raster_layer.get_changed_windows("fire", since=token)
+        self.assertEqual(windows, [rio.windows.Window(0, 0, 4, 4)])
+
+        # untracked attributes and object-mode layers
+        raster_layer.apply_raster(np.zeros((1, 6, 10)), "fuel")
+        raster_layer.cells[0][0].fuel = 1
+        with self.assertRaises(ValueError):
+            raster_layer.track_changes("vegetation")
+        self.raster_layer.apply_raster(np.zeros((1, 3, 2)), "fire")
+        with self.assertRaises(ValueError):
+            self.raster_layer.track_changes("fire")
+
+    def test_track_changes_consumers(self):
+        raster_layer = mg.RasterLayer(
+            width=10,
+            height=6,
+            crs="epsg:3857",
+            total_bounds=[0, 0, 10, 6],
+            model=self.model,
+            array_backed=True,
+        )
+        raster_layer.apply_raster(np.zeros((1, 6, 10), dtype=np.uint8), "fire")
+        raster_layer.track_changes("fire", tile_size=4)
+        colors = {0: (0, 0, 0), 1: (255, 0, 0)}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raster_file = os.path.join(tmp_dir, "fire.tif")
+            raster_layer.to_file(raster_file, attr_name="fire")
+            image = raster_layer.to_image(colors, attr_name="fire")
+            _, token = raster_layer.get_changed_windows("fire")
+
+            raster_layer.cells[9][5].fire = 1
+            raster_layer.get_raster("fire")[0, 5, 0] = 1  # not tracked
+            windows, token = raster_layer.get_changed_windows("fire", since=token)
+            self.assertEqual(windows, [rio.windows.Window(8, 0, 2, 4)])
+
+            updated = raster_layer.to_image(
+                colors, attr_name="fire", image=image, windows=windows
+            )
+            self.assertIs(updated, image)
+            self.assertEqual(image.values[0, 0, 9], 255)
+            self.assertEqual(image.values[0, 5, 0], 0)
+            self.assertEqual(image.values[0].sum(), 255)
+
+            future = raster_layer.to_file(
+                raster_file, attr_name="fire", windows=windows, background=True
+            )
+            future.result()
+            with rio.open(raster_file) as dataset:
+                values = dataset.read(1)
+            self.assertEqual(values[0, 9], 1)
+            self.assertEqual(values.sum(), 1)
+
+            raster_layer.to_image(colors, attr_name="fire", image=image)
+            self.assertEqual(image.values[0, 5, 0], 255)
+            with self.assertRaises(ValueError):
+                raster_layer.to_image(colors, attr_name="fire", windows=windows)
+            with self.assertRaises(ValueError):
+                self.raster_layer.to_image(colors, attr_name="fire", image=image)
+
+    def test_raster_recorder(self):
+        raster_layer = mg.RasterLayer(
+            width=5,
+            height=4,
+            crs="epsg:4326",
+            total_bounds=self.raster_layer.total_bounds,
+            model=self.model,
+            array_backed=True,
+        )
+        raster_layer.apply_raster(np.zeros((1, 4, 5), dtype=np.int32), "population")
+        raster_layer.apply_raster(np.full((1, 4, 5), np.nan), "water", nodata=-1.0)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "run")
+            recorder = mg.RasterRecorder(raster_layer, path, block_size=2)
+            self.assertEqual(recorder.attributes, ["population", "water"])
+            snapshots = []
+            for step in range(4):
+                if step == 2:
+                    raster_layer.cells[4][0].population = 7
+                snapshots.append(raster_layer.get_raster("population").copy())
+                recorder.record(step)
+            with self.assertRaises(ValueError):
+                recorder.record(3)
+
+            # only the block holding the changed cell is written after the first step
+            index_file = os.path.join(path, "population.idx")
+            self.assertEqual(np.fromfile(index_file, dtype=np.int64).size, 4 * 7)
+            self.assertEqual(
+                os.path.getsize(os.path.join(path, "water.dat")), 4 * 5 * 8
+            )
+
+            reader = mg.RasterRecorder.open(path)
+            self.assertEqual(reader.steps.tolist(), [0, 1, 2, 3])
+            self.assertEqual(reader.crs, raster_layer.crs)
+            self.assertTrue(reader.transform.almost_equals(raster_layer.transform))
+            self.assertEqual(reader.nodata, {"water": -1.0})
+            for step, snapshot in enumerate(snapshots):
+                values = reader.read("population", step)
+                self.assertEqual(values.dtype, np.int32)
+                np.testing.assert_array_equal(values, snapshot)
+            self.assertTrue(np.isnan(reader.read("water")).all())
+            with self.assertRaises(ValueError):
+                reader.read("population", 4)
+            with self.assertRaises(ValueError):
+                reader.record()
+            with self.assertRaises(ValueError):
+                mg.RasterRecorder(raster_layer, path)
+
+    def test_values(self):
+        raster_data = np.array([[[1, 2], [3, 4], [5, 6]]])
+        for array_backed in (False, True):
+            raster_layer = mg.RasterLayer(
+                width=2,
+                height=3,
+                crs="epsg:4326",
+                total_bounds=self.raster_layer.total_bounds,
+                model=self.model,
+                array_backed=array_backed,
+            )
+            raster_layer.apply_raster(raster_data, attr_name="fuel")
+            fuel = raster_layer.values("fuel")
+            self.assertEqual(fuel.shape, (2, 3))
+            for cell in raster_layer:
+                self.assertEqual(fuel[cell.pos], cell.fuel)
+            np.testing.assert_array_equal(fuel[0, 1:], [3, 1])
+            np.testing.assert_array_equal(np.asarray(fuel), [[5, 3, 1], [6, 4, 2]])
+            with self.assertRaises(ValueError):
+                fuel[0, 1:][0] = 0
+
+            fuel[0:2, 0] = 0
+            fuel[1, 2] = 9
+            np.testing.assert_array_equal(
+                raster_layer.get_raster("fuel"), [[[1, 9], [3, 4], [0, 0]]]
+            )
+            self.assertEqual(raster_layer[1, 2].fuel, 9)
+            if array_backed:
+                # a view of the stored attribute array
+                view = fuel[:, :]
+                raster_layer.cells[0][0].fuel = 7
+                self.assertEqual(view[0, 0], 7)
+
+        with self.assertRaises(ValueError):
+            raster_layer.values("missing")
+
+    def test_cost_distance(self):
+        raster_layer = mg.RasterLayer(
+            width=4,
+            height=3,
+            crs="epsg:3857",
+            total_bounds=[0, 0, 4, 3],
+            model=self.model,
+            array_backed=True,
+        )
+        cost = np.ones((1, 3, 4))
+        # a wall at x = 2 with a gap at y = 0, and a free cell at (0, 0)
+        cost[0, :2, 2] = -1
+        cost[0, 2, 0] = 0
+        raster_layer.apply_raster(cost, attr_name="cost", nodata=-1)
+        sources = [(3, 2)]
+
+        distances = raster_layer.get_distance_transform(sources)
+        self.assertEqual(distances.shape, (1, 3, 4))
+        self.assertAlmostEqual(distances[0, 2, 0], np.hypot(3, 2))
+        self.assertIs(raster_layer.get_distance_transform(sources).base, distances.base)
+
+        costs = raster_layer.get_cost_distance("cost", sources, moore=False)
+        self.assertEqual(costs[0, 0, 3], 0)
+        self.assertEqual(costs[0, 0, 2], np.inf)
+        # around the wall through the gap, leaving the free cell costs half a step
+        self.assertEqual(costs[0, 2, 0], 4.5)
+        self.assertIs(
+            raster_layer.get_cost_distance("cost", sources, moore=False).base,
+            costs.base,
+        )
+
+        path = raster_layer.get_cost_path((0, 2), "cost", sources, moore=False)
+        self.assertEqual(path[0], (0, 2))
+        self.assertEqual(path[-1], (3, 2))
+        self.assertIn((2, 0), path)
+        self.assertEqual(len(path), 8)
+        self.assertEqual(
+            raster_layer.get_cost_path((2, 1), "cost", sources, moore=False), [(2, 1)]
+        )
+
+        positions = raster_layer.trace_cost_paths(
+            [(0, 2), (3, 2), (2, 2)], "cost", sources, moore=False, steps=20
+        )
+        np.testing.assert_array_equal(positions, [[3, 2], [3, 2], [2, 2]])
+        positions = raster_layer.trace_cost_paths([(0, 2)], "cost", sources, False)
+        np.testing.assert_array_equal(positions, [path[1]])
+
+        # diagonal moves cost the diagonal distance
+        costs = raster_layer.get_cost_distance("cost", sources)
+        self.assertAlmostEqual(costs[0, 1, 3], 1)
+        self.assertAlmostEqual(costs[0, 2, 2], 1 + np.sqrt(2))
+
+        raster_layer.values("cost")[3, 1] = 3
+        self.assertAlmostEqual(
+            raster_layer.get_cost_distance("cost", sources)[0, 1, 3], (3 + 1) / 2
+        )
+        with self.assertRaises(ValueError):
+            raster_layer.get_cost_distance("cost", np.zeros((1, 3, 4), dtype=bool))
+        raster_layer.values("cost")[0, 0] = -5
+        with self.assertRaises(ValueError):
+            raster_layer.get_cost_distance("cost", sources)